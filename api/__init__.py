@@ -5,14 +5,34 @@ NOTE: With Flask RestX, it automatically configures our swagger UI, unlike Flask
 from flask import Flask
 from flask_restx import Api
 from .auth.views import auth_namespace
+from .auth.identity import init_identity
+from .auth.tokens import init_tokens
+from .auth.passwords import init_passwords
 from .orders.views import orders_namespace
+from .orders.rollup import init_rollup
+from .orders.archive import init_archive
+from .menu.views import menu_namespace
+from .menu.catalog import init_catalog
+from .monitoring.views import monitoring_namespace
 from .config.config import config_dict
 from .utils import db
+from .utils.metrics import init_metrics
+from .utils.sql_log import init_sql_log
+from .utils.compression import init_compression
+from .utils.ratelimit import init_rate_limiter
+from .utils.routing import init_replica_routing
+from .utils.events import init_events
+from .utils.idempotency import init_idempotency
 from .models.users import User
-from .models.orders import Order
+from .models.orders import Order, OrderArchive
+from .models.stats import OrderDailyStats, RollupState
+from .models.idempotency import IdempotencyKey
+from .models.menu import Flavour, SizePrice
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
+from flask_jwt_extended.exceptions import RevokedTokenError
 from werkzeug.exceptions import NotFound, MethodNotAllowed, Unauthorized
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 
 def create_app(config=config_dict["dev"]):
@@ -20,10 +40,43 @@ def create_app(config=config_dict["dev"]):
 
     app.config.from_object(config)
 
+    # take the client address and scheme from the X-Forwarded-* headers of trusted proxies
+    # only, so per-IP limits see clients rather than the router
+    if app.config["PROXY_FIX_HOPS"]:
+        hops = app.config["PROXY_FIX_HOPS"]
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
     db.init_app(app)
 
     jwt = JWTManager(app)
 
+    init_identity(app)
+
+    init_tokens(app, jwt)
+
+    init_passwords(app)
+
+    init_rate_limiter(app)
+
+    init_replica_routing(app)
+
+    init_events(app)
+
+    init_rollup(app)
+
+    init_archive(app)
+
+    init_catalog(app)
+
+    init_idempotency(app)
+
+    init_metrics(app)
+
+    init_sql_log(app)
+
+    # registered after init_metrics, so the size metric sees the compressed body
+    init_compression(app)
+
     migrate = Migrate(app, db)
 
     authorizations = {
@@ -47,6 +100,8 @@ def create_app(config=config_dict["dev"]):
     # adding namespaces to API
     api.add_namespace(auth_namespace, path="/auth")
     api.add_namespace(orders_namespace, path="/orders")
+    api.add_namespace(menu_namespace, path="/menu")
+    api.add_namespace(monitoring_namespace, path="/monitoring")
 
     # error handlers
     @api.errorhandler(NotFound)
@@ -61,6 +116,10 @@ def create_app(config=config_dict["dev"]):
     def unauthorized(error):
         return {"error": "Not Unauthorized"}, 401
 
+    @api.errorhandler(RevokedTokenError)
+    def revoked_token(error):
+        return {"error": "Token has been revoked"}, 401
+
     # adding shell context processor
     @app.shell_context_processor
     def make_shell_context():
@@ -68,6 +127,10 @@ def create_app(config=config_dict["dev"]):
             "db": db,
             "User": User,
             "Order": Order,
+            "OrderArchive": OrderArchive,
+            "Flavour": Flavour,
+            "SizePrice": SizePrice,
+            "OrderDailyStats": OrderDailyStats,
         }
 
     """
@@ -76,9 +139,13 @@ def create_app(config=config_dict["dev"]):
     $ db -to check the db uri path
     $ User -to check the user model class
     $ Order -to check the order model class
+    $ OrderArchive -to check the archived orders (moved with: $ flask archive-orders)
+    $ Flavour -to check the menu flavours (and their SizePrice prices)
+    $ OrderDailyStats -to check the daily order stats rollup (refreshed with: $ flask rollup)
     $ db.create_all() -to create the db.sqlite3 file in the uri path.   
     
-    ...and because we set SQLALCHEMY_ECHO = True it displays all the logic that was used to create the db.
+    ...set SQLALCHEMY_ECHO=True (dev only) to display all the SQL that was used to create the db,
+    otherwise slow and sampled statements go to the "api.sql" logger (see SQL_LOG_* in config).
     """
 
     return app
@@ -1,3 +1,3 @@
-from flask_restx import Namespace
+from ..utils.serializers import Namespace  # flask-restx Namespace with the compiled marshal_with
 
 auth_namespace = Namespace(name="Auth", description="Namespace for Authentication")
@@ -0,0 +1,85 @@
+from collections import namedtuple
+from flask import current_app, g, has_app_context
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from sqlalchemy import event, inspect
+from ..models.users import User
+from ..utils import db
+from ..utils.cache import TTLCache
+
+# a detached snapshot of the columns handlers need to authorize a request
+CurrentUser = namedtuple("CurrentUser", ["id", "username", "is_staff"])
+
+_NOT_CACHED = object()
+
+
+def init_identity(app):
+    """
+    Set up the process-level identity cache for an app.
+    """
+    app.extensions["user_cache"] = TTLCache(
+        maxsize=app.config["USER_CACHE_SIZE"], ttl=app.config["USER_CACHE_TTL"]
+    )
+
+
+def current_identity():
+    """
+    Resolve the JWT identity (a username) of the current request to a CurrentUser.
+
+    Tokens issued with claims (see api/auth/tokens.py) are resolved from them,
+    as the revocation check already rejected stale ones. For other tokens it
+    looks in the request (flask.g) first, then in the process-level TTL/LRU
+    cache, and only queries the database on a miss. Unknown usernames are
+    cached too (as None) so that bad tokens cannot force a query per request.
+    :return: CurrentUser, or None if the user does not exist
+    """
+    username = get_jwt_identity()
+
+    cached = g.get("_current_identity", _NOT_CACHED)
+    if cached is not _NOT_CACHED and (cached is None or cached.username == username):
+        return cached
+
+    claims = get_jwt()
+    if "uid" in claims:
+        g._current_identity = CurrentUser(claims["uid"], username, claims["staff"])
+        return g._current_identity
+
+    cache = current_app.extensions["user_cache"]
+    user = cache.get(username, _NOT_CACHED)
+
+    if user is _NOT_CACHED:
+        row = (
+            db.session.query(User.id, User.username, User.is_staff)
+            .filter_by(username=username)
+            .first()
+        )
+        user = CurrentUser(*row) if row is not None else None
+        cache.set(username, user)
+
+    g._current_identity = user
+    return user
+
+
+def invalidate_identity(*usernames):
+    """
+    Drop cached identities, e.g. after a user has been changed.
+    """
+    if not has_app_context():
+        return
+
+    cache = current_app.extensions.get("user_cache")
+    if cache is None:
+        return
+
+    for username in usernames:
+        cache.pop(username)
+    g.pop("_current_identity", None)
+
+
+# invalidate the cache whenever a user row is written.
+# other workers only see the change once their own entry expires (USER_CACHE_TTL).
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    history = inspect(target).attrs.username.history
+    invalidate_identity(target.username, *(history.deleted or ()))
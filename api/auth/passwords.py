@@ -0,0 +1,102 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+
+class PasswordHasher:
+    """
+    Hash and check passwords with configurable cost, optionally off the request thread.
+
+    A hash is hundreds of milliseconds of CPU. hashlib releases the GIL while
+    it runs PBKDF2, so the cost is not the GIL but the thread (or greenlet)
+    that computes it: with workers > 0 the work runs in a pool and the request
+    only waits on the result. The pool is either `workers` processes, or, with
+    pool="gevent", the gevent hub's native thread pool, so a login burst does
+    not stall the other greenlets of the worker. At most max_pending hashes are
+    queued per worker process, later callers block until a slot frees up.
+    """
+
+    def __init__(self, method, salt_length, workers=0, max_pending=None, pool="process"):
+        self.method = normalize_method(method)
+        self.salt_length = salt_length
+        self.workers = workers
+        self.pool = pool
+        self._slots = threading.BoundedSemaphore(max_pending or max(workers * 2, 1))
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """
+        True when a stored hash was made with another method, cost or salt length.
+        """
+        method, _, rest = pwhash.partition("$")
+        salt = rest.partition("$")[0]
+        return normalize_method(method) != self.method or len(salt) != self.salt_length
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+
+        with self._slots:
+            if self.pool == "gevent":
+                import gevent
+
+                # the greenlet yields to the hub until a native thread has the result
+                return gevent.get_hub().threadpool.apply(func, args)
+            return self._get_pool().submit(func, *args).result()
+
+    def _get_pool(self):
+        # created lazily and per process, so gunicorn workers do not share a forked pool
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown()
+            self._pool = None
+
+
+# spell out pbkdf2 defaults, e.g. "pbkdf2:sha256" -> "pbkdf2:sha256:260000", as werkzeug stores them
+def normalize_method(method):
+    if not method.startswith("pbkdf2"):
+        return method
+
+    parts = method.split(":")
+    hash_name = parts[1] if len(parts) > 1 and parts[1] else "sha256"
+    iterations = int(parts[2]) if len(parts) > 2 and parts[2] else DEFAULT_PBKDF2_ITERATIONS
+    return f"pbkdf2:{hash_name}:{iterations}"
+
+
+def init_passwords(app):
+    app.extensions["password_hasher"] = PasswordHasher(
+        method=app.config["PASSWORD_HASH_METHOD"],
+        salt_length=app.config["PASSWORD_SALT_LENGTH"],
+        workers=app.config["PASSWORD_HASH_WORKERS"],
+        max_pending=app.config["PASSWORD_HASH_MAX_PENDING"],
+        pool=app.config["PASSWORD_HASH_POOL"],
+    )
+
+
+def hash_password(password):
+    return current_app.extensions["password_hasher"].hash(password)
+
+
+def verify_password(pwhash, password):
+    return current_app.extensions["password_hasher"].verify(pwhash, password)
+
+
+def password_needs_rehash(pwhash):
+    return current_app.extensions["password_hasher"].needs_rehash(pwhash)
@@ -0,0 +1,184 @@
+"""
+JWT claims and revocation.
+
+Tokens carry the user id, is_staff and the user's token version as claims,
+so handlers can authorize without loading the user (see current_identity).
+A token is revoked when its version is older than the user's token_version,
+which is bumped to log a user out everywhere and when a user is deactivated
+or their staff flag changes, or when its own jti is on the denylist (a single
+logout). Versions are cached per process (TOKEN_VERSION_CACHE_*), so checking
+them is a cache lookup.
+
+The denylist has a store of its own (TOKEN_DENYLIST_BACKEND) that keeps every
+jti until its token expires and never evicts one early, so its size is bound
+by the logouts within a token lifetime rather than by other traffic. The
+memory store only reaches the worker that served the logout, so the app
+refuses to start with it and more than one gunicorn worker.
+"""
+
+import heapq
+import threading
+import time
+from flask import current_app, has_app_context
+from flask_jwt_extended import create_access_token, create_refresh_token
+from sqlalchemy import event, inspect
+from ..models.users import User
+from ..utils import db
+from ..utils.cache import TTLCache
+
+# claims issued with every token, next to the identity (the username)
+CLAIMS = ("uid", "staff", "ver")
+
+_NOT_CACHED = object()
+
+
+def init_tokens(app, jwt):
+    """
+    Set up the token version cache and the revocation check of a JWTManager.
+    """
+    app.extensions["token_versions"] = TTLCache(
+        maxsize=app.config["TOKEN_VERSION_CACHE_SIZE"], ttl=app.config["TOKEN_VERSION_CACHE_TTL"]
+    )
+    if app.config["TOKEN_DENYLIST_BACKEND"] == "redis":
+        app.extensions["token_denylist"] = RedisDenylist.from_url(app.config["TOKEN_DENYLIST_REDIS_URL"])
+    elif app.config.get("GUNICORN_WORKERS", 1) > 1:
+        raise RuntimeError(
+            "TOKEN_DENYLIST_BACKEND=memory is per worker, a logout would not reach the other "
+            f"{app.config['GUNICORN_WORKERS'] - 1} worker(s): use TOKEN_DENYLIST_BACKEND=redis or WEB_CONCURRENCY=1"
+        )
+    else:
+        app.extensions["token_denylist"] = MemoryDenylist()
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return is_token_revoked(jwt_payload)
+
+
+def token_claims(user):
+    return {
+        "uid": user.id,
+        "staff": bool(user.is_staff),
+        "ver": user.token_version or 0,
+    }
+
+
+def create_tokens(user):
+    """
+    :return: (access token, refresh token) of a user
+    """
+    claims = token_claims(user)
+    # the version is known here, so the first requests with the tokens need no query
+    current_app.extensions["token_versions"].set(user.id, claims["ver"])
+    return (
+        create_access_token(identity=user.username, additional_claims=claims),
+        create_refresh_token(identity=user.username, additional_claims=claims),
+    )
+
+
+def token_version(user_id):
+    """
+    Current token_version of a user, cached.
+    :return: the version, or None if the user does not exist
+    """
+    cache = current_app.extensions["token_versions"]
+    version = cache.get(user_id, _NOT_CACHED)
+
+    if version is _NOT_CACHED:
+        version = db.session.query(User.token_version).filter_by(id=user_id).scalar()
+        cache.set(user_id, version)
+
+    return version
+
+
+class MemoryDenylist:
+    """
+    Revoked jtis of this process, each kept until its token expires.
+    """
+
+    def __init__(self):
+        self._expires_at = {}
+        # (expires_at, jti), soonest first, so expired entries are dropped without a scan
+        self._expiry_order = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._expires_at)
+
+    def add(self, jti, expires_at):
+        now = time.time()
+        with self._lock:
+            # drop the entries whose tokens have expired anyway
+            while self._expiry_order and self._expiry_order[0][0] <= now:
+                expiry, expired = heapq.heappop(self._expiry_order)
+                # unless the jti was added again since, with a later expiry
+                if self._expires_at.get(expired) == expiry:
+                    del self._expires_at[expired]
+            self._expires_at[jti] = expires_at
+            heapq.heappush(self._expiry_order, (expires_at, jti))
+
+    def __contains__(self, jti):
+        expires_at = self._expires_at.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+
+class RedisDenylist:
+    """
+    Revoked jtis in Redis, shared by a cluster, each expiring with its token.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url):
+        try:
+            import redis
+        except ImportError as error:
+            raise RuntimeError("TOKEN_DENYLIST_BACKEND=redis needs the redis package") from error
+        return cls(redis.Redis.from_url(url))
+
+    def add(self, jti, expires_at):
+        self.client.set(f"revoked-token:{jti}", 1, ex=max(int(expires_at - time.time()) + 1, 1))
+
+    def __contains__(self, jti):
+        return bool(self.client.exists(f"revoked-token:{jti}"))
+
+
+def revoke_token(jwt_payload):
+    """
+    Put a single token on the denylist until it expires.
+    """
+    current_app.extensions["token_denylist"].add(jwt_payload["jti"], jwt_payload.get("exp", time.time()))
+
+
+def is_token_revoked(jwt_payload):
+    if jwt_payload["jti"] in current_app.extensions["token_denylist"]:
+        return True
+
+    # tokens issued without claims are only checked against the denylist
+    if "ver" not in jwt_payload:
+        return False
+
+    return token_version(jwt_payload["uid"]) != jwt_payload["ver"]
+
+
+# revoke the tokens of users being deactivated or changing staff status, whose claims are stale
+@event.listens_for(User, "before_update")
+def _revoke_stale_claims(mapper, connection, target):
+    state = inspect(target)
+    was_active = state.attrs.is_active.history.deleted
+    if (was_active and was_active[0] and not target.is_active) or state.attrs.is_staff.history.has_changes():
+        target.revoke_tokens()
+
+
+# keep this process's version cache in step, other workers see new versions once
+# their entry expires (TOKEN_VERSION_CACHE_TTL)
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_token_version(mapper, connection, target):
+    if not has_app_context():
+        return
+
+    cache = current_app.extensions.get("token_versions")
+    if cache is not None:
+        cache.pop(target.id)
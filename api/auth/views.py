@@ -1,11 +1,26 @@
 from flask import request
 from flask_restx import Resource
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt, get_jwt_identity
 from http import HTTPStatus
 from ..models.users import User
 from ..auth import auth_namespace
 from ..auth.schemas import signup_model, login_model, user_model
+from ..orders.schemas import user_orders_model
+from ..auth.passwords import hash_password, verify_password, password_needs_rehash
+from ..auth.tokens import CLAIMS, create_tokens, revoke_token
+from ..utils import db
+from ..utils.ratelimit import rate_limit
+from ..utils.serializers import masked_load_only
+from sqlalchemy.orm import selectinload
+
+
+# rate limit keys of a login attempt: the client IP and the email tried
+def login_rate_keys():
+    data = request.get_json(silent=True) or {}
+    keys = [f"ip:{request.remote_addr}"]
+    if isinstance(data.get("email"), str):
+        keys.append(f"email:{data['email'].strip().lower()}")
+    return keys
 
 
 @auth_namespace.route("/signup")
@@ -25,7 +40,8 @@ class SignUp(Resource):
         # gets each data and store in variables.
         username = data.get("username")
         email = data.get("email")
-        password_hash = generate_password_hash(data.get("password"))
+        # hashed with the configured cost, in the hashing process pool if enabled
+        password_hash = hash_password(data.get("password"))
 
         # instantiate User model as new_user
         new_user = User(
@@ -47,6 +63,8 @@ class SignUp(Resource):
 @auth_namespace.route("/login")
 class Login(Resource):
 
+    # runs first, so throttled attempts never reach the DB or the password hash
+    @rate_limit("login", login_rate_keys)
     @auth_namespace.expect(login_model)
     @auth_namespace.doc(description="Login to Generate JWT token")
     def post(self):
@@ -62,9 +80,14 @@ class Login(Resource):
 
         user = User.query.filter_by(email=email).first()
 
-        if (user is not None) and (check_password_hash(pwhash=user.password_hash, password=password)):
-            access_token = create_access_token(identity=user.username)
-            refresh_token = create_refresh_token(identity=user.username)
+        if (user is not None) and verify_password(user.password_hash, password):
+            # transparently upgrade hashes made with an older method or cost
+            if password_needs_rehash(user.password_hash):
+                user.password_hash = hash_password(password)
+                user.save()
+
+            # with the user id, staff flag and token version as claims
+            access_token, refresh_token = create_tokens(user)
 
             response = {
                 "message": "Login successful!",
@@ -86,7 +109,11 @@ class Refresh(Resource):
         """
         username = get_jwt_identity()
 
-        access_token = create_access_token(identity=username)
+        # the refresh token's claims are current, else the revocation check rejected it
+        claims = get_jwt()
+        access_token = create_access_token(
+            identity=username, additional_claims={claim: claims[claim] for claim in CLAIMS if claim in claims}
+        )
 
         response = {
                 "message": "Refresh successful!",
@@ -96,17 +123,63 @@ class Refresh(Resource):
         return response, HTTPStatus.OK
 
 
+@auth_namespace.route("/logout")
+class Logout(Resource):
+
+    @auth_namespace.doc(
+        description="Revoke the JWT token sent (access or refresh), "
+        "or all tokens of the user with everywhere=true",
+        params={"everywhere": "Also revoke all other tokens of the user"},
+    )
+    @jwt_required(verify_type=False)
+    def post(self):
+        """
+        Revoke JWT Token
+        """
+        claims = get_jwt()
+        revoke_token(claims)
+
+        if request.args.get("everywhere", "").lower() in ("true", "1"):
+            user = User.query.filter_by(username=get_jwt_identity()).first()
+            if user is not None:
+                user.revoke_tokens()
+                db.session.commit()
+
+        response = {"message": "Logout successful!"}
+
+        return response, HTTPStatus.OK
+
+
 @auth_namespace.route("/users")
 class GetUsers(Resource):
 
     @auth_namespace.marshal_with(user_model)
-    @auth_namespace.doc(description="Get all Users")
+    @auth_namespace.doc(
+        description="Get all Users",
+        params={"fields": "Only return (and load) these fields, e.g. id,username (same as the X-Fields header)"},
+    )
     @jwt_required()
     def get(self):
         """
         Get all Users
         """
-        users = User.query.all()
+        users = User.query.options(*masked_load_only(User, User.id)).all()
+
+        return users, HTTPStatus.OK
+
+
+@auth_namespace.route("/users/orders")
+class GetUsersWithOrders(Resource):
+
+    @auth_namespace.marshal_with(user_orders_model)
+    @auth_namespace.doc(description="Get all Users with their Orders")
+    @jwt_required()
+    def get(self):
+        """
+        Get all Users with their Orders
+        """
+        # two queries in all: the users, then the orders of all of them (WHERE customer_id IN ...)
+        users = User.query.options(selectinload(User.orders)).all()
 
         return users, HTTPStatus.OK
 
@@ -13,21 +13,144 @@ class Config:
     SECRET_KEY = config("SECRET_KEY", "secret")
 
     SQLALCHEMY_TRACK_MODIFICATION = False
-    SQLALCHEMY_ECHO = True
+    SQLALCHEMY_ECHO = False
+
+    # read replica for GET/HEAD requests, the primary (SQLALCHEMY_DATABASE_URI) takes everything else
+    REPLICA_DATABASE_URL = config("REPLICA_DATABASE_URL", "").replace("postgres://", "postgresql://", 1)
+    SQLALCHEMY_BINDS = {"replica": REPLICA_DATABASE_URL} if REPLICA_DATABASE_URL else {}
+    # seconds a client's reads stay on the primary after it wrote, so it reads its own writes
+    REPLICA_STICKY_SECONDS = config("REPLICA_STICKY_SECONDS", 5, cast=int)
+    # where those marks are kept: memory (per worker, at most REPLICA_STICKY_MAX_CLIENTS recent
+    # writers) or redis (shared by every worker and node)
+    REPLICA_STICKY_BACKEND = config("REPLICA_STICKY_BACKEND", "memory")
+    REPLICA_STICKY_REDIS_URL = config("REPLICA_STICKY_REDIS_URL", "redis://localhost:6379/0")
+    REPLICA_STICKY_MAX_CLIENTS = config("REPLICA_STICKY_MAX_CLIENTS", 100000, cast=int)
+
+    # structured SQL log: slow statements are always logged (with parameters),
+    # the others only for a sample of executions
+    SQL_LOG_ENABLED = config("SQL_LOG_ENABLED", True, cast=bool)
+    SQL_LOG_SAMPLE_RATE = config("SQL_LOG_SAMPLE_RATE", 0.0, cast=float)
+    SQL_LOG_SLOW_MS = config("SQL_LOG_SLOW_MS", 200, cast=float)
+    SQL_LOG_FORMAT = config("SQL_LOG_FORMAT", "json")  # json or text
 
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=30)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(minutes=10)
     JWT_SECRET_KEY = config("JWT_SECRET_KEY")
 
+    # marshal responses with the compiled per-model serializer (same output as flask-restx)
+    FAST_SERIALIZER = config("FAST_SERIALIZER", True, cast=bool)
+
+    # gzip (or brotli, when installed) for responses the client accepts it for
+    COMPRESS_ENABLED = config("COMPRESS_ENABLED", True, cast=bool)
+    COMPRESS_MIN_SIZE = config("COMPRESS_MIN_SIZE", 1024, cast=int)  # bytes
+    COMPRESS_MIMETYPES = ["application/json", "text/csv", "text/plain"]
+    COMPRESS_GZIP_LEVEL = config("COMPRESS_GZIP_LEVEL", 6, cast=int)
+    COMPRESS_BR_QUALITY = config("COMPRESS_BR_QUALITY", 4, cast=int)
+
+    # per-route latency, response size and SQL statement histograms on /metrics
+    METRICS_ENABLED = config("METRICS_ENABLED", True, cast=bool)
+
+    # process-level cache of JWT identity -> user (entries, seconds)
+    USER_CACHE_SIZE = config("USER_CACHE_SIZE", 4096, cast=int)
+    USER_CACHE_TTL = config("USER_CACHE_TTL", 60, cast=int)
+
+    # process-level cache of user id -> token_version, checked against the "ver" claim of
+    # each token (entries, seconds); a revocation reaches the other workers within the TTL
+    TOKEN_VERSION_CACHE_SIZE = config("TOKEN_VERSION_CACHE_SIZE", 4096, cast=int)
+    TOKEN_VERSION_CACHE_TTL = config("TOKEN_VERSION_CACHE_TTL", 30, cast=int)
+    # revoked tokens (single logouts), kept until they expire: memory (per worker, refused with
+    # more than one gunicorn worker) or redis (shared), the default of the production presets
+    TOKEN_DENYLIST_BACKEND = config("TOKEN_DENYLIST_BACKEND", "memory")
+    TOKEN_DENYLIST_REDIS_URL = config("TOKEN_DENYLIST_REDIS_URL", "redis://localhost:6379/0")
+
+    # password hashing cost, stored hashes made with other settings are upgraded on login
+    PASSWORD_HASH_METHOD = config("PASSWORD_HASH_METHOD", "pbkdf2:sha256:260000")
+    PASSWORD_SALT_LENGTH = config("PASSWORD_SALT_LENGTH", 16, cast=int)
+    # hashing processes per app worker (0 hashes on the request thread) and queued hashes per worker
+    PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", 0, cast=int)
+    PASSWORD_HASH_MAX_PENDING = config("PASSWORD_HASH_MAX_PENDING", 0, cast=int)
+    # process, or gevent (the hub's native thread pool, for gevent workers)
+    PASSWORD_HASH_POOL = config("PASSWORD_HASH_POOL", "process")
+
+    # sliding-window rate limits: attempts per window (seconds) and key
+    RATELIMIT_ENABLED = config("RATELIMIT_ENABLED", True, cast=bool)
+    RATELIMIT_BACKEND = config("RATELIMIT_BACKEND", "memory")  # memory or redis
+    RATELIMIT_REDIS_URL = config("RATELIMIT_REDIS_URL", "redis://localhost:6379/0")
+    # proxies in front of the app whose X-Forwarded-For/-Proto are trusted (0 uses the socket address)
+    PROXY_FIX_HOPS = config("PROXY_FIX_HOPS", 0, cast=int)
+    LOGIN_RATE_LIMIT = config("LOGIN_RATE_LIMIT", 10, cast=int)
+    LOGIN_RATE_WINDOW = config("LOGIN_RATE_WINDOW", 60, cast=int)
+    ORDERS_RATE_LIMIT = config("ORDERS_RATE_LIMIT", 120, cast=int)
+    ORDERS_RATE_WINDOW = config("ORDERS_RATE_WINDOW", 60, cast=int)
+
+    # server-sent order events: broker (memory or redis), idle seconds between heartbeats
+    # and messages buffered per connection before the oldest are dropped.
+    # EVENTS_ENABLED is off on the sync and gthread presets, where each open stream holds a
+    # whole worker or thread and is killed by the gunicorn timeout; the routes answer 503 then.
+    # Only the gevent preset, with a greenlet per stream, turns them on
+    EVENTS_ENABLED = config("EVENTS_ENABLED", True, cast=bool)
+    EVENTS_BROKER = config("EVENTS_BROKER", "memory")
+    EVENTS_REDIS_URL = config("EVENTS_REDIS_URL", "redis://localhost:6379/0")
+    EVENTS_HEARTBEAT_SECONDS = config("EVENTS_HEARTBEAT_SECONDS", 15, cast=float)
+    EVENTS_BUFFER_SIZE = config("EVENTS_BUFFER_SIZE", 100, cast=int)
+
+    # Idempotency-Key replays: how long keys are kept (seconds, `flask purge-idempotency-keys`
+    # deletes older ones) and the per-worker cache of stored responses in front of the table.
+    # IDEMPOTENCY_LOCK_SECONDS is the lease of an in-progress claim: a retry after it takes the key
+    # over from a request that died without releasing it. Keep it above the gunicorn timeout
+    IDEMPOTENCY_TTL = config("IDEMPOTENCY_TTL", 24 * 60 * 60, cast=int)
+    IDEMPOTENCY_LOCK_SECONDS = config("IDEMPOTENCY_LOCK_SECONDS", 60, cast=int)
+    IDEMPOTENCY_CACHE_SIZE = config("IDEMPOTENCY_CACHE_SIZE", 10000, cast=int)
+    IDEMPOTENCY_CACHE_TTL = config("IDEMPOTENCY_CACHE_TTL", 300, cast=int)
+
+    # seconds a worker serves the cached menu before checking the menu version for changes
+    MENU_CACHE_TTL = config("MENU_CACHE_TTL", 5, cast=float)
+
+    # refresh the order_daily_stats rollup after each order write (else run `flask rollup` periodically)
+    ROLLUP_ON_WRITE = config("ROLLUP_ON_WRITE", False, cast=bool)
+    # seconds behind its mark a refresh scans again, for orders committed late or stamped by
+    # a lagging clock (longer than the longest order transaction plus the clock skew)
+    ROLLUP_SAFETY_SECONDS = config("ROLLUP_SAFETY_SECONDS", 300, cast=int)
+
+    # `flask archive-orders`: delivered orders created more than ARCHIVE_AFTER_DAYS ago move
+    # to orders_archive, ARCHIVE_BATCH_SIZE per transaction
+    ARCHIVE_AFTER_DAYS = config("ARCHIVE_AFTER_DAYS", 30, cast=int)
+    ARCHIVE_BATCH_SIZE = config("ARCHIVE_BATCH_SIZE", 1000, cast=int)
+
+    ORDERS_PAGE_SIZE = config("ORDERS_PAGE_SIZE", 50, cast=int)
+    ORDERS_PAGE_SIZE_MAX = config("ORDERS_PAGE_SIZE_MAX", 200, cast=int)
+    ORDERS_BULK_MAX = config("ORDERS_BULK_MAX", 500, cast=int)
+    ORDERS_EXPORT_BATCH_SIZE = config("ORDERS_EXPORT_BATCH_SIZE", 1000, cast=int)
+
 
 class DevelopmentConfig(Config):
     SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(base_dir, "db.sqlite3")
-    DEBUG = True  
+    DEBUG = True
+    SQLALCHEMY_ECHO = config("SQLALCHEMY_ECHO", False, cast=bool)
+    SQL_LOG_SLOW_MS = config("SQL_LOG_SLOW_MS", 50, cast=float)
 
 
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = "sqlite://"  # to use sqlite in-memory database for testing, use // (instead of /// which create a path and a file in the project directory).
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:1000"  # cheap hashes keep the tests fast
+
+
+def engine_options(pool_size, max_overflow):
+    """
+    Connection pool settings of each worker, from env with per-preset defaults.
+
+    Size it so that workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays below the database's max_connections.
+    """
+    return {
+        "pool_size": config("DB_POOL_SIZE", pool_size, cast=int),
+        "max_overflow": config("DB_MAX_OVERFLOW", max_overflow, cast=int),
+        "pool_timeout": config("DB_POOL_TIMEOUT", 30, cast=int),
+        # seconds before a connection is replaced, keep below server/proxy idle timeouts
+        "pool_recycle": config("DB_POOL_RECYCLE", 1800, cast=int),
+        # test connections on checkout so a failover does not surface as errors
+        "pool_pre_ping": config("DB_POOL_PRE_PING", True, cast=bool),
+    }
 
 
 class ProductionConfig(Config):
@@ -38,15 +161,61 @@ class ProductionConfig(Config):
 
     SQLALCHEMY_DATABASE_URI = uri
     DEBUG = config("DEBUG", False, cast=bool)
-    SQLALCHEMY_ECHO = False
-    
-    
-
-config_dict = dict(
-    dev=DevelopmentConfig,
-    test=TestingConfig,
-    prod=ProductionConfig
-)
+    # every worker must see every logout
+    TOKEN_DENYLIST_BACKEND = config("TOKEN_DENYLIST_BACKEND", "redis")
+    # behind the Heroku router (see Procfile), which appends the client to X-Forwarded-For
+    PROXY_FIX_HOPS = config("PROXY_FIX_HOPS", 1, cast=int)
+    # a sync worker serves one request at a time, so hashing in a pool would gain nothing
+    # and add processes to every worker: hash inline
+    PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", 0, cast=int)
+
+    # gunicorn sync workers (read by gunicorn.conf.py): one request at a time per process,
+    # so concurrency is capped at the worker count and a small pool is plenty
+    GUNICORN_WORKER_CLASS = "sync"
+    GUNICORN_WORKERS = config("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1, cast=int)
+    GUNICORN_THREADS = 1
+    GUNICORN_WORKER_CONNECTIONS = 1
+    EVENTS_ENABLED = config("EVENTS_ENABLED", False, cast=bool)
+
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(pool_size=5, max_overflow=10)
+
+
+class ThreadedProductionConfig(ProductionConfig):
+    # gunicorn gthread workers: GUNICORN_THREADS requests per process, one pooled connection per thread
+    GUNICORN_WORKER_CLASS = "gthread"
+    GUNICORN_WORKERS = config("WEB_CONCURRENCY", (os.cpu_count() or 1) + 1, cast=int)
+    GUNICORN_THREADS = config("GUNICORN_THREADS", 8, cast=int)
+    # a couple of hashing processes per worker keep logins from tying up its request threads
+    PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", 2, cast=int)
+
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(pool_size=GUNICORN_THREADS, max_overflow=2)
+
+
+class GeventProductionConfig(ProductionConfig):
+    # gunicorn gevent workers: up to GUNICORN_WORKER_CONNECTIONS requests per process on greenlets,
+    # with psycopg2 made cooperative by psycogreen (see gunicorn.conf.py).
+    # Requests wait for a pooled connection (DB_POOL_TIMEOUT) instead of each opening one.
+    # Not measured faster than prod for the order routes (benchmarks/serving-postgres.json),
+    # it is the preset for the event streams (EVENTS_ENABLED)
+    GUNICORN_WORKER_CLASS = "gevent"
+    GUNICORN_WORKERS = config("WEB_CONCURRENCY", os.cpu_count() or 1, cast=int)
+    GUNICORN_WORKER_CONNECTIONS = config("GUNICORN_WORKER_CONNECTIONS", 1000, cast=int)
+    EVENTS_ENABLED = config("EVENTS_ENABLED", True, cast=bool)
+    # hashes run on the hub's native threads (hashlib releases the GIL), so a login burst does
+    # not stall the other greenlets. No process pool: forking under monkey patching is not reliable
+    PASSWORD_HASH_POOL = config("PASSWORD_HASH_POOL", "gevent")
+    PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", 2, cast=int)
+
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(pool_size=20, max_overflow=10)
+
+
+config_dict = {
+    "dev": DevelopmentConfig,
+    "test": TestingConfig,
+    "prod": ProductionConfig,
+    "prod-gthread": ThreadedProductionConfig,
+    "prod-gevent": GeventProductionConfig,
+}
 
 # # OR
 # config_name = {
@@ -0,0 +1,3 @@
+from ..utils.serializers import Namespace  # flask-restx Namespace with the compiled marshal_with
+
+menu_namespace = Namespace("Menu", description="Namespace for the Menu")
@@ -0,0 +1,156 @@
+"""
+The menu catalog, cached in memory by every worker.
+
+Order writes validate flavours and price orders against it, so they read no
+menu tables. Every menu change bumps the menu_version row in the same
+transaction, and a worker compares its cached version with that row at most
+every MENU_CACHE_TTL seconds, reloading the whole (small) menu when it
+differs. The worker making a change reloads at once.
+"""
+
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy.orm import selectinload
+from ..models.menu import Flavour, MenuVersion
+from ..models.orders import OrderSizes
+from ..utils import db
+
+MENU_VERSION_ID = 1
+
+# prices: {OrderSizes: Decimal}
+MenuItem = namedtuple("MenuItem", ["id", "name", "is_available", "prices"])
+
+CENTS = Decimal("0.01")
+
+
+def check_quantity(quantity):
+    """
+    :raises ValueError: unless quantity is a whole number of at least 1 (True and "2" are not)
+    """
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+        raise ValueError(f"'{quantity}' is not a valid quantity, expected a whole number of at least 1")
+
+
+class Catalog:
+    """
+    A snapshot of the menu at one version, flavours keyed by lower case name.
+    """
+
+    def __init__(self, version, items):
+        self.version = version
+        self.items = {item.name.lower(): item for item in items}
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def price_order(self, flavour, size, quantity):
+        """
+        Validate an order against the menu and price it.
+        :return: (flavour name as on the menu, unit price, total price)
+        :raises ValueError: with the message for the client
+        """
+        check_quantity(quantity)
+
+        item = self.items.get(str(flavour).strip().lower())
+        if item is None or not item.is_available:
+            raise ValueError(f"'{flavour}' is not on the menu")
+
+        try:
+            size = size if isinstance(size, OrderSizes) else OrderSizes[size]
+        except KeyError:
+            raise ValueError(f"'{size}' is not a valid size")
+
+        unit_price = item.prices.get(size)
+        if unit_price is None:
+            raise ValueError(f"'{item.name}' does not come in {size.name}")
+
+        total_price = (unit_price * quantity).quantize(CENTS)
+        return item.name, unit_price, total_price
+
+
+class CatalogCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.catalog = None
+        self.checked_until = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self.catalog is not None and now < self.checked_until:
+            return self.catalog
+
+        with self._lock:
+            if self.catalog is None or now >= self.checked_until:
+                version = menu_version()
+                if self.catalog is None or self.catalog.version != version:
+                    self.catalog = load_catalog(version)
+                self.checked_until = now + self.ttl
+            return self.catalog
+
+    def invalidate(self):
+        with self._lock:
+            self.catalog = None
+
+
+def init_catalog(app):
+    app.extensions["menu_catalog"] = CatalogCache(ttl=app.config["MENU_CACHE_TTL"])
+
+
+def get_catalog():
+    return current_app.extensions["menu_catalog"].get()
+
+
+def price_order(flavour, size, quantity):
+    """
+    Validate an order against the cached menu and price it. While the menu is
+    empty any flavour is taken, unpriced.
+    :return: (flavour, unit price, total price)
+    :raises ValueError: with the message for the client
+    """
+    catalog = get_catalog()
+    if not catalog:
+        check_quantity(quantity)
+        return flavour, None, None
+    return catalog.price_order(flavour, size, quantity)
+
+
+def menu_version():
+    return db.session.query(MenuVersion.version).filter_by(id=MENU_VERSION_ID).scalar() or 0
+
+
+def load_catalog(version):
+    flavours = Flavour.query.options(selectinload(Flavour.prices)).order_by(Flavour.name).all()
+    return Catalog(
+        version,
+        [
+            MenuItem(
+                flavour.id,
+                flavour.name,
+                flavour.is_available,
+                {price.size: price.price for price in flavour.prices},
+            )
+            for flavour in flavours
+        ],
+    )
+
+
+def bump_menu_version():
+    """
+    Mark the menu as changed, to call in the transaction changing it.
+    """
+    bumped = (
+        db.session.query(MenuVersion)
+        .filter_by(id=MENU_VERSION_ID)
+        .update({MenuVersion.version: MenuVersion.version + 1}, synchronize_session=False)
+    )
+    if not bumped:
+        db.session.add(MenuVersion(id=MENU_VERSION_ID, version=1))
+
+
+# to call after the change is committed
+def invalidate_catalog():
+    current_app.extensions["menu_catalog"].invalidate()
@@ -0,0 +1,26 @@
+from flask_restx import fields
+from ..menu import menu_namespace  # Namespace instantiated in menu/__init__.py
+
+# SIZE PRICE SCHEMA MODEL
+size_price_model = menu_namespace.model(
+    name="Size Price",
+    model={
+        "size": fields.String(
+            required=True,
+            description="Size of pizza",
+            enum=["SMALL", "MEDIUM", "LARGE", "EXTRA_LARGE"],
+        ),
+        "price": fields.Float(required=True, description="Unit price of the flavour in this size"),
+    },
+)
+
+# FLAVOUR SCHEMA MODEL
+flavour_model = menu_namespace.model(
+    name="Flavour",
+    model={
+        "id": fields.Integer(description="A Flavour Id"),
+        "name": fields.String(required=True, description="Name of the flavour"),
+        "is_available": fields.Boolean(description="Shows if the flavour can be ordered", default=True),
+        "prices": fields.List(fields.Nested(size_price_model), description="Price of each size"),
+    },
+)
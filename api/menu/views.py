@@ -0,0 +1,124 @@
+from decimal import Decimal
+from flask_restx import Resource
+from flask_jwt_extended import jwt_required
+from http import HTTPStatus
+from sqlalchemy.exc import IntegrityError
+from ..auth.identity import current_identity
+from ..menu import menu_namespace
+from ..menu.catalog import CENTS, get_catalog, bump_menu_version, invalidate_catalog
+from ..menu.schemas import flavour_model
+from ..models.menu import Flavour, SizePrice
+from ..models.orders import OrderSizes
+from ..utils import db
+
+
+def menu_item_dict(item):
+    return {
+        "id": item.id,
+        "name": item.name,
+        "is_available": item.is_available,
+        "prices": [
+            {"size": size.name, "price": float(price)}
+            for size, price in sorted(item.prices.items(), key=lambda price: list(OrderSizes).index(price[0]))
+        ],
+    }
+
+
+def staff_only():
+    user = current_identity()
+    if user is None or not user.is_staff:
+        menu_namespace.abort(HTTPStatus.FORBIDDEN, "Staff only")
+
+
+def set_flavour(flavour, data):
+    """
+    Apply a flavour payload, replacing its prices.
+    """
+    try:
+        prices = {OrderSizes[price["size"]]: price["price"] for price in data.get("prices") or []}
+    except (KeyError, TypeError):
+        menu_namespace.abort(HTTPStatus.BAD_REQUEST, "Each price needs a valid size and a price")
+    if any(isinstance(price, bool) or not isinstance(price, (int, float)) or price <= 0 for price in prices.values()):
+        menu_namespace.abort(HTTPStatus.BAD_REQUEST, "Prices must be positive numbers")
+
+    flavour.name = data["name"].strip()
+    flavour.is_available = data.get("is_available", True)
+
+    # update the rows in place, a delete and insert of the same size would clash in one flush
+    current = {price.size: price for price in flavour.prices}
+    for size, price in prices.items():
+        price = Decimal(str(price)).quantize(CENTS)
+        if size in current:
+            current.pop(size).price = price
+        else:
+            flavour.prices.append(SizePrice(size=size, price=price))
+    for price in current.values():
+        flavour.prices.remove(price)
+
+
+def save_flavour(flavour):
+    # the version bump commits with the change, so every worker reloads the menu
+    bump_menu_version()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        menu_namespace.abort(HTTPStatus.CONFLICT, "A flavour with this name already exists")
+    invalidate_catalog()
+
+
+@menu_namespace.route("/")
+class GetCreateFlavours(Resource):
+
+    # Getting the menu
+    @menu_namespace.marshal_with(flavour_model)
+    @menu_namespace.doc(description="Get the flavours on the menu with their prices (cached)")
+    @jwt_required()
+    def get(self):
+        """
+        Get the Menu
+        """
+        return [menu_item_dict(item) for item in get_catalog().items.values()], HTTPStatus.OK
+
+    # Adding a flavour
+    @menu_namespace.expect(flavour_model, validate=True)
+    @menu_namespace.marshal_with(flavour_model)
+    @menu_namespace.doc(description="Add a flavour to the menu (staff only)")
+    @jwt_required()
+    def post(self):
+        """
+        Add a Flavour
+        """
+        staff_only()
+
+        flavour = Flavour()
+        set_flavour(flavour, menu_namespace.payload)
+        db.session.add(flavour)
+        save_flavour(flavour)
+
+        return menu_item_dict(get_catalog().items[flavour.name.lower()]), HTTPStatus.CREATED
+
+
+@menu_namespace.route("/<int:flavour_id>")
+@menu_namespace.doc(params={"flavour_id": "An Id for a Flavour"})
+class UpdateFlavour(Resource):
+
+    # Updating a flavour
+    @menu_namespace.expect(flavour_model, validate=True)
+    @menu_namespace.marshal_with(flavour_model)
+    @menu_namespace.doc(
+        description="Update a flavour and replace its prices (staff only). "
+        "Set is_available to false to take it off the menu, past orders keep their prices."
+    )
+    @jwt_required()
+    def put(self, flavour_id):
+        """
+        Update a Flavour
+        """
+        staff_only()
+
+        flavour = Flavour.query.get_or_404(flavour_id)
+        set_flavour(flavour, menu_namespace.payload)
+        save_flavour(flavour)
+
+        return menu_item_dict(get_catalog().items[flavour.name.lower()]), HTTPStatus.OK
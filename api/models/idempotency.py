@@ -0,0 +1,28 @@
+from datetime import datetime
+from ..utils import db
+
+
+# IDEMPOTENCY KEY MODEL (see api/utils/idempotency.py)
+class IdempotencyKey(db.Model):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        # claiming a key is an INSERT, so concurrent duplicates cannot both get it
+        db.UniqueConstraint("scope", "key", name="uq_idempotency_keys_scope_key"),
+    )
+
+    id = db.Column(db.Integer(), primary_key=True)
+    # the route and the caller the key belongs to
+    scope = db.Column(db.String(255), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    # sha256 of the request body, a key reused with another body is rejected
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # the stored response, status_code is NULL while the first request is in progress
+    status_code = db.Column(db.Integer())
+    mimetype = db.Column(db.String(100))
+    body = db.Column(db.LargeBinary())
+    # when the request in progress claimed the key, a claim older than IDEMPOTENCY_LOCK_SECONDS can be taken over
+    claimed_at = db.Column(db.DateTime(), default=datetime.utcnow, nullable=False)
+    date_created = db.Column(db.DateTime(), default=datetime.utcnow, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey {self.scope} {self.key}>"
@@ -0,0 +1,43 @@
+from datetime import datetime
+from .orders import OrderSizes
+from ..utils import db
+
+
+# FLAVOUR MODEL
+class Flavour(db.Model):
+    __tablename__ = "flavours"
+
+    id = db.Column(db.Integer(), primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+    # unavailable flavours stay on the menu (for past orders) but cannot be ordered
+    is_available = db.Column(db.Boolean(), default=True, nullable=False)
+    date_created = db.Column(db.DateTime(), default=datetime.utcnow)
+
+    # relationship: the price of each size the flavour comes in
+    prices = db.relationship("SizePrice", backref="flavour", cascade="all, delete-orphan", lazy=True)
+
+    def __repr__(self):
+        return f"<Flavour {self.name}>"
+
+
+# SIZE PRICE MODEL (unit price of a flavour in one size)
+class SizePrice(db.Model):
+    __tablename__ = "size_prices"
+
+    flavour_id = db.Column(db.Integer(), db.ForeignKey("flavours.id", ondelete="CASCADE"), primary_key=True)
+    size = db.Column(db.Enum(OrderSizes), primary_key=True)
+    price = db.Column(db.Numeric(10, 2), nullable=False)
+
+    def __repr__(self):
+        return f"<SizePrice {self.flavour_id} {self.size}>"
+
+
+# MENU VERSION MODEL (a single row, bumped by every menu change, see api/menu/catalog.py)
+class MenuVersion(db.Model):
+    __tablename__ = "menu_version"
+
+    id = db.Column(db.Integer(), primary_key=True)
+    version = db.Column(db.Integer(), nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<MenuVersion {self.version}>"
@@ -1,6 +1,6 @@
 from ..utils import db
 from enum import Enum
-from datetime import datetime
+from datetime import datetime, timezone
 
 
 # Create a class Size for Enum function
@@ -18,16 +18,48 @@ class OrderStatus(Enum):
     DELIVERED = "delivered"
 
 
+# allowed status transitions: current status -> statuses it can move to
+ORDER_STATUS_TRANSITIONS = {
+    OrderStatus.PENDING: {OrderStatus.IN_TRANSIT, OrderStatus.DELIVERED},
+    OrderStatus.IN_TRANSIT: {OrderStatus.DELIVERED},
+    OrderStatus.DELIVERED: set(),
+}
+
+
 # ORDER MODEL
 class Order(db.Model):
     __tablename__ = "orders"
+    __table_args__ = (
+        # per-customer listings, newest first
+        db.Index("ix_orders_customer_id_date_created", "customer_id", "date_created"),
+        # status listings and dispatch queues, newest first
+        db.Index("ix_orders_status_date_created", "status", "date_created"),
+        # per-customer list ETags: max(updated_at) and count from the index alone
+        db.Index("ix_orders_customer_id_updated_at", "customer_id", "updated_at"),
+        # change scans of the rollup refresh (orders after its high-water mark)
+        db.Index("ix_orders_updated_at_id", "updated_at", "id"),
+        # keyset pagination of GET /orders/
+        db.Index("ix_orders_date_created_id", "date_created", "id"),
+        # small partial index over orders still in flight
+        db.Index(
+            "ix_orders_open_date_created",
+            "date_created",
+            postgresql_where=db.text("status != 'DELIVERED'"),
+            sqlite_where=db.text("status != 'DELIVERED'"),
+        ),
+    )
 
     id = db.Column(db.Integer(), primary_key=True)
     size = db.Column(db.Enum(OrderSizes), default=OrderSizes.SMALL) 
     status = db.Column(db.Enum(OrderStatus), default=OrderStatus.PENDING)
     flavour = db.Column(db.String(), nullable=False)
     quantity = db.Column(db.Integer(), default=1)
+    # priced from the menu when the order is written (NULL while the menu is empty)
+    unit_price = db.Column(db.Numeric(10, 2))
+    total_price = db.Column(db.Numeric(10, 2))
     date_created = db.Column(db.DateTime(), default=datetime.utcnow)
+    # bumped by every ORM and Core UPDATE, the version behind the order ETags
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     # relationship: create foreign key with user
     customer_id = db.Column(db.Integer(), db.ForeignKey("users.id"))
@@ -51,8 +83,74 @@ class Order(db.Model):
 
     # get order by id method
     @classmethod
-    def get_by_id(cls, id):
-        return cls.query.get_or_404(id)
+    def get_by_id(cls, id, *options, archived=False):
+        """
+        :param options: loader options, e.g. joinedload(Order.customer)
+        :param archived: also look in orders_archive (read only) when the id is not in orders
+        """
+        if not archived:
+            return cls.query.options(*options).get_or_404(id)
+
+        order = cls.query.options(*options).filter_by(id=id).first()
+        if order is None:
+            order = OrderArchive.query.get_or_404(id)
+        return order
+
+    # version of one order, without loading it
+    @classmethod
+    def version_of(cls, id):
+        """
+        :return: updated_at of the order (archived or not), or None if it does not exist
+        """
+        row = db.session.query(cls.updated_at).filter_by(id=id).first()
+        if row is None:
+            row = db.session.query(OrderArchive.updated_at).filter_by(id=id).first()
+        return row.updated_at if row is not None else None
+
+    # version of a customer's order list
+    @classmethod
+    def list_version_of_customer(cls, customer_id):
+        """
+        :return: (latest updated_at, number of orders) of the customer's orders
+        """
+        return tuple(
+            db.session.query(db.func.max(cls.updated_at), db.func.count(cls.id))
+            .filter_by(customer_id=customer_id)
+            .one()
+        )
+
+    # filter clauses method
+    @classmethod
+    def filters_from_args(cls, args, entity=None):
+        """
+        Build filter clauses from parsed list arguments.
+        :param args: mapping with optional status, size, customer_id, date_from and date_to
+        :param entity: the model to filter, Order or OrderArchive (defaults to Order)
+        :return: list of clauses to pass to query.filter()
+        """
+        entity = entity or cls
+        clauses = []
+
+        if args.get("status"):
+            clauses.append(entity.status == OrderStatus[args["status"]])
+        if args.get("size"):
+            clauses.append(entity.size == OrderSizes[args["size"]])
+        if args.get("customer_id") is not None:
+            clauses.append(entity.customer_id == args["customer_id"])
+        if args.get("date_from"):
+            clauses.append(entity.date_created >= _as_utc_naive(args["date_from"]))
+        if args.get("date_to"):
+            clauses.append(entity.date_created < _as_utc_naive(args["date_to"]))
+
+        return clauses
+
+    # statuses an order can be moved to the given status from
+    @staticmethod
+    def statuses_allowed_before(status):
+        return [
+            current for current, targets in ORDER_STATUS_TRANSITIONS.items()
+            if status in targets
+        ]
 
     # update status method
     # @classmethod
@@ -65,3 +163,42 @@ class Order(db.Model):
     def update_status_with_payload(self, data):    
         self.status = data["status"]  #for order_namespace.payload   
         db.session.commit()
+
+
+# ORDER ARCHIVE MODEL (delivered orders moved out of orders, see api/orders/archive.py)
+class OrderArchive(db.Model):
+    __tablename__ = "orders_archive"
+    __table_args__ = (
+        db.Index("ix_orders_archive_customer_id_date_created", "customer_id", "date_created"),
+    )
+
+    # same columns as orders, the ids are kept
+    id = db.Column(db.Integer(), primary_key=True, autoincrement=False)
+    size = db.Column(db.Enum(OrderSizes))
+    status = db.Column(db.Enum(OrderStatus))
+    flavour = db.Column(db.String(), nullable=False)
+    quantity = db.Column(db.Integer())
+    unit_price = db.Column(db.Numeric(10, 2))
+    total_price = db.Column(db.Numeric(10, 2))
+    date_created = db.Column(db.DateTime())
+    updated_at = db.Column(db.DateTime(), nullable=False)
+    customer_id = db.Column(db.Integer(), db.ForeignKey("users.id"))
+    archived_at = db.Column(db.DateTime(), nullable=False)
+
+    customer = db.relationship("User", viewonly=True)
+
+    # columns copied from orders
+    COPIED_COLUMNS = (
+        "id", "size", "status", "flavour", "quantity", "unit_price", "total_price",
+        "date_created", "updated_at", "customer_id",
+    )
+
+    def __repr__(self):
+        return f"<OrderArchive {self.id}>"
+
+
+# date_created is stored as naive UTC, so aware datetimes are converted before comparing
+def _as_utc_naive(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
@@ -0,0 +1,44 @@
+from ..utils import db
+
+
+# ORDER DAILY STATS MODEL (rollup of orders, see api/orders/rollup.py)
+class OrderDailyStats(db.Model):
+    __tablename__ = "order_daily_stats"
+
+    # one row per day (of date_created, UTC), status, size and flavour
+    day = db.Column(db.Date(), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    size = db.Column(db.String(20), primary_key=True)
+    flavour = db.Column(db.String(), primary_key=True)
+    orders = db.Column(db.Integer(), nullable=False, default=0)
+    quantity = db.Column(db.Integer(), nullable=False, default=0)
+    # sum of the orders' total_price
+    revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<OrderDailyStats {self.day} {self.status} {self.size} {self.flavour}>"
+
+
+# ROLLUP STATE MODEL
+class RollupState(db.Model):
+    __tablename__ = "rollup_state"
+
+    name = db.Column(db.String(50), primary_key=True)
+    # high-water mark: the (updated_at, id) of the last order rolled up
+    last_updated_at = db.Column(db.DateTime())
+    last_id = db.Column(db.Integer())
+
+    def __repr__(self):
+        return f"<RollupState {self.name}>"
+
+
+# ROLLUP DIRTY DAY MODEL
+class RollupDirtyDay(db.Model):
+    __tablename__ = "rollup_dirty_days"
+
+    # a day to recompute on the next refresh, left by a deleted order (several rows per day are fine)
+    id = db.Column(db.Integer(), primary_key=True)
+    day = db.Column(db.Date(), nullable=False)
+
+    def __repr__(self):
+        return f"<RollupDirtyDay {self.day}>"
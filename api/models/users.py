@@ -11,6 +11,8 @@ class User(db.Model):
     password_hash = db.Column(db.String(), nullable=False)
     is_staff = db.Column(db.Boolean(), default=False)
     is_active = db.Column(db.Boolean(), default=False)
+    # carried by the user's tokens as the "ver" claim, bumping it revokes all of them
+    token_version = db.Column(db.Integer(), default=0, nullable=False)
 
     # relationship: create relationship with orders
     orders = db.Relationship("Order", backref="customer", lazy=True)
@@ -23,6 +25,10 @@ class User(db.Model):
         db.session.add(self)
         db.session.commit()
 
+    # revoke all tokens of the user (log out everywhere), e.g. after a password change
+    def revoke_tokens(self):
+        self.token_version = (self.token_version or 0) + 1
+
     # get user by id method
     @classmethod
     def get_by_id(cls, id):
@@ -0,0 +1,3 @@
+from ..utils.serializers import Namespace  # flask-restx Namespace with the compiled marshal_with
+
+monitoring_namespace = Namespace("Monitoring", description="Namespace for Monitoring")
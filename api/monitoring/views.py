@@ -0,0 +1,45 @@
+from flask_restx import Resource, fields
+from flask_jwt_extended import jwt_required
+from http import HTTPStatus
+from ..auth.identity import current_identity
+from ..monitoring import monitoring_namespace
+from ..utils import db
+from ..utils.pool import pool_stats
+
+
+# POOL STATS SCHEMA MODEL
+pool_stats_model = monitoring_namespace.model(
+    name="Pool Stats",
+    model={
+        "bind": fields.String(description="Bind key of the engine, 'default' for the primary database"),
+        "pool": fields.String(description="Pool class"),
+        "status": fields.String(description="Pool status line"),
+        "size": fields.Integer(description="Configured pool_size"),
+        "checked_in": fields.Integer(description="Idle connections in the pool"),
+        "checked_out": fields.Integer(description="Connections in use"),
+        "overflow": fields.Integer(description="Connections opened above pool_size"),
+        "max_overflow": fields.Integer(description="Configured max_overflow"),
+    },
+)
+
+
+@monitoring_namespace.route("/pool")
+class GetPoolStats(Resource):
+
+    @monitoring_namespace.marshal_with(pool_stats_model)
+    @monitoring_namespace.doc(description="Get the database connection pool counts of this worker (staff only)")
+    @jwt_required()
+    def get(self):
+        """
+        Get Connection Pool Stats
+        """
+        user = current_identity()
+        if user is None or not user.is_staff:
+            monitoring_namespace.abort(HTTPStatus.FORBIDDEN, "Staff only")
+
+        stats = [
+            dict(pool_stats(engine), bind=bind_key or "default")
+            for bind_key, engine in db.engines.items()
+        ]
+
+        return stats, HTTPStatus.OK
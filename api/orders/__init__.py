@@ -1,3 +1,3 @@
-from flask_restx import Namespace
+from ..utils.serializers import Namespace  # flask-restx Namespace with the compiled marshal_with
 
 orders_namespace = Namespace("Orders", description="Namespace for Orders")
@@ -0,0 +1,76 @@
+"""
+Archival of old delivered orders into the orders_archive table.
+
+Delivered orders are final, and after a few weeks they are hardly read, yet
+they stay in every scan and index of orders. `flask archive-orders` moves the
+ones delivered (by date_created) before ARCHIVE_AFTER_DAYS into
+orders_archive, ARCHIVE_BATCH_SIZE orders per transaction, so it never holds
+long locks. Archived orders keep their ids, and are still read by
+Order.get_by_id(..., archived=True), the per-user order routes and the
+export. GET /orders/ only lists the orders still in the orders table.
+"""
+
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import delete, insert, literal, select
+from ..models.orders import Order, OrderArchive, OrderStatus
+from ..utils import db
+
+
+def archive_orders(older_than_days=None, batch_size=None):
+    """
+    Move delivered orders created more than older_than_days ago into orders_archive.
+    :return: number of orders archived
+    """
+    if older_than_days is None:
+        older_than_days = current_app.config["ARCHIVE_AFTER_DAYS"]
+    if batch_size is None:
+        batch_size = current_app.config["ARCHIVE_BATCH_SIZE"]
+
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    columns = [Order.__table__.c[name] for name in OrderArchive.COPIED_COLUMNS]
+
+    archived = 0
+    while True:
+        # served by ix_orders_status_date_created
+        ids = [
+            id
+            for (id,) in db.session.query(Order.id)
+            .filter(Order.status == OrderStatus.DELIVERED, Order.date_created < cutoff)
+            .order_by(Order.date_created, Order.id)
+            .limit(batch_size)
+        ]
+        if not ids:
+            break
+
+        db.session.execute(
+            insert(OrderArchive).from_select(
+                [*OrderArchive.COPIED_COLUMNS, "archived_at"],
+                select(*columns, literal(datetime.utcnow())).where(Order.id.in_(ids)),
+            )
+        )
+        db.session.execute(
+            delete(Order).where(Order.id.in_(ids)), execution_options={"synchronize_session": False}
+        )
+        db.session.commit()
+
+        archived += len(ids)
+        if len(ids) < batch_size:
+            break
+
+    return archived
+
+
+def init_archive(app):
+    """
+    Register the `flask archive-orders` command.
+    """
+
+    @app.cli.command("archive-orders")
+    @click.option("--older-than-days", type=int, help="Defaults to ARCHIVE_AFTER_DAYS.")
+    @click.option("--batch-size", type=int, help="Defaults to ARCHIVE_BATCH_SIZE.")
+    def archive_command(older_than_days, batch_size):
+        """Move old delivered orders into orders_archive."""
+        archived = archive_orders(older_than_days=older_than_days, batch_size=batch_size)
+        click.echo(f"Archived {archived} order(s).")
@@ -0,0 +1,55 @@
+from http import HTTPStatus
+from flask import Response, current_app
+from flask_restx import abort
+from ..utils.events import event_stream
+
+
+def order_event(id, customer_id, status, updated_at):
+    """
+    The status change message of an order, with values as order_details_model shows them.
+    """
+    return {
+        "id": id,
+        "customer_id": customer_id,
+        "status": str(status),
+        "updated_at": updated_at.isoformat() if updated_at is not None else None,
+    }
+
+
+# to call after the change is committed
+def publish_order_event(id, customer_id, status, updated_at):
+    broker = current_app.extensions["events"]
+    message = order_event(id, customer_id, status, updated_at)
+
+    broker.publish(f"order:{id}", message)
+    if customer_id is not None:
+        broker.publish(f"user:{customer_id}", message)
+
+
+# to call before any database work, streams are only served where EVENTS_ENABLED (see the config)
+def require_order_events():
+    if not current_app.config["EVENTS_ENABLED"]:
+        abort(HTTPStatus.SERVICE_UNAVAILABLE, "Order events are not served by this deployment, poll the order instead")
+
+
+def subscribe_order_events(channel):
+    return current_app.extensions["events"].subscribe(
+        [channel], maxsize=current_app.config["EVENTS_BUFFER_SIZE"]
+    )
+
+
+def order_event_response(subscription, initial=()):
+    """
+    Stream a subscription as server-sent "order" events.
+
+    The body is generated after the request has ended, so the stream holds no
+    database connection.
+    """
+    body = event_stream(
+        subscription, current_app.config["EVENTS_HEARTBEAT_SECONDS"], event="order", initial=initial
+    )
+    return Response(
+        body,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
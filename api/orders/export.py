@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+from sqlalchemy import select, union_all
+from ..models.orders import Order, OrderArchive
+from ..utils import db
+
+# columns written by the export, in order
+EXPORT_COLUMNS = (
+    "id", "size", "status", "flavour", "quantity", "unit_price", "total_price", "date_created", "customer_id",
+)
+
+EXPORT_MIMETYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def iter_order_rows(args, batch_size):
+    """
+    Yield export rows for the orders matching the filter arguments, archived ones included.
+
+    Plain column tuples are read through a server-side cursor (yield_per
+    implies stream_results), so neither the driver nor the ORM keeps more
+    than one batch in memory whatever the size of the table.
+    """
+    # the whole order history: archived orders keep their ids, so the union is ordered by id too
+    statement = (
+        union_all(
+            *(
+                select(*(getattr(entity, column) for column in EXPORT_COLUMNS)).where(
+                    *Order.filters_from_args(args, entity=entity)
+                )
+                for entity in (Order, OrderArchive)
+            )
+        )
+        .order_by("id")
+        .execution_options(yield_per=batch_size)
+    )
+
+    for (
+        id, size, status, flavour, quantity, unit_price, total_price, date_created, customer_id
+    ) in db.session.execute(statement):
+        yield {
+            "id": id,
+            "size": size.name if size else None,
+            "status": status.name if status else None,
+            "flavour": flavour,
+            "quantity": quantity,
+            "unit_price": str(unit_price) if unit_price is not None else None,
+            "total_price": str(total_price) if total_price is not None else None,
+            "date_created": date_created.isoformat() if date_created else None,
+            "customer_id": customer_id,
+        }
+
+
+def generate_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, separators=(",", ":")) + "\n"
+
+
+def generate_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+
+    def flush():
+        # reuse the buffer so memory stays flat
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writeheader()
+    yield flush()
+    for row in rows:
+        writer.writerow(row)
+        yield flush()
+
+
+EXPORT_GENERATORS = {
+    "ndjson": generate_ndjson,
+    "csv": generate_csv,
+}
@@ -0,0 +1,205 @@
+"""
+Daily order analytics, kept in the order_daily_stats rollup table.
+
+A refresh finds the orders written since its high-water mark (updated_at,
+id), and recomputes the days they were created on from the orders and
+orders_archive tables. Status changes move an order's updated_at, so they are
+picked up too, while archiving an order leaves its day as it is.
+
+updated_at is stamped by the app at flush time, so an order can commit after
+a refresh has moved the mark past it (a long transaction, or a worker with a
+lagging clock). Each refresh therefore scans ROLLUP_SAFETY_SECONDS behind the
+mark again, recomputing those days once more rather than missing them.
+A deleted order has no updated_at left to find, so deleting it records its
+day in rollup_dirty_days, in the same transaction, for the next refresh.
+"""
+
+from datetime import date, datetime, timedelta
+import click
+from flask import current_app, request
+from sqlalchemy import and_, event, func, insert, or_, tuple_
+from ..models.orders import Order, OrderArchive
+from ..models.stats import OrderDailyStats, RollupDirtyDay, RollupState
+from ..utils import db
+
+ROLLUP_NAME = "order_daily_stats"
+
+# days recomputed per statement
+DAYS_PER_BATCH = 31
+
+WRITE_METHODS = frozenset(["POST", "PUT", "PATCH", "DELETE"])
+
+
+def _as_date(value):
+    # date() gives a date on Postgres and an ISO string on SQLite
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def _key(value):
+    # the rollup's key columns are not nullable
+    if value is None:
+        return ""
+    return getattr(value, "name", value)
+
+
+def _after_mark(state, safety_seconds):
+    if safety_seconds:
+        return Order.updated_at >= state.last_updated_at - timedelta(seconds=safety_seconds)
+    return tuple_(Order.updated_at, Order.id) > (state.last_updated_at, state.last_id)
+
+
+@event.listens_for(Order, "after_delete")
+def _mark_day_dirty(mapper, connection, target):
+    if target.date_created is not None:
+        connection.execute(insert(RollupDirtyDay).values(day=target.date_created.date()))
+
+
+def refresh_order_stats(full=False, safety_seconds=None):
+    """
+    Bring order_daily_stats up to date, in one transaction.
+
+    Concurrent refreshes are serialized on the rollup_state row.
+    :param full: rebuild every day instead of the ones changed since the last refresh
+    :param safety_seconds: how far behind the mark to scan again, defaults to ROLLUP_SAFETY_SECONDS
+    :return: number of days recomputed
+    """
+    if safety_seconds is None:
+        safety_seconds = current_app.config["ROLLUP_SAFETY_SECONDS"]
+
+    state = db.session.query(RollupState).filter_by(name=ROLLUP_NAME).with_for_update().first()
+    if state is None:
+        state = RollupState(name=ROLLUP_NAME)
+        db.session.add(state)
+
+    changed = db.session.query(Order.updated_at, Order.id)
+    if not full and state.last_id is not None:
+        changed = changed.filter(_after_mark(state, safety_seconds))
+
+    # take the new mark first, so orders written meanwhile wait for the next refresh
+    mark = changed.order_by(Order.updated_at.desc(), Order.id.desc()).first()
+    dirty = db.session.query(RollupDirtyDay.id, RollupDirtyDay.day).all()
+    if mark is None and not dirty and not full:
+        db.session.commit()
+        return 0
+    # by id, rows added meanwhile are left for the next refresh
+    if dirty:
+        db.session.query(RollupDirtyDay).filter(RollupDirtyDay.id.in_([id for id, _ in dirty])).delete(
+            synchronize_session=False
+        )
+
+    if full:
+        db.session.query(OrderDailyStats).delete(synchronize_session=False)
+        days_query = (
+            db.session.query(func.date(Order.date_created))
+            .filter(Order.date_created.isnot(None))
+            .union(
+                db.session.query(func.date(OrderArchive.date_created)).filter(
+                    OrderArchive.date_created.isnot(None)
+                )
+            )
+        )
+        days = {_as_date(day) for (day,) in days_query}
+    else:
+        days = {_as_date(day) for _, day in dirty}
+        if mark is not None:
+            days_query = db.session.query(func.date(Order.date_created)).filter(
+                Order.date_created.isnot(None),
+                tuple_(Order.updated_at, Order.id) <= (mark.updated_at, mark.id),
+            )
+            if state.last_id is not None:
+                days_query = days_query.filter(_after_mark(state, safety_seconds))
+            days.update(_as_date(day) for (day,) in days_query.distinct())
+
+    days = sorted(days)
+
+    for start in range(0, len(days), DAYS_PER_BATCH):
+        _recompute_days(days[start:start + DAYS_PER_BATCH])
+
+    # the mark only moves forward, the safety window can find nothing newer
+    if mark is not None and (
+        state.last_id is None or (mark.updated_at, mark.id) > (state.last_updated_at, state.last_id)
+    ):
+        state.last_updated_at, state.last_id = mark.updated_at, mark.id
+    db.session.commit()
+
+    return len(days)
+
+
+def _day_totals(entity, days):
+    # ranges on date_created (rather than date(date_created) IN ...) so the index can be used
+    in_days = or_(
+        *(
+            and_(entity.date_created >= datetime.combine(day, datetime.min.time()),
+                 entity.date_created < datetime.combine(day + timedelta(days=1), datetime.min.time()))
+            for day in days
+        )
+    )
+
+    day_column = func.date(entity.date_created)
+    return (
+        db.session.query(
+            day_column, entity.status, entity.size, entity.flavour,
+            func.count(entity.id), func.coalesce(func.sum(entity.quantity), 0),
+            func.coalesce(func.sum(entity.total_price), 0),
+        )
+        .filter(in_days)
+        .group_by(day_column, entity.status, entity.size, entity.flavour)
+        .all()
+    )
+
+
+def _recompute_days(days):
+    # a day can have orders in both tables, once some of them are archived
+    rows = _day_totals(Order, days) + _day_totals(OrderArchive, days)
+
+    db.session.query(OrderDailyStats).filter(OrderDailyStats.day.in_(days)).delete(
+        synchronize_session=False
+    )
+
+    stats = {}
+    for day, status, size, flavour, orders, quantity, revenue in rows:
+        key = (_as_date(day), _key(status), _key(size), flavour)
+        counts = stats.setdefault(key, [0, 0, 0])
+        counts[0] += orders
+        counts[1] += quantity
+        counts[2] += revenue
+
+    if stats:
+        db.session.execute(
+            insert(OrderDailyStats),
+            [
+                {"day": day, "status": status, "size": size, "flavour": flavour,
+                 "orders": orders, "quantity": quantity, "revenue": revenue}
+                for (day, status, size, flavour), (orders, quantity, revenue) in stats.items()
+            ],
+        )
+
+
+def init_rollup(app):
+    """
+    Register the `flask rollup` command, and the refresh after order writes if ROLLUP_ON_WRITE is set.
+    """
+
+    @app.cli.command("rollup")
+    @click.option("--full", is_flag=True, help="Rebuild every day instead of the changed ones.")
+    def rollup_command(full):
+        """Refresh the order_daily_stats rollup."""
+        days = refresh_order_stats(full=full)
+        click.echo(f"Recomputed {days} day(s) of order stats.")
+
+    if app.config["ROLLUP_ON_WRITE"]:
+
+        @app.after_request
+        def refresh_after_write(response):
+            if (
+                request.method in WRITE_METHODS
+                and request.path.startswith("/orders")
+                and response.status_code < 400
+            ):
+                # the write is already committed, a failed refresh waits for the next one
+                try:
+                    refresh_order_stats()
+                except Exception:
+                    db.session.rollback()
+                    current_app.logger.exception("Refreshing the order stats rollup failed")
+            return response
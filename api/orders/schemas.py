@@ -1,4 +1,4 @@
-from flask_restx import fields
+from flask_restx import fields, inputs, reqparse
 from ..auth.schemas import user_model
 from ..orders import orders_namespace  # Namespace instantiated in auth/__init__.py
 
@@ -12,17 +12,17 @@ create_order_model = orders_namespace.model(
             enum=["SMALL", "MEDIUM", "LARGE", "EXTRA_LARGE"],
         ),
         "flavour": fields.String(
-            required=True, description="Flavour of pizza to order"
+            required=True, description="Flavour of pizza to order, one of the menu's once it has any"
         ),
         "quantity": fields.Integer(
-            required=False, description="Flavour of pizza to order"
+            required=False, min=1, default=1, description="Number of pizzas to order"
         ),
     },
 )
 
-# ORDER DETAILS SCHEMA MODEL
-order_details_model = orders_namespace.model(
-    name="Order Details",
+# ORDER SCHEMA MODEL (returned by the write routes)
+order_model = orders_namespace.model(
+    name="Order",
     model={
         "message": fields.String(description="Execution Message", default="Executed successfully!"),
         "id": fields.Integer(descriptoin="An Order Id"),
@@ -32,12 +32,71 @@ order_details_model = orders_namespace.model(
         ),
         "flavour": fields.String(description="Flavour of pizza ordered"),
         "quantity": fields.Integer(description="Flavour of pizza ordered"),
+        "unit_price": fields.Float(description="Menu price of one pizza when the order was placed"),
+        "total_price": fields.Float(description="Price of the order"),
         "status": fields.String(
             description="Status of the order",
             enum=["PENDING", "IN_TRANSIT", "DELIVERED"],
         ),
         "date_created": fields.DateTime(description="Date of order creation"),
-        # "customer": fields.Nested(user_model, description="Details of the customer"),
+    },
+)
+
+# ORDER DETAILS SCHEMA MODEL (returned by the read routes)
+order_details_model = orders_namespace.inherit(
+    "Order Details",
+    order_model,
+    {
+        # eager loaded by the views (see customer_options), leave it out with fields= to skip the load
+        "customer": fields.Nested(user_model, allow_null=True, description="Details of the customer"),
+    },
+)
+
+# USER ORDER SCHEMA MODEL (an order nested in its customer)
+user_order_model = orders_namespace.model(
+    name="User Order",
+    model={
+        "id": fields.Integer(description="An Order Id"),
+        "size": fields.String(
+            description="Size of pizza ordered",
+            enum=["SMALL", "MEDIUM", "LARGE", "EXTRA_LARGE"],
+        ),
+        "flavour": fields.String(description="Flavour of pizza ordered"),
+        "quantity": fields.Integer(description="Quantity of pizza ordered"),
+        "total_price": fields.Float(description="Price of the order"),
+        "status": fields.String(
+            description="Status of the order",
+            enum=["PENDING", "IN_TRANSIT", "DELIVERED"],
+        ),
+        "date_created": fields.DateTime(description="Date of order creation"),
+    },
+)
+
+# USER WITH ORDERS SCHEMA MODEL
+user_orders_model = orders_namespace.inherit(
+    "User With Orders",
+    user_model,
+    {"orders": fields.List(fields.Nested(user_order_model), description="Orders of the user")},
+)
+
+# BULK ORDER ITEM RESULT SCHEMA MODEL
+bulk_order_result_model = orders_namespace.model(
+    name="Bulk Order Result",
+    model={
+        "index": fields.Integer(description="Position of the order in the request list"),
+        "status": fields.String(description="Result of the item", enum=["created", "failed"]),
+        "id": fields.Integer(description="Id of the created order"),
+        "errors": fields.List(fields.String, description="Validation errors of a failed item"),
+    },
+)
+
+# BULK ORDER RESPONSE SCHEMA MODEL
+bulk_order_response_model = orders_namespace.model(
+    name="Bulk Order Response",
+    model={
+        "created": fields.Integer(description="Number of orders created"),
+        "failed": fields.Integer(description="Number of orders rejected"),
+        "results": fields.List(fields.Nested(bulk_order_result_model), description="Per-item results"),
     },
 )
 
@@ -69,3 +128,101 @@ update_order_status_model = orders_namespace.model(
         ),
     },
 )
+
+# BULK UPDATE ORDER STATUS SCHEMA MODEL
+bulk_update_order_status_model = orders_namespace.model(
+    name="Bulk Update Order Status",
+    model={
+        "status": fields.String(
+            required=True,
+            description="Target status of the orders",
+            enum=["PENDING", "IN_TRANSIT", "DELIVERED"],
+        ),
+        "order_ids": fields.List(
+            fields.Integer,
+            description="Ids of the orders to update. Omit to update every order matching the query filters",
+        ),
+    },
+)
+
+# BULK UPDATE ORDER STATUS RESPONSE SCHEMA MODEL
+bulk_order_status_response_model = orders_namespace.model(
+    name="Bulk Order Status Response",
+    model={
+        "status": fields.String(description="Target status of the orders"),
+        "updated": fields.List(fields.Integer, description="Ids of the updated orders"),
+        "skipped": fields.List(
+            fields.Integer,
+            description="Requested ids that were not found, not yours or not allowed to move to the status",
+        ),
+    },
+)
+
+# ORDER STATS SCHEMA MODEL
+order_stats_model = orders_namespace.model(
+    name="Order Stats",
+    model={
+        "day": fields.Date(description="Day the orders were created on (UTC)"),
+        "status": fields.String(description="Order status, when grouped by status"),
+        "size": fields.String(description="Pizza size, when grouped by size"),
+        "flavour": fields.String(description="Pizza flavour, when grouped by flavour"),
+        "orders": fields.Integer(description="Number of orders"),
+        "quantity": fields.Integer(description="Number of pizzas ordered"),
+        "revenue": fields.Float(description="Sum of the order totals"),
+    },
+)
+
+# ORDER FILTER ARGUMENTS PARSER
+order_filter_parser = reqparse.RequestParser()
+order_filter_parser.add_argument(
+    "status", type=str, location="args", choices=("PENDING", "IN_TRANSIT", "DELIVERED"),
+    help="Filter by order status",
+)
+order_filter_parser.add_argument(
+    "size", type=str, location="args", choices=("SMALL", "MEDIUM", "LARGE", "EXTRA_LARGE"),
+    help="Filter by pizza size",
+)
+order_filter_parser.add_argument(
+    "customer_id", type=int, location="args", help="Filter by customer id"
+)
+order_filter_parser.add_argument(
+    "date_from", type=inputs.datetime_from_iso8601, location="args",
+    help="Orders created at or after this ISO 8601 date",
+)
+order_filter_parser.add_argument(
+    "date_to", type=inputs.datetime_from_iso8601, location="args",
+    help="Orders created before this ISO 8601 date",
+)
+
+# ORDER LIST (PAGINATION) ARGUMENTS PARSER
+order_list_parser = order_filter_parser.copy()
+order_list_parser.add_argument(
+    "limit", type=inputs.positive, location="args", help="Page size (capped by the server)"
+)
+order_list_parser.add_argument(
+    "cursor", type=str, location="args", help="The X-Next-Cursor value of the previous page"
+)
+order_list_parser.add_argument(
+    "fields", type=str, location="args",
+    help="Only return (and load) these fields, e.g. id,status (same as the X-Fields header)",
+)
+
+# ORDER EXPORT ARGUMENTS PARSER
+order_export_parser = order_filter_parser.copy()
+order_export_parser.add_argument(
+    "format", type=str, location="args", choices=("ndjson", "csv"), default="ndjson",
+    help="Export format",
+)
+
+# ORDER STATS ARGUMENTS PARSER
+order_stats_parser = reqparse.RequestParser()
+order_stats_parser.add_argument(
+    "date_from", type=inputs.date, location="args", help="First day (ISO 8601 date)",
+)
+order_stats_parser.add_argument(
+    "date_to", type=inputs.date, location="args", help="Last day, included (ISO 8601 date)",
+)
+order_stats_parser.add_argument(
+    "by", type=str, location="args", action="split", default=["status", "size", "flavour"],
+    help="Comma separated dimensions to group the days by: status, size, flavour",
+)
@@ -1,12 +1,29 @@
-from flask import request
+from flask import request, current_app, Response, stream_with_context
 from flask_restx import Namespace, Resource, fields
 from http import HTTPStatus
 from ..models.users import User
-from ..models.orders import Order
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_current_user
-from ..orders.schemas import create_order_model, order_details_model, update_order_model, update_order_status_model
+from ..models.orders import Order, OrderArchive, OrderStatus, ORDER_STATUS_TRANSITIONS
+from ..models.stats import OrderDailyStats
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from ..auth.identity import current_identity
+from ..orders.schemas import create_order_model, order_model, order_details_model, update_order_model, update_order_status_model, order_list_parser, order_export_parser
+from ..orders.schemas import bulk_order_response_model, bulk_update_order_status_model, bulk_order_status_response_model
+from ..orders.schemas import order_filter_parser, order_stats_model, order_stats_parser
+from ..orders.export import iter_order_rows, EXPORT_GENERATORS, EXPORT_MIMETYPES
+from ..orders.events import (
+    order_event, publish_order_event, require_order_events, subscribe_order_events, order_event_response
+)
 from ..orders import orders_namespace
+from ..menu.catalog import price_order
 from ..utils import db
+from ..utils.pagination import keyset_page
+from sqlalchemy import update, func
+from sqlalchemy.orm import joinedload, selectinload
+from ..utils.ratelimit import rate_limit
+from ..utils.idempotency import idempotent
+from ..utils.http_cache import make_etag, etag_headers, not_modified
+from ..utils.serializers import masked_load_only, wants_field
+from jsonschema import Draft4Validator
 
 """
 admin access
@@ -14,15 +31,33 @@ login user access restriction
 """
 
 
+# rate limit key of an order write: the caller's identity (the JWT is already verified)
+def order_rate_keys():
+    return [f"user:{get_jwt_identity()}"]
+
+
+# eager load the nested customer of order_details_model, unless the field mask leaves it out.
+# joinedload for a single order, selectinload (one more query for the whole page) for lists
+def customer_options(strategy, entity=Order):
+    return [strategy(entity.customer)] if wants_field("customer") else []
+
+
 @orders_namespace.route("/")
 class CreateGetOrders(Resource):
 
     # Creating an order
     @orders_namespace.expect(create_order_model)
-    @orders_namespace.marshal_with(order_details_model)
-    # @orders_namespace.marshal_with(order_model)
-    @orders_namespace.doc(description="Create/place an order")
+    # above marshal_with, so a replayed Idempotency-Key is not marshalled again
+    @idempotent
+    @orders_namespace.marshal_with(order_model)
+    # @orders_namespace.marshal_with(order_details_model)
+    @orders_namespace.doc(
+        description="Create/place an order. Send an Idempotency-Key header to make retries safe: "
+        "a repeated key gets the first response back instead of creating another order.",
+        params={"Idempotency-Key": {"in": "header", "description": "A unique key per order, e.g. a UUID"}},
+    )
     @jwt_required()
+    @rate_limit("orders", order_rate_keys)
     def post(self):
         """
         Create/Place an Order
@@ -34,30 +69,41 @@ class CreateGetOrders(Resource):
         # get data and store in variables
         size = data["size"]
         flavour = data["flavour"]
-        quantity = data["quantity"]
+        quantity = data.get("quantity", 1)
+
+        # checked and priced against the cached menu, so no menu query on the hot path
+        try:
+            flavour, unit_price, total_price = price_order(flavour, size, quantity)
+        except ValueError as error:
+            orders_namespace.abort(HTTPStatus.BAD_REQUEST, str(error))
 
-        username = get_jwt_identity()
-        current_user = User.query.filter_by(username=username).first()
+        # cached identity lookup, so no user query on the hot path
+        current_user = current_identity()
 
         new_order = Order(
             size=size,
             flavour=flavour,
             quantity=quantity,
-            # # you can assign customer_id like this...
-            # customer_id=current_user.id
+            unit_price=unit_price,
+            total_price=total_price,
+            customer_id=current_user.id if current_user else None,
         )
 
-        # OR assign customer to current_user like this...
-        new_order.customer = current_user
+        # # OR assign customer to current_user like this (needs the User object)...
+        # new_order.customer = User.query.filter_by(username=get_jwt_identity()).first()
 
         new_order.save()
 
         return new_order, HTTPStatus.CREATED
 
     # Getting all orders
+    @orders_namespace.expect(order_list_parser)
     @orders_namespace.marshal_with(order_details_model)
     @orders_namespace.doc(
-        description="Get all orders from database.",
+        description="Get orders from database, newest first, one page at a time. "
+        "Pass the X-Next-Cursor response header back as ?cursor= to get the next page. "
+        "Archived orders (see `flask archive-orders`) are not listed, get them by id, "
+        "through the user order routes or in the export.",
         responses={"body": "Order list details"},
     )
     @jwt_required()
@@ -65,9 +111,190 @@ class CreateGetOrders(Resource):
         """
         Get all Orders
         """
-        orders = Order.query.all()
+        args = order_list_parser.parse_args()
+
+        # cap the page size so one request can never pull the whole table
+        limit = min(
+            args["limit"] or current_app.config["ORDERS_PAGE_SIZE"],
+            current_app.config["ORDERS_PAGE_SIZE_MAX"],
+        )
+
+        # only load the requested columns, plus the ones the cursor is built from
+        query = Order.query.options(
+            *masked_load_only(Order, Order.date_created, Order.id, Order.customer_id),
+            *customer_options(selectinload),
+        ).filter(*Order.filters_from_args(args))
+
+        try:
+            orders, next_cursor = keyset_page(
+                query, Order.date_created, Order.id, limit, args["cursor"]
+            )
+        except ValueError:
+            orders_namespace.abort(HTTPStatus.BAD_REQUEST, "Invalid cursor")
+
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+
+        return orders, HTTPStatus.OK, headers
+
+
+@orders_namespace.route("/bulk")
+class CreateBulkOrders(Resource):
+
+    # Creating many orders at once
+    @orders_namespace.expect([create_order_model])
+    @orders_namespace.marshal_with(bulk_order_response_model)
+    @orders_namespace.doc(
+        description="Create/place a list of orders in one transaction. "
+        "Invalid items are reported per index and the valid ones are still created.",
+        responses={"body": "Per-item results"},
+    )
+    @jwt_required()
+    @rate_limit("orders", order_rate_keys)
+    def post(self):
+        """
+        Create/Place many Orders
+        """
+        data = orders_namespace.payload
+
+        if not isinstance(data, list) or not data:
+            orders_namespace.abort(HTTPStatus.BAD_REQUEST, "Expected a non-empty list of orders")
+
+        if len(data) > current_app.config["ORDERS_BULK_MAX"]:
+            orders_namespace.abort(
+                HTTPStatus.BAD_REQUEST,
+                f"At most {current_app.config['ORDERS_BULK_MAX']} orders can be created at once",
+            )
+
+        # resolve the customer once for the whole batch
+        current_user = current_identity()
+        customer_id = current_user.id if current_user else None
+
+        validator = Draft4Validator(create_order_model.__schema__)
+        results = []
+        new_orders = []
+
+        for index, item in enumerate(data):
+            errors = [error.message for error in validator.iter_errors(item)]
+            if errors:
+                results.append({"index": index, "status": "failed", "errors": errors})
+                continue
+
+            quantity = item.get("quantity", 1)
+            try:
+                flavour, unit_price, total_price = price_order(item["flavour"], item["size"], quantity)
+            except ValueError as error:
+                results.append({"index": index, "status": "failed", "errors": [str(error)]})
+                continue
+
+            new_order = Order(
+                size=item["size"],
+                flavour=flavour,
+                quantity=quantity,
+                unit_price=unit_price,
+                total_price=total_price,
+                customer_id=customer_id,
+            )
+            new_orders.append(new_order)
+            results.append({"index": index, "status": "created", "order": new_order})
+
+        # one flush and one commit: the unit of work batches the INSERTs (with RETURNING ids)
+        if new_orders:
+            db.session.add_all(new_orders)
+            db.session.flush()
+
+            # read the ids before the commit expires the orders
+            for result in results:
+                if "order" in result:
+                    result["id"] = result.pop("order").id
+
+            db.session.commit()
+
+        response = {
+            "created": len(new_orders),
+            "failed": len(data) - len(new_orders),
+            "results": results,
+        }
+
+        if not new_orders:
+            return response, HTTPStatus.BAD_REQUEST
+        if len(new_orders) < len(data):
+            return response, HTTPStatus.MULTI_STATUS
+        return response, HTTPStatus.CREATED
+
+
+@orders_namespace.route("/stats")
+class OrderStats(Resource):
+
+    # Daily order stats from the rollup
+    @orders_namespace.expect(order_stats_parser)
+    @orders_namespace.marshal_with(order_stats_model, skip_none=True)
+    @orders_namespace.doc(
+        description="Order counts and revenue per day, grouped by status, size and/or flavour (staff only). "
+        "Read from the order_daily_stats rollup, refreshed by `flask rollup`.",
+        responses={"body": "One row per day and group"},
+    )
+    @jwt_required()
+    def get(self):
+        """
+        Get Daily Order Stats
+        """
+        user = current_identity()
+        if user is None or not user.is_staff:
+            orders_namespace.abort(HTTPStatus.FORBIDDEN, "Staff only")
 
-        return orders, HTTPStatus.OK
+        args = order_stats_parser.parse_args()
+
+        dimensions = [getattr(OrderDailyStats, name) for name in ("status", "size", "flavour") if name in args["by"]]
+        groups = [OrderDailyStats.day, *dimensions]
+
+        query = db.session.query(
+            *groups,
+            func.sum(OrderDailyStats.orders).label("orders"),
+            func.sum(OrderDailyStats.quantity).label("quantity"),
+            func.sum(OrderDailyStats.revenue).label("revenue"),
+        )
+        if args["date_from"]:
+            query = query.filter(OrderDailyStats.day >= args["date_from"].date())
+        if args["date_to"]:
+            query = query.filter(OrderDailyStats.day <= args["date_to"].date())
+
+        stats = query.group_by(*groups).order_by(*groups).all()
+
+        return [row._asdict() for row in stats], HTTPStatus.OK
+
+
+@orders_namespace.route("/export")
+class ExportOrders(Resource):
+
+    # Streaming order export
+    @orders_namespace.expect(order_export_parser)
+    @orders_namespace.doc(
+        description="Stream all orders matching the filters as NDJSON or CSV, "
+        "archived orders (see `flask archive-orders`) included (staff only)",
+        responses={"body": "One order per line"},
+    )
+    @jwt_required()
+    def get(self):
+        """
+        Export Orders
+        """
+        # every customer's orders, so staff only like the stats
+        user = current_identity()
+        if user is None or not user.is_staff:
+            orders_namespace.abort(HTTPStatus.FORBIDDEN, "Staff only")
+
+        args = order_export_parser.parse_args()
+
+        rows = iter_order_rows(args, current_app.config["ORDERS_EXPORT_BATCH_SIZE"])
+        body = EXPORT_GENERATORS[args["format"]](rows)
+
+        return Response(
+            stream_with_context(body),
+            mimetype=EXPORT_MIMETYPES[args["format"]],
+            headers={
+                "Content-Disposition": f"attachment; filename=orders.{args['format']}"
+            },
+        )
 
 
 @orders_namespace.route("/<int:order_id>")
@@ -79,7 +306,8 @@ class GetUpdateDeleteOrder(Resource):
     # Get Single Order Route
     @orders_namespace.marshal_with(order_details_model)
     @orders_namespace.doc(
-        description="Get an order by giving an order Id",
+        description="Get an order by giving an order Id. Send the ETag back as If-None-Match "
+        "to get a 304 Not Modified while the order is unchanged.",
         responses={"body": "Order details"},
     )
     @jwt_required()
@@ -87,13 +315,22 @@ class GetUpdateDeleteOrder(Resource):
         """
         Get an Order by Id
         """
-        order = Order.get_by_id(order_id)
+        # a poll that sends its ETag only reads the order's version
+        if request.if_none_match:
+            version = Order.version_of(order_id)
+            if version is not None:
+                response = not_modified(make_etag(order_id, version))
+                if response is not None:
+                    return response
 
-        return order, HTTPStatus.OK
+        # archived orders are read too
+        order = Order.get_by_id(order_id, *customer_options(joinedload), archived=True)
+
+        return order, HTTPStatus.OK, etag_headers(make_etag(order.id, order.updated_at))
 
     # Put/Update Order Route
     @orders_namespace.expect(update_order_model)
-    @orders_namespace.marshal_with(order_details_model)
+    @orders_namespace.marshal_with(order_model)
     @orders_namespace.doc(
         description="Update an order by giving an order Id",
         responses={"body": "Updated Order details"},
@@ -106,18 +343,25 @@ class GetUpdateDeleteOrder(Resource):
         order = Order.get_by_id(order_id)
 
         # to ensure customers only update their own order.
-        username = get_jwt_identity()
-        user = User.query.filter_by(username=username).first()
+        user = current_identity()
 
-        if user.id == order.customer_id:
+        if user is not None and user.id == order.customer_id:
 
             data = orders_namespace.payload
 
+            try:
+                flavour, unit_price, total_price = price_order(data["flavour"], data["size"], data.get("quantity"))
+            except ValueError as error:
+                orders_namespace.abort(HTTPStatus.BAD_REQUEST, str(error))
+
             order.size = data["size"]
             order.quantity = data["quantity"]
-            order.flavour = data["flavour"]
+            order.flavour = flavour
+            order.unit_price = unit_price
+            order.total_price = total_price
 
             db.session.commit()
+            publish_order_event(order.id, order.customer_id, order.status, order.updated_at)
             return order, HTTPStatus.OK
 
         response = {"message": "You are not authorized to update this order"}
@@ -130,12 +374,11 @@ class GetUpdateDeleteOrder(Resource):
         """
         Delete an Order by Id
         """
-        username = get_jwt_identity()
-        user = User.query.filter_by(username=username).first()
+        user = current_identity()
         order = Order.get_by_id(order_id)
 
         # to ensure customers only deletes their own order.
-        if user.id == order.customer_id:
+        if user is not None and user.id == order.customer_id:
             order.delete()
 
             response = {"message": f"Order: {order.id}, deleted successfully"}
@@ -145,6 +388,67 @@ class GetUpdateDeleteOrder(Resource):
         return response, HTTPStatus.UNAUTHORIZED
 
 
+# Order Events Route
+@orders_namespace.route("/<int:order_id>/events")
+class OrderEvents(Resource):
+    @orders_namespace.doc(
+        description="Follow an order's status as server-sent events instead of polling. "
+        "The current status comes first, then one \"order\" event per change, "
+        "with heartbeat comments while idle.",
+        params={"order_id": "An Id for an Order"},
+        responses={"body": "text/event-stream of order events"},
+    )
+    @jwt_required()
+    def get(self, order_id):
+        """
+        Stream an Order's Status Changes
+        """
+        require_order_events()
+        order = Order.get_by_id(order_id)
+
+        # to ensure customers only follow their own order, staff can follow any.
+        user = current_identity()
+
+        if user is not None and (user.is_staff or user.id == order.customer_id):
+            subscription = subscribe_order_events(f"order:{order_id}")
+
+            # read the current state once subscribed, so no change can fall in between
+            db.session.refresh(order)
+            current = order_event(order.id, order.customer_id, order.status, order.updated_at)
+
+            return order_event_response(subscription, initial=[current])
+
+        response = {"message": "You are not authorized to follow this order"}
+        return response, HTTPStatus.UNAUTHORIZED
+
+
+# User Order Events Route
+@orders_namespace.route("/user/<int:user_id>/events")
+class UserOrderEvents(Resource):
+    @orders_namespace.doc(
+        description="Follow the status changes of all orders of a user as server-sent events",
+        params={"user_id": "An Id for a User"},
+        responses={"body": "text/event-stream of order events"},
+    )
+    @jwt_required()
+    def get(self, user_id):
+        """
+        Stream a User's Order Status Changes
+        """
+        require_order_events()
+        # to ensure customers only follow their own orders, staff can follow anyone's.
+        user = current_identity()
+
+        if user is not None and (user.id == user_id or user.is_staff):
+            if user.id != user_id:
+                User.get_by_id(user_id)
+
+            return order_event_response(subscribe_order_events(f"user:{user_id}"))
+
+        response = {"message": "You are not authorized to follow these orders"}
+        return response, HTTPStatus.UNAUTHORIZED
+
+
 # Get Specific Order By User Route
 @orders_namespace.route("/user/<int:user_id>/order/<int:order_id>/")
 class GetSpecificOrderByUser(Resource):
@@ -162,8 +466,16 @@ class GetSpecificOrderByUser(Resource):
         """
         Get a Specific Order by User
         """
-        user = User.get_by_id(user_id)
-        order = Order.query.filter_by(id=order_id).filter_by(customer=user).first()
+        # the order with its customer, the user is only looked up (for a 404) when there is no order
+        order = Order.query.options(*customer_options(joinedload)).filter_by(id=order_id, customer_id=user_id).first()
+        if order is None:
+            order = (
+                OrderArchive.query.options(*customer_options(joinedload, OrderArchive))
+                .filter_by(id=order_id, customer_id=user_id)
+                .first()
+            )
+        if order is None:
+            User.get_by_id(user_id)
 
         return order, HTTPStatus.OK
 
@@ -173,7 +485,8 @@ class GetSpecificOrderByUser(Resource):
 class GetAllOrdersByUser(Resource):
     @orders_namespace.marshal_with(order_details_model)
     @orders_namespace.doc(
-        description="Get all orders by giving an user Id",
+        description="Get all orders by giving an user Id. Send the ETag back as If-None-Match "
+        "to get a 304 Not Modified while none of the orders changed.",
         params={"user_id": "An Id for an User"},
         responses={"body": "User Orders list details"},
     )
@@ -182,10 +495,29 @@ class GetAllOrdersByUser(Resource):
         """
         Get all Orders by User
         """
+        # the list changes whenever an order is added, updated, deleted or archived
+        # (archived orders never change)
+        version = Order.list_version_of_customer(user_id)
+        etag = make_etag("user-orders", user_id, *version)
+
+        # an empty list may belong to a user that does not exist, which is a 404 instead
+        if version[1]:
+            response = not_modified(etag)
+            if response is not None:
+                return response
+
         # list of user orders by Id
         user = User.get_by_id(user_id)
 
-        user_orders = user.orders
+        # archived orders (older, all delivered) first. The customer is joined in: `user`
+        # is gone from the session's (weak) identity map by the time the orders are marshalled
+        user_orders = (
+            OrderArchive.query.options(*customer_options(joinedload, OrderArchive))
+            .filter_by(customer_id=user.id)
+            .order_by(OrderArchive.date_created, OrderArchive.id)
+            .all()
+            + Order.query.options(*customer_options(joinedload)).filter_by(customer_id=user.id).all()
+        )
 
         # # OR
         # user_orders = Order.query.filter_by(customer=user).all()
@@ -196,16 +528,17 @@ class GetAllOrdersByUser(Resource):
         # # OR
         # user_orders = Order.query.filter(Order.customer==user).all()
 
-        return user_orders, HTTPStatus.OK
+        return user_orders, HTTPStatus.OK, etag_headers(etag)
 
 
 # Patch/Update Order Route
 @orders_namespace.route("/<int:order_id>/status")
 class UpdateOrderStatus(Resource):
     @orders_namespace.expect(update_order_status_model)
-    @orders_namespace.marshal_with(order_details_model)
+    @orders_namespace.marshal_with(order_model)
     @orders_namespace.doc(
-        description="Update an order status by giving an order Id",
+        description="Update an order status by giving an order Id. Only forward transitions "
+        "are allowed (PENDING -> IN_TRANSIT -> DELIVERED), others get 409 Conflict.",
         params={"order_id": "An Id for an Order"},
         responses={"body": "Order details with Updated Status"},
         enum=["PENDING", "IN_TRANSIT", "DELIVERED"],
@@ -218,14 +551,25 @@ class UpdateOrderStatus(Resource):
         order = Order.get_by_id(order_id)
 
         # to ensure customers only update their own order status.
-        username = get_jwt_identity()
-        user = User.query.filter_by(username=username).first()
+        user = current_identity()
 
-        if user.id == order.customer_id:
+        if user is not None and user.id == order.customer_id:
 
             data = orders_namespace.payload
-            order.status = data["status"]
+            try:
+                status = OrderStatus[data["status"]]
+            except (KeyError, TypeError):
+                orders_namespace.abort(HTTPStatus.BAD_REQUEST, "Invalid status")
+
+            # the same forward-only transitions as the bulk update
+            if status not in ORDER_STATUS_TRANSITIONS.get(order.status, ()):
+                orders_namespace.abort(
+                    HTTPStatus.CONFLICT, f"An order cannot move from {order.status.name} to {status.name}"
+                )
+
+            order.status = status
             order.update()
+            publish_order_event(order.id, order.customer_id, order.status, order.updated_at)
 
             # # OR
 
@@ -247,3 +591,75 @@ class UpdateOrderStatus(Resource):
 
         response = {"message": "You are not authorized to update this order status"}
         return response, HTTPStatus.UNAUTHORIZED
+
+
+# Bulk Patch/Update Order Status Route
+@orders_namespace.route("/status")
+class BulkUpdateOrderStatus(Resource):
+    @orders_namespace.expect(bulk_update_order_status_model, order_filter_parser)
+    @orders_namespace.marshal_with(bulk_order_status_response_model)
+    @orders_namespace.doc(
+        description="Move many orders to a status with one UPDATE. Give either order_ids in "
+        "the body or the list filters as query parameters. Staff can update any order, "
+        "customers only their own, and only forward transitions are applied "
+        "(PENDING -> IN_TRANSIT -> DELIVERED).",
+        responses={"body": "Updated and skipped order ids"},
+    )
+    @jwt_required()
+    def patch(self):
+        """
+        Update many Order Statuses
+        """
+        data = orders_namespace.payload or {}
+        args = order_filter_parser.parse_args()
+
+        try:
+            status = OrderStatus[data.get("status")]
+        except (KeyError, TypeError):
+            orders_namespace.abort(HTTPStatus.BAD_REQUEST, "Invalid status")
+
+        order_ids = data.get("order_ids")
+        if order_ids is not None and not (
+            isinstance(order_ids, list) and all(isinstance(id, int) for id in order_ids)
+        ):
+            orders_namespace.abort(HTTPStatus.BAD_REQUEST, "order_ids must be a list of integers")
+
+        filters = Order.filters_from_args(args)
+
+        # refuse to update every order in the table by accident
+        if not order_ids and not filters:
+            orders_namespace.abort(
+                HTTPStatus.BAD_REQUEST, "Give order_ids or at least one filter"
+            )
+
+        user = current_identity()
+        if user is None:
+            return {"status": status.name, "updated": [], "skipped": order_ids or []}, HTTPStatus.OK
+
+        clauses = filters + [Order.status.in_(Order.statuses_allowed_before(status))]
+        if order_ids:
+            clauses.append(Order.id.in_(order_ids))
+
+        # to ensure customers only update their own orders.
+        if not user.is_staff:
+            clauses.append(Order.customer_id == user.id)
+
+        # one set-based UPDATE instead of a get, check and commit per order
+        statement = (
+            update(Order)
+            .where(*clauses)
+            .values(status=status)
+            .returning(Order.id, Order.customer_id, Order.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+        rows = db.session.execute(statement).all()
+        db.session.commit()
+
+        for row in rows:
+            publish_order_event(row.id, row.customer_id, status, row.updated_at)
+        updated = sorted(row.id for row in rows)
+
+        skipped = sorted(set(order_ids or []) - set(updated))
+
+        response = {"status": status.name, "updated": updated, "skipped": skipped}
+        return response, HTTPStatus.OK
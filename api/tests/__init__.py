@@ -1,9 +1,111 @@
+import os
+import time
 import unittest
+from collections import namedtuple
 
 from flask import current_app
+from flask.testing import FlaskClient
+from sqlalchemy import event
+from werkzeug.exceptions import HTTPException
 from .. import create_app
 from ..config.config import config_dict
 from ..utils import db
+from .budgets import Budget, DEFAULT_BUDGET, ROUTE_BUDGETS
+
+# what one request did: SQL statements run, ORM rows hydrated (loaded or refreshed) and wall time
+RequestProfile = namedtuple(
+    "RequestProfile", ["method", "path", "endpoint", "status_code", "statements", "rows", "seconds"]
+)
+
+# profiles being recorded, the ORM load events count their rows
+_recording = []
+
+
+@event.listens_for(db.Model, "load", propagate=True)
+@event.listens_for(db.Model, "refresh", propagate=True)
+def _count_row(target, context, *args):
+    for rows in _recording:
+        rows[0] += 1
+
+
+class ProfilingClient(FlaskClient):
+    """
+    A test client profiling every request (see self.profiles), and failing any
+    request that goes over the budget declared for its route in budgets.py, so
+    N+1 query patterns and other regressions fail the tests.
+
+    Statement and row budgets are always checked. Time budgets depend on the
+    machine, so they are only checked when the TEST_TIME_BUDGET_FACTOR
+    environment variable is set, and are multiplied by it (e.g. 1 on a
+    dedicated benchmark runner, 3 on a slow one).
+    """
+
+    budgets = ROUTE_BUDGETS
+    # replaces the route budgets when set, e.g. to test the guard itself
+    budget_override = None
+    # None leaves the time budgets unchecked
+    time_factor = float(os.environ["TEST_TIME_BUDGET_FACTOR"]) if os.environ.get("TEST_TIME_BUDGET_FACTOR") else None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profiles = []
+
+    def open(self, *args, **kwargs):
+        statements = []
+        listener = lambda conn, cursor, statement, *rest: statements.append(statement)
+        rows = [0]
+
+        with self.application.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", listener)
+        _recording.append(rows)
+        started = time.perf_counter()
+        try:
+            response = super().open(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - started
+            _recording.remove(rows)
+            for engine in engines:
+                event.remove(engine, "before_cursor_execute", listener)
+
+        method, path = response.request.method, response.request.path
+        profile = RequestProfile(
+            method, path, self.endpoint_of(method, path), response.status_code, statements, rows[0], seconds
+        )
+        self.profiles.append(profile)
+        self.check_budget(profile)
+        return response
+
+    def statements_since(self, start):
+        """
+        SQL statements of the requests made after the first start profiles, e.g.
+        start = len(client.profiles) before making them.
+        """
+        return [statement for profile in self.profiles[start:] for statement in profile.statements]
+
+    def endpoint_of(self, method, path):
+        try:
+            return self.application.url_map.bind("localhost").match(path, method=method)[0]
+        except HTTPException:
+            return None
+
+    def check_budget(self, profile):
+        budget = self.budget_override or self.budgets.get((profile.method, profile.endpoint), DEFAULT_BUDGET)
+
+        over = []
+        if budget.queries is not None and len(profile.statements) > budget.queries:
+            over.append(f"{len(profile.statements)} SQL statements (max {budget.queries})")
+        if budget.rows is not None and profile.rows > budget.rows:
+            over.append(f"{profile.rows} rows hydrated (max {budget.rows})")
+        if budget.ms is not None and self.time_factor is not None and profile.seconds * 1000 > budget.ms * self.time_factor:
+            over.append(f"{profile.seconds * 1000:.0f} ms (max {budget.ms * self.time_factor:.0f})")
+
+        if over:
+            raise AssertionError(
+                f"{profile.method} {profile.path} ({profile.endpoint}) went over its budget: "
+                + ", ".join(over) + "\n" + "\n".join(profile.statements)
+            )
 
 
 class UnitTestCase(unittest.TestCase):
@@ -12,7 +114,8 @@ class UnitTestCase(unittest.TestCase):
         self.app = create_app(config=config_dict["test"])
         self.app_ctxt = self.app.app_context()
         self.app_ctxt.push()
-        # using a test client
+        # using a test client that holds every request to its route's budget
+        self.app.test_client_class = ProfilingClient
         self.client = self.app.test_client()
         db.create_all()
 
@@ -0,0 +1,56 @@
+"""
+Per-route budgets of the test requests, checked by ProfilingClient.
+
+Each route (method and endpoint) gets the most SQL statements, ORM rows
+hydrated and milliseconds one request may take. They are sized for the
+data the tests create, with a little headroom, so a change that adds a
+query per row or loads far more than before fails the tests. Raise a
+budget in the same change that needs it, with the reason. Milliseconds
+are only checked when TEST_TIME_BUDGET_FACTOR is set (see ProfilingClient).
+"""
+
+from collections import namedtuple
+
+# None leaves a dimension unchecked
+Budget = namedtuple("Budget", ["queries", "rows", "ms"])
+
+# routes without a budget of their own (menu, monitoring, docs)
+DEFAULT_BUDGET = Budget(queries=10, rows=None, ms=None)
+
+ROUTE_BUDGETS = {
+    # auth namespace
+    ("POST", "Auth_sign_up"): Budget(queries=2, rows=1, ms=250),
+    # the user, and the rehash of an outdated password hash
+    ("POST", "Auth_login"): Budget(queries=3, rows=2, ms=250),
+    # the token version, on a version cache miss
+    ("POST", "Auth_refresh"): Budget(queries=1, rows=0, ms=100),
+    ("POST", "Auth_logout"): Budget(queries=2, rows=1, ms=100),
+    ("GET", "Auth_get_users"): Budget(queries=1, rows=20, ms=250),
+    # users, then the orders of all of them
+    ("GET", "Auth_get_users_with_orders"): Budget(queries=2, rows=40, ms=250),
+    ("GET", "Auth_get_user"): Budget(queries=1, rows=1, ms=100),
+    # orders namespace
+    # idempotency key claim and store, the menu on a catalog cache miss, the insert
+    ("POST", "Orders_create_get_orders"): Budget(queries=8, rows=1, ms=250),
+    # one page of orders (ORDERS_PAGE_SIZE) and their customers
+    ("GET", "Orders_create_get_orders"): Budget(queries=2, rows=100, ms=500),
+    # results are plain dicts, nothing is hydrated
+    ("POST", "Orders_create_bulk_orders"): Budget(queries=4, rows=0, ms=250),
+    ("GET", "Orders_order_stats"): Budget(queries=2, rows=0, ms=250),
+    # the caller (staff only) for tokens without claims, column tuples through a server-side cursor
+    ("GET", "Orders_export_orders"): Budget(queries=2, rows=0, ms=250),
+    # the version (If-None-Match), the order joined with its customer, the archive on a miss
+    ("GET", "Orders_get_update_delete_order"): Budget(queries=3, rows=2, ms=250),
+    ("PUT", "Orders_get_update_delete_order"): Budget(queries=5, rows=2, ms=250),
+    ("DELETE", "Orders_get_update_delete_order"): Budget(queries=3, rows=1, ms=250),
+    # the order, then again once subscribed so no change falls in between
+    ("GET", "Orders_order_events"): Budget(queries=2, rows=2, ms=250),
+    ("GET", "Orders_user_order_events"): Budget(queries=1, rows=1, ms=250),
+    ("GET", "Orders_get_specific_order_by_user"): Budget(queries=3, rows=2, ms=250),
+    # the list version, the user, archived and live orders
+    ("GET", "Orders_get_all_orders_by_user"): Budget(queries=4, rows=50, ms=250),
+    # the order, the update, the order again for the response (expired by the commit)
+    ("PATCH", "Orders_update_order_status"): Budget(queries=3, rows=2, ms=250),
+    # one UPDATE ... RETURNING
+    ("PATCH", "Orders_bulk_update_order_status"): Budget(queries=2, rows=0, ms=250),
+}
@@ -1,6 +1,13 @@
+import csv
+import io
+import json
+import logging
 from flask_jwt_extended import create_access_token
 from . import UnitTestCase
+from .budgets import Budget
 from ..models.orders import Order, OrderSizes
+from ..models.users import User
+from ..utils import db
 
 
 def get_auth_token_headers(identity):
@@ -41,6 +48,30 @@ class OrderTestCase(UnitTestCase):
         assert response.json["quantity"] == 2
         assert response.json["flavour"] == "Chicken Suya"
 
+    # testing that quantities other than whole numbers of at least 1 are rejected
+    def test_order_quantity_validation(self):
+        User(username="testuser", email="testuser@test.com", password_hash="hash").save()
+        headers = get_auth_token_headers("testuser")
+        data = {"size": "SMALL", "flavour": "Pepperoni"}
+
+        for quantity in [-5, 0, "2", 1.5, True, None]:
+            response = self.client.post("/orders/", headers=headers, json={**data, "quantity": quantity})
+            assert response.status_code == 400, quantity
+            assert "not a valid quantity" in response.json["message"]
+
+            response = self.client.post("/orders/bulk", headers=headers, json=[{**data, "quantity": quantity}])
+            assert response.json["results"][0]["status"] == "failed", quantity
+        assert Order.query.count() == 0
+
+        # to assert a missing quantity means one pizza
+        response = self.client.post("/orders/", headers=headers, json=data)
+        assert response.status_code == 201
+        assert response.json["quantity"] == 1
+
+        response = self.client.put(f"/orders/{response.json['id']}", headers=headers, json={**data, "quantity": -5})
+        assert response.status_code == 400
+        assert Order.query.one().quantity == 1
+
     # testing get one order route
     def test_get_order_by_id(self):
         # to create a test order in the test database
@@ -79,3 +110,810 @@ class OrderTestCase(UnitTestCase):
         assert (
             response.json["error"] == "Not Found"
         )  # the customized error in the error handler for 404.
+
+    # testing cursor pagination of the get all orders route
+    def test_get_all_orders_paginated(self):
+        for flavour in ["Pepperoni", "Margherita", "Chicken Suya", "Veggie", "Hawaiian"]:
+            Order(size="SMALL", quantity=1, flavour=flavour).save()
+
+        headers = get_auth_token_headers("testuser")
+        response = self.client.get("/orders/?limit=2", headers=headers)
+        assert response.status_code == 200
+        assert len(response.json) == 2
+        # newest orders come first
+        assert [order["flavour"] for order in response.json] == ["Hawaiian", "Veggie"]
+
+        # to walk the remaining pages with the returned cursor
+        seen = [order["id"] for order in response.json]
+        cursor = response.headers["X-Next-Cursor"]
+        while cursor:
+            response = self.client.get(f"/orders/?limit=2&cursor={cursor}", headers=headers)
+            assert response.status_code == 200
+            seen += [order["id"] for order in response.json]
+            cursor = response.headers.get("X-Next-Cursor")
+
+        assert sorted(seen) == [order.id for order in Order.query.all()]
+        assert len(set(seen)) == 5
+
+    # testing server-side filters of the get all orders route
+    def test_get_all_orders_filtered(self):
+        Order(size="SMALL", quantity=1, flavour="Pepperoni").save()
+        Order(size="LARGE", quantity=1, flavour="Margherita").save()
+        Order(size="LARGE", quantity=1, flavour="Veggie", status="DELIVERED").save()
+
+        headers = get_auth_token_headers("testuser")
+        response = self.client.get("/orders/?size=LARGE&status=PENDING", headers=headers)
+        assert response.status_code == 200
+        assert [order["flavour"] for order in response.json] == ["Margherita"]
+
+        response = self.client.get("/orders/?status=UNKNOWN", headers=headers)
+        assert response.status_code == 400
+
+        response = self.client.get("/orders/?cursor=not-a-cursor", headers=headers)
+        assert response.status_code == 400
+
+    # testing the streaming export route
+    def test_export_orders(self):
+        User(username="testuser", email="testuser@test.com", password_hash="hash").save()
+        User(username="staffuser", email="staffuser@test.com", password_hash="hash", is_staff=True).save()
+        Order(size="SMALL", quantity=1, flavour="Pepperoni").save()
+        Order(size="LARGE", quantity=3, flavour="Margherita").save()
+
+        # to assert customers cannot export everyone's orders
+        response = self.client.get("/orders/export", headers=get_auth_token_headers("testuser"))
+        assert response.status_code == 403
+
+        headers = get_auth_token_headers("staffuser")
+        response = self.client.get("/orders/export", headers=headers)
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert [line["flavour"] for line in lines] == ["Pepperoni", "Margherita"]
+        assert lines[1]["size"] == "LARGE"
+        assert lines[1]["quantity"] == 3
+
+        response = self.client.get("/orders/export?format=csv&size=LARGE", headers=headers)
+        assert response.status_code == 200
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        assert [row["flavour"] for row in rows] == ["Margherita"]
+
+    # testing the bulk create order route
+    def test_create_bulk_orders(self):
+        data = [
+            {"size": "SMALL", "quantity": 1, "flavour": "Pepperoni"},
+            {"size": "HUGE", "quantity": 1, "flavour": "Margherita"},
+            {"size": "LARGE", "flavour": "Veggie"},
+        ]
+
+        response = self.client.post(
+            "/orders/bulk", headers=get_auth_token_headers("testuser"), json=data
+        )
+        # to count the INSERT statements issued for the batch
+        statements = self.client.profiles[-1].statements
+
+        # to assert partial failure is reported per item
+        assert response.status_code == 207
+        assert response.json["created"] == 2
+        assert response.json["failed"] == 1
+        results = response.json["results"]
+        assert [result["status"] for result in results] == ["created", "failed", "created"]
+        assert results[1]["errors"]
+
+        orders = Order.query.order_by(Order.id).all()
+        assert [order.id for order in orders] == [results[0]["id"], results[2]["id"]]
+        assert orders[1].quantity == 1
+        assert len([s for s in statements if s.startswith("INSERT INTO orders")]) == 1
+        assert not [s for s in statements if "FROM orders" in s]
+
+        response = self.client.post(
+            "/orders/bulk", headers=get_auth_token_headers("testuser"), json=[{"size": "HUGE"}]
+        )
+        assert response.status_code == 400
+
+    # testing the bulk order status route
+    def test_bulk_update_order_status(self):
+        customer = User(username="testuser", email="testuser@test.com", password_hash="hash")
+        other = User(username="otheruser", email="otheruser@test.com", password_hash="hash")
+        staff = User(username="staffuser", email="staffuser@test.com", password_hash="hash", is_staff=True)
+        for user in (customer, other, staff):
+            user.save()
+
+        mine = Order(size="SMALL", flavour="Pepperoni", customer_id=customer.id)
+        delivered = Order(size="SMALL", flavour="Veggie", customer_id=customer.id, status="DELIVERED")
+        theirs = Order(size="SMALL", flavour="Margherita", customer_id=other.id)
+        for order in (mine, delivered, theirs):
+            order.save()
+        mine_id, delivered_id, theirs_id = mine.id, delivered.id, theirs.id
+
+        # customers only move their own orders and never backwards
+        data = {"status": "IN_TRANSIT", "order_ids": [mine_id, delivered_id, theirs_id]}
+        response = self.client.patch(
+            "/orders/status", headers=get_auth_token_headers("testuser"), json=data
+        )
+        assert response.status_code == 200
+        assert response.json["updated"] == [mine_id]
+        assert response.json["skipped"] == [delivered_id, theirs_id]
+        assert db.session.get(Order, delivered_id).status.name == "DELIVERED"
+
+        # staff can update any order matching the query filters
+        response = self.client.patch(
+            f"/orders/status?customer_id={other.id}",
+            headers=get_auth_token_headers("staffuser"),
+            json={"status": "DELIVERED"},
+        )
+        assert response.status_code == 200
+        assert response.json["updated"] == [theirs_id]
+        assert db.session.get(Order, theirs_id).status.name == "DELIVERED"
+
+        # a bulk update needs ids or a filter
+        response = self.client.patch(
+            "/orders/status", headers=get_auth_token_headers("staffuser"), json={"status": "DELIVERED"}
+        )
+        assert response.status_code == 400
+
+        # a status that is not a string is rejected, not a server error
+        response = self.client.patch(
+            "/orders/status", headers=get_auth_token_headers("staffuser"), json={"status": ["DELIVERED"]}
+        )
+        assert response.status_code == 400
+
+        # the single order route refuses the same backward moves
+        response = self.client.patch(
+            f"/orders/{delivered_id}/status", headers=get_auth_token_headers("testuser"), json={"status": "PENDING"}
+        )
+        assert response.status_code == 409
+        assert db.session.get(Order, delivered_id).status.name == "DELIVERED"
+
+    # testing that the order listings are answered from the indexes
+    def test_order_queries_use_indexes(self):
+        def query_plan(query):
+            statement = query.statement.compile(db.engine, compile_kwargs={"literal_binds": True})
+            rows = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {statement}")).all()
+            return " ".join(row[-1] for row in rows)
+
+        plan = query_plan(
+            Order.query.filter_by(customer_id=1).order_by(Order.date_created.desc())
+        )
+        assert "ix_orders_customer_id_date_created" in plan
+        assert "TEMP B-TREE" not in plan
+
+        plan = query_plan(
+            Order.query.filter(Order.status == "PENDING").order_by(Order.date_created.desc())
+        )
+        assert "ix_orders_status_date_created" in plan
+
+        plan = query_plan(Order.query.order_by(Order.date_created.desc(), Order.id.desc()))
+        assert "ix_orders_date_created_id" in plan
+
+    # testing the per-route metrics exposed on /metrics
+    def test_metrics(self):
+        User(username="testuser", email="testuser@test.com", password_hash="hash").save()
+        User(username="staffuser", email="staffuser@test.com", password_hash="hash", is_staff=True).save()
+        Order(size="SMALL", quantity=1, flavour="Pepperoni").save()
+        Order(size="LARGE", quantity=1, flavour="Veggie").save()
+        staff_headers = get_auth_token_headers("staffuser")
+
+        response = self.client.get("/orders/", headers=get_auth_token_headers("testuser"))
+        assert response.status_code == 200
+        # a streamed body is recorded once sent (the server closes it), with the statements it ran
+        response = self.client.get("/orders/export", headers=staff_headers)
+        assert len(response.get_data(as_text=True).splitlines()) == 2
+        response.close()
+
+        # to assert the metrics are staff only
+        assert self.client.get("/metrics").status_code == 401
+        assert self.client.get("/metrics", headers=get_auth_token_headers("testuser")).status_code == 403
+
+        response = self.client.get("/metrics", headers=staff_headers)
+        assert response.status_code == 200
+        text = response.get_data(as_text=True)
+        assert 'http_request_duration_seconds_count{resource="CreateGetOrders",method="GET"} 1' in text
+        assert 'db_statements_per_request_sum{resource="CreateGetOrders",method="GET"} 1.0' in text
+        assert 'http_response_size_bytes_count{resource="CreateGetOrders",method="GET"} 1' in text
+        assert 'http_request_duration_seconds_count{resource="ExportOrders",method="GET"} 1' in text
+        # the caller (tokens without claims), then the orders
+        assert 'db_statements_per_request_sum{resource="ExportOrders",method="GET"} 2.0' in text
+
+    # testing the structured slow query log
+    def test_slow_sql_log(self):
+        from .. import create_app
+        from ..config.config import config_dict
+
+        class SlowLogConfig(config_dict["test"]):
+            SQL_LOG_SLOW_MS = 0
+
+        app = create_app(config=SlowLogConfig)
+        with app.app_context():
+            db.create_all()
+            with self.assertLogs("api.sql", level="WARNING") as logs:
+                app.test_client().get("/orders/", headers=get_auth_token_headers("testuser"))
+
+        record = logs.records[-1]
+        assert record.sql["endpoint"] == "Orders_create_get_orders"
+        assert record.sql["method"] == "GET"
+        assert "FROM orders" in record.sql["statement"]
+        assert "parameters" in record.sql
+        assert json.loads(logging.getLogger("api.sql").handlers[0].format(record))["slow"] is True
+
+        # to assert another app logs in its own format, and a failed statement does not upset the timing
+        class TextLogConfig(SlowLogConfig):
+            SQL_LOG_FORMAT = "text"
+
+        app = create_app(config=TextLogConfig)
+        with app.app_context():
+            with self.assertRaises(Exception):
+                db.session.execute(db.text("SELECT * FROM missing_table"))
+            db.session.rollback()
+            with self.assertLogs("api.sql", level="WARNING") as logs:
+                db.session.execute(db.text("SELECT 1"))
+
+        record = logs.records[-1]
+        assert record.sql["statement"] == "SELECT 1"
+        line = logging.getLogger("api.sql").handlers[0].format(record)
+        assert "WARNING slow query" in line
+        assert f"duration_ms={record.sql['duration_ms']}" in line
+        assert "parameters=" in line
+        assert line.endswith("statement=SELECT 1")
+
+        with app.test_request_context("/orders/", method="GET"):
+            app.preprocess_request()
+            with self.assertLogs("api.sql", level="WARNING") as logs:
+                db.session.execute(db.text("SELECT\n  2"))
+            db.session.rollback()
+        line = logging.getLogger("api.sql").handlers[0].format(logs.records[-1])
+        assert "endpoint=Orders_create_get_orders method=GET" in line
+        assert line.endswith("statement=SELECT 2")
+
+    # testing that the compiled serializer matches flask-restx marshalling
+    def test_compiled_serializer_matches_marshal(self):
+        from flask_restx import marshal
+        from ..auth.schemas import user_model
+        from ..orders.schemas import order_details_model, bulk_order_response_model
+        from ..utils.serializers import compile_serializer
+
+        user = User(username="testuser", email="testuser@test.com", password_hash="hash")
+        user.save()
+        order = Order(size="LARGE", quantity=3, flavour="Pepperoni", customer_id=user.id)
+        order.save()
+        bulk = {"created": 1, "failed": 1, "results": [
+            {"index": 0, "status": "created", "id": 1},
+            {"index": 1, "status": "failed", "errors": ["'size' is a required property"]},
+        ]}
+
+        for model, obj in [
+            (order_details_model, order),
+            (order_details_model, Order(flavour="Veggie")),
+            (order_details_model, {"message": "You are not authorized to update this order"}),
+            (user_model, user),
+            (bulk_order_response_model, bulk),
+        ]:
+            assert compile_serializer(model)(obj) == marshal(obj, model)
+
+        # to assert the endpoint output is the same with the fast path switched off
+        headers = get_auth_token_headers("testuser")
+        fast = self.client.get(f"/orders/{order.id}", headers=headers).json
+        self.app.config["FAST_SERIALIZER"] = False
+        slow = self.client.get(f"/orders/{order.id}", headers=headers).json
+        assert fast == slow
+
+    # testing the order creation rate limit
+    def test_create_order_rate_limit(self):
+        self.app.config["ORDERS_RATE_LIMIT"] = 1
+        data = {"size": "SMALL", "quantity": 1, "flavour": "Pepperoni"}
+        headers = get_auth_token_headers("testuser")
+
+        assert self.client.post("/orders/", headers=headers, json=data).status_code == 201
+        assert self.client.post("/orders/", headers=headers, json=data).status_code == 429
+        assert self.client.post("/orders/bulk", headers=headers, json=[data]).status_code == 429
+        assert len(Order.query.all()) == 1
+
+    # testing that GET requests read from the replica, except right after the client wrote
+    def test_reads_go_to_replica(self):
+        import os
+        import tempfile
+        from .. import create_app
+        from ..config.config import config_dict
+
+        directory = tempfile.mkdtemp()
+
+        class ReplicaConfig(config_dict["test"]):
+            SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(directory, "primary.sqlite3")
+            SQLALCHEMY_BINDS = {"replica": "sqlite:///" + os.path.join(directory, "replica.sqlite3")}
+
+        app = create_app(config=ReplicaConfig)
+        # binds register a metadata on the shared db, drop it so later apps do not look for the replica
+        self.addCleanup(db.metadatas.pop, "replica", None)
+        with app.app_context():
+            db.create_all()
+            # the replica has the schema but has not caught up with any rows yet
+            db.metadata.create_all(db.engines["replica"])
+            order = Order(size="SMALL", quantity=1, flavour="Pepperoni")
+            order.save()
+            order_id = order.id
+
+        client = app.test_client()
+        headers = get_auth_token_headers("testuser")
+        assert client.get(f"/orders/{order_id}", headers=headers).status_code == 404
+
+        data = {"size": "MEDIUM", "quantity": 2, "flavour": "Veggie"}
+        assert client.post("/orders/", headers=headers, json=data).status_code == 201
+
+        # to assert the writer reads its own writes from the primary, others still read the replica
+        assert client.get(f"/orders/{order_id}", headers=headers).status_code == 200
+        assert len(client.get("/orders/", headers=headers).json) == 2
+        assert client.get("/orders/", headers=get_auth_token_headers("otheruser")).json == []
+
+        # to assert a refreshed token of the same user still reads from the primary
+        with app.app_context():
+            refreshed = {"Authorization": f"Bearer {create_access_token(identity='testuser', fresh=True)}"}
+        assert len(client.get("/orders/", headers=refreshed).json) == 2
+        assert app.extensions["replica_sticky"].get("replica:user:testuser")
+
+    # testing ETags and conditional GETs of an order and a user's order list
+    def test_order_etags(self):
+        user = User(username="testuser", email="testuser@test.com", password_hash="hash")
+        user.save()
+        order = Order(size="SMALL", quantity=1, flavour="Pepperoni", customer_id=user.id)
+        order.save()
+        headers = get_auth_token_headers("testuser")
+
+        for path in [f"/orders/{order.id}", f"/orders/user/{user.id}/orders"]:
+            response = self.client.get(path, headers=headers)
+            etag = response.headers["ETag"]
+            assert response.status_code == 200
+
+            # to assert a matching If-None-Match gets an empty 304 after one query
+            cached = self.client.get(path, headers={**headers, "If-None-Match": etag})
+            assert cached.status_code == 304
+            assert cached.data == b""
+            assert cached.headers["ETag"] == etag
+            assert len(self.client.profiles[-1].statements) == 1
+
+            # to assert a status change, even a set-based one, gives a new ETag
+            status = "DELIVERED" if "user" in path else "IN_TRANSIT"
+            self.client.patch(f"/orders/status?customer_id={user.id}", headers=headers, json={"status": status})
+            changed = self.client.get(path, headers={**headers, "If-None-Match": etag})
+            assert changed.status_code == 200
+            assert changed.headers["ETag"] != etag
+
+        # to assert a new order changes the list ETag
+        etag = self.client.get(f"/orders/user/{user.id}/orders", headers=headers).headers["ETag"]
+        self.client.post("/orders/", headers=headers, json={"size": "SMALL", "quantity": 1, "flavour": "Veggie"})
+        response = self.client.get(f"/orders/user/{user.id}/orders", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert len(response.json) == 2
+
+    # testing the server-sent order events stream
+    def test_order_events(self):
+        from ..utils.events import MemoryBroker
+
+        self.app.config["EVENTS_HEARTBEAT_SECONDS"] = 0.01
+        user = User(username="testuser", email="testuser@test.com", password_hash="hash")
+        user.save()
+        order = Order(size="SMALL", quantity=1, flavour="Pepperoni", customer_id=user.id)
+        order.save()
+        headers = get_auth_token_headers("testuser")
+
+        response = self.client.get(f"/orders/{order.id}/events", headers=headers, buffered=False)
+        user_response = self.client.get(f"/orders/user/{user.id}/events", headers=headers, buffered=False)
+        assert response.mimetype == "text/event-stream"
+        stream, user_stream = iter(response.response), iter(user_response.response)
+
+        # to assert the current status comes first, then each committed change
+        first = next(stream).decode()
+        assert first.startswith("event: order\ndata: ")
+        assert json.loads(first.split("data: ")[1])["status"] == "OrderStatus.PENDING"
+
+        self.client.patch(f"/orders/{order.id}/status", headers=headers, json={"status": "IN_TRANSIT"})
+        self.client.patch(f"/orders/status?customer_id={user.id}", headers=headers, json={"status": "DELIVERED"})
+        for events in (stream, user_stream):
+            chunks = [chunk.decode() for chunk, _ in zip(events, range(4))]
+            statuses = [json.loads(chunk.split("data: ")[1])["status"] for chunk in chunks if "data: " in chunk]
+            assert statuses == ["OrderStatus.IN_TRANSIT", "OrderStatus.DELIVERED"]
+            # heartbeats while idle (the test client may already have read one when the stream opened)
+            assert ": heartbeat\n\n" in chunks
+
+        # to assert a closed connection unsubscribes
+        broker = self.app.extensions["events"]
+        response.close()
+        user_response.close()
+        assert broker.subscriber_count(f"order:{order.id}") == 0
+        assert broker.subscriber_count(f"user:{user.id}") == 0
+
+        # to assert a slow reader only keeps the newest messages
+        subscription = MemoryBroker().subscribe(["order:1"], maxsize=2)
+        for i in range(3):
+            subscription.broker.publish("order:1", i)
+        assert subscription.get(0) == [1, 2]
+        assert subscription.dropped == 1
+
+        # to assert the streams answer 503 where they are disabled, the sync and gthread presets
+        self.app.config["EVENTS_ENABLED"] = False
+        assert self.client.get(f"/orders/{order.id}/events", headers=headers).status_code == 503
+        assert self.client.get(f"/orders/user/{user.id}/events", headers=headers).status_code == 503
+
+    # testing field projection (fields= / X-Fields) and response compression
+    def test_fields_projection_and_compression(self):
+        import gzip
+
+        user = User(username="testuser", email="testuser@test.com", password_hash="hash")
+        user.save()
+        db.session.add_all(Order(size="SMALL", flavour="Veggie", customer_id=user.id) for _ in range(30))
+        db.session.commit()
+        headers = get_auth_token_headers("testuser")
+
+        start = len(self.client.profiles)
+        by_param = self.client.get("/orders/?fields=id,status", headers=headers)
+        by_header = self.client.get("/orders/", headers={**headers, "X-Fields": "{id,status}"})
+        users = self.client.get("/auth/users?fields=username", headers=headers)
+        statements = self.client.statements_since(start)
+
+        # to assert only the requested fields are returned, and only their columns selected
+        assert by_param.json == by_header.json
+        assert set(by_param.json[0]) == {"id", "status"}
+        assert users.json == [{"username": "testuser"}]
+        selects = [statement for statement in statements if "FROM orders" in statement or "FROM users" in statement]
+        assert all("orders.flavour" not in statement for statement in selects)
+        assert all("users.password_hash" not in statement for statement in selects)
+
+        # to assert large responses are gzipped for clients accepting it, small ones are not
+        response = self.client.get("/orders/", headers={**headers, "Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert json.loads(gzip.decompress(response.data)) == self.client.get("/orders/", headers=headers).json
+        small = self.client.get("/orders/?limit=1", headers={**headers, "Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in small.headers
+
+        # to assert a compressed ETag still revalidates
+        self.app.config["COMPRESS_MIN_SIZE"] = 0
+        order_id = by_param.json[0]["id"]
+        response = self.client.get(f"/orders/{order_id}", headers={**headers, "Accept-Encoding": "gzip"})
+        etag = response.headers["ETag"]
+        assert etag.endswith('-gzip"')
+        response = self.client.get(f"/orders/{order_id}", headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304
+
+    # testing that nested customers are eager loaded instead of one query per order
+    def test_customers_are_eager_loaded(self):
+        users = [User(username=f"user{i}", email=f"user{i}@test.com", password_hash="hash") for i in range(15)]
+        db.session.add_all(users)
+        db.session.flush()
+        db.session.add_all(Order(size="SMALL", flavour="Veggie", customer_id=user.id) for user in users)
+        db.session.commit()
+        headers = get_auth_token_headers("testuser")
+
+        start = len(self.client.profiles)
+        orders = self.client.get("/orders/", headers=headers).json
+        order = self.client.get(f"/orders/{orders[0]['id']}", headers=headers).json
+        users_with_orders = self.client.get("/auth/users/orders", headers=headers).json
+        statements = self.client.statements_since(start)
+
+        assert {order["customer"]["username"] for order in orders} == {user.username for user in users}
+        assert order["customer"]["id"] == orders[0]["customer"]["id"]
+        assert all(len(user["orders"]) == 1 for user in users_with_orders)
+        # orders + their customers, one order joined with its customer, users + their orders
+        assert len(statements) == 2 + 1 + 2
+
+        # to assert the query guard fails a request going over its budget
+        self.client.budget_override = Budget(queries=1, rows=None, ms=None)
+        with self.assertRaises(AssertionError):
+            self.client.get("/orders/", headers=headers)
+
+    # testing the daily stats rollup, its incremental refresh and the stats route
+    def test_order_stats_rollup(self):
+        from datetime import datetime, timedelta
+        from ..models.stats import OrderDailyStats
+
+        staff = User(username="testuser", email="testuser@test.com", password_hash="hash", is_staff=True)
+        staff.save()
+        db.session.add_all([
+            Order(size="SMALL", flavour="Veggie", quantity=2, total_price=20, date_created=datetime(2026, 1, 1, 10)),
+            Order(size="SMALL", flavour="Veggie", quantity=1, total_price=10, date_created=datetime(2026, 1, 1, 23)),
+            Order(size="LARGE", flavour="Pepperoni", quantity=3, total_price=45, date_created=datetime(2026, 1, 2, 8)),
+        ])
+        db.session.commit()
+
+        # without the safety window, to see exactly what each refresh picks up
+        self.app.config["ROLLUP_SAFETY_SECONDS"] = 0
+        runner = self.app.test_cli_runner()
+        assert "Recomputed 2 day(s)" in runner.invoke(args=["rollup"]).output
+        assert "Recomputed 0 day(s)" in runner.invoke(args=["rollup"]).output
+
+        # to assert an order committed after the mark moved past its updated_at is only
+        # picked up by scanning the safety window behind the mark
+        late = Order(size="SMALL", flavour="Veggie", quantity=1, date_created=datetime(2026, 1, 3, 9),
+                     updated_at=datetime.utcnow() - timedelta(seconds=60))
+        late.save()
+        assert "Recomputed 0 day(s)" in runner.invoke(args=["rollup"]).output
+        self.app.config["ROLLUP_SAFETY_SECONDS"] = 300
+        runner.invoke(args=["rollup"])
+        assert OrderDailyStats.query.filter_by(day=datetime(2026, 1, 3).date()).count() == 1
+        late.delete()
+        runner.invoke(args=["rollup", "--full"])
+        self.app.config["ROLLUP_SAFETY_SECONDS"] = 0
+
+        # to assert only the day of a changed order is recomputed, with its new status
+        order = Order.query.filter_by(flavour="Pepperoni").one()
+        order.status = "DELIVERED"
+        db.session.commit()
+        assert "Recomputed 1 day(s)" in runner.invoke(args=["rollup"]).output
+        assert OrderDailyStats.query.filter_by(flavour="Pepperoni").one().status == "DELIVERED"
+
+        headers = get_auth_token_headers("testuser")
+        response = self.client.get("/orders/stats?by=size&date_to=2026-01-01", headers=headers)
+        assert response.status_code == 200
+        assert response.json == [
+            {"day": "2026-01-01", "size": "SMALL", "orders": 2, "quantity": 3, "revenue": 30.0}
+        ]
+
+        response = self.client.get("/orders/stats", headers=headers)
+        assert len(response.json) == 2
+        assert response.json[1] == {
+            "day": "2026-01-02", "status": "DELIVERED", "size": "LARGE", "flavour": "Pepperoni",
+            "orders": 1, "quantity": 3, "revenue": 45.0,
+        }
+
+        # to assert a deleted order is taken out of its day by the next incremental refresh
+        order = Order.query.filter_by(flavour="Veggie", quantity=1).one()
+        order.customer_id = staff.id
+        db.session.commit()
+        assert "Recomputed 1 day(s)" in runner.invoke(args=["rollup"]).output
+        assert self.client.delete(f"/orders/{order.id}", headers=headers).status_code == 200
+        assert "Recomputed 1 day(s)" in runner.invoke(args=["rollup"]).output
+        assert "Recomputed 0 day(s)" in runner.invoke(args=["rollup"]).output
+        stats = OrderDailyStats.query.filter_by(day=datetime(2026, 1, 1).date()).one()
+        assert (stats.orders, stats.quantity, stats.revenue) == (1, 2, 20)
+
+        # to assert the stats are staff only
+        response = self.client.get("/orders/stats", headers=get_auth_token_headers("otheruser"))
+        assert response.status_code == 403
+
+    # testing that a repeated Idempotency-Key replays the first response
+    def test_create_order_idempotency_key(self):
+        from ..models.idempotency import IdempotencyKey
+
+        data = {"size": "SMALL", "quantity": 1, "flavour": "Pepperoni"}
+        headers = {**get_auth_token_headers("testuser"), "Idempotency-Key": "order-1"}
+
+        first = self.client.post("/orders/", headers=headers, json=data)
+        assert first.status_code == 201
+        assert "Idempotent-Replayed" not in first.headers
+
+        # to assert retries, from the cache and then from the table, write and marshal nothing
+        start = len(self.client.profiles)
+        cached = self.client.post("/orders/", headers=headers, json=data)
+        self.app.extensions["idempotency_cache"].clear()
+        stored = self.client.post("/orders/", headers=headers, json=data)
+        statements = self.client.statements_since(start)
+
+        for retry in (cached, stored):
+            assert retry.status_code == 201
+            assert retry.headers["Idempotent-Replayed"] == "true"
+            assert retry.json == first.json
+        assert not [statement for statement in statements if not statement.startswith("SELECT")]
+        assert len(Order.query.all()) == 1
+
+        # to assert a key reused with another body is rejected
+        response = self.client.post("/orders/", headers=headers, json={**data, "quantity": 2})
+        assert response.status_code == 422
+
+        # to assert a duplicate of a request still in progress is refused
+        db.session.add(IdempotencyKey(scope="Orders_create_get_orders:testuser", key="order-2", fingerprint="x"))
+        db.session.commit()
+        response = self.client.post("/orders/", headers={**headers, "Idempotency-Key": "order-2"}, json=data)
+        assert response.status_code == 409
+        assert len(Order.query.all()) == 1
+
+        # to assert a claim left by a request that died is taken over once its lease ran out
+        from datetime import datetime, timedelta
+
+        claimed_at = datetime.utcnow() - timedelta(seconds=self.app.config["IDEMPOTENCY_LOCK_SECONDS"] + 1)
+        IdempotencyKey.query.filter_by(key="order-2").update({"claimed_at": claimed_at})
+        db.session.commit()
+        response = self.client.post("/orders/", headers={**headers, "Idempotency-Key": "order-2"}, json=data)
+        assert response.status_code == 201
+        assert len(Order.query.all()) == 2
+        replay = self.client.post("/orders/", headers={**headers, "Idempotency-Key": "order-2"}, json=data)
+        assert replay.headers["Idempotent-Replayed"] == "true"
+        assert replay.json == response.json
+
+        # to assert a failed request releases its key
+        self.app.config["ORDERS_RATE_LIMIT"] = 0
+        response = self.client.post("/orders/", headers={**headers, "Idempotency-Key": "order-3"}, json=data)
+        assert response.status_code == 429
+        assert IdempotencyKey.query.filter_by(key="order-3").first() is None
+
+    # testing that old delivered orders move to the archive and can still be read
+    def test_archive_orders(self):
+        from datetime import datetime, timedelta
+        from ..models.orders import OrderArchive
+        from ..models.stats import OrderDailyStats
+
+        user = User(username="testuser", email="testuser@test.com", password_hash="hash", is_staff=True)
+        user.save()
+        old = datetime.utcnow() - timedelta(days=60)
+        db.session.add_all([
+            Order(flavour="Veggie", status="DELIVERED", date_created=old, customer=user),
+            Order(flavour="Veggie", status="DELIVERED", date_created=old, customer=user),
+            Order(flavour="Pepperoni", status="PENDING", date_created=old, customer=user),
+            Order(flavour="Pepperoni", status="DELIVERED", customer=user),
+        ])
+        db.session.commit()
+
+        runner = self.app.test_cli_runner()
+        runner.invoke(args=["rollup"])
+        output = runner.invoke(args=["archive-orders", "--batch-size", "1"]).output
+        assert "Archived 2 order(s)" in output
+
+        assert sorted(order.id for order in Order.query.all()) == [3, 4]
+        assert sorted(order.id for order in OrderArchive.query.all()) == [1, 2]
+
+        # to assert archived orders are read through
+        headers = get_auth_token_headers("testuser")
+        response = self.client.get("/orders/1", headers=headers)
+        assert response.status_code == 200
+        assert response.json["status"] == "OrderStatus.DELIVERED"
+        assert response.json["customer"]["username"] == "testuser"
+
+        response = self.client.get(f"/orders/user/{user.id}/order/2/", headers=headers)
+        assert response.json["id"] == 2
+
+        response = self.client.get(f"/orders/user/{user.id}/orders", headers=headers)
+        assert [order["id"] for order in response.json] == [1, 2, 3, 4]
+
+        # to assert the export has the whole history, with the filters applied to the archive too
+        response = self.client.get("/orders/export", headers=headers)
+        assert [json.loads(line)["id"] for line in response.data.decode().splitlines()] == [1, 2, 3, 4]
+        response = self.client.get("/orders/export?status=DELIVERED", headers=headers)
+        assert [json.loads(line)["id"] for line in response.data.decode().splitlines()] == [1, 2, 4]
+
+        # to assert archived orders cannot be changed
+        response = self.client.delete("/orders/1", headers=headers)
+        assert response.status_code == 404
+
+        # to assert recomputing a day keeps its archived orders
+        Order.query.filter_by(id=3).one().status = "DELIVERED"
+        db.session.commit()
+        runner.invoke(args=["rollup"])
+        stats = OrderDailyStats.query.filter_by(day=old.date()).all()
+        assert sum(row.orders for row in stats) == 3
+        runner.invoke(args=["rollup", "--full"])
+        assert sum(row.orders for row in OrderDailyStats.query.all()) == 4
+
+    # testing that orders are checked against the cached menu and priced when written
+    def test_menu_prices_orders(self):
+        from ..models.menu import Flavour, MenuVersion
+
+        User(username="testuser", email="testuser@test.com", password_hash="hash", is_staff=True).save()
+        headers = get_auth_token_headers("testuser")
+
+        # to assert any flavour is taken, unpriced, while the menu is empty
+        data = {"size": "SMALL", "quantity": 2, "flavour": "Anything"}
+        response = self.client.post("/orders/", headers=headers, json=data)
+        assert response.status_code == 201
+        assert response.json["total_price"] is None
+
+        # to assert free, negative and boolean prices are rejected
+        for price in (0, -1, True, "8.5"):
+            flavour = {"name": "Pepperoni", "prices": [{"size": "SMALL", "price": price}]}
+            assert self.client.post("/menu/", headers=headers, json=flavour).status_code == 400
+
+        flavour = {"name": "Pepperoni", "prices": [{"size": "SMALL", "price": 8.5}, {"size": "LARGE", "price": 14}]}
+        response = self.client.post("/menu/", headers=headers, json=flavour)
+        assert response.status_code == 201
+        assert response.json["prices"] == [{"size": "SMALL", "price": 8.5}, {"size": "LARGE", "price": 14.0}]
+
+        # to assert orders are validated and priced without reading the menu tables
+        response = self.client.post("/orders/", headers=headers, json={**data, "flavour": "pepperoni"})
+        assert response.status_code == 201
+        assert response.json["flavour"] == "Pepperoni"
+        assert response.json["unit_price"] == 8.5
+        assert response.json["total_price"] == 17.0
+        assert not [s for s in self.client.profiles[-1].statements if "flavours" in s or "menu_version" in s]
+
+        response = self.client.post("/orders/", headers=headers, json=data)
+        assert response.status_code == 400
+        response = self.client.post("/orders/", headers=headers, json={**data, "flavour": "Pepperoni", "size": "MEDIUM"})
+        assert response.status_code == 400
+
+        response = self.client.post("/orders/bulk", headers=headers, json=[
+            {"size": "LARGE", "quantity": 1, "flavour": "Pepperoni"}, data,
+        ])
+        assert response.status_code == 207
+        assert response.json["results"][1]["errors"] == ["'Anything' is not on the menu"]
+
+        # to assert a change made by another worker is seen once the version is checked again
+        db.session.add(Flavour(name="Veggie"))
+        db.session.query(MenuVersion).update({MenuVersion.version: MenuVersion.version + 1})
+        db.session.commit()
+        assert len(self.client.get("/menu/", headers=headers).json) == 1
+        self.app.extensions["menu_catalog"].checked_until = 0
+        assert [item["name"] for item in self.client.get("/menu/", headers=headers).json] == ["Pepperoni", "Veggie"]
+
+        # to assert an unavailable flavour cannot be ordered
+        response = self.client.put("/menu/1", headers=headers, json={**flavour, "is_available": False})
+        assert response.status_code == 200
+        response = self.client.post("/orders/", headers=headers, json={**data, "flavour": "Pepperoni"})
+        assert response.status_code == 400
+
+        # to assert the revenue is rolled up from the stored totals
+        self.app.test_cli_runner().invoke(args=["rollup"])
+        response = self.client.get("/orders/stats?by=flavour", headers=headers)
+        assert {row["flavour"]: row["revenue"] for row in response.json}["Pepperoni"] == 31.0
+
+        # to assert the menu is for staff to change
+        response = self.client.post("/menu/", headers=get_auth_token_headers("otheruser"), json=flavour)
+        assert response.status_code == 403
+
+    # testing that every auth and orders route has a budget, and that requests are held to it
+    def test_route_budgets(self):
+        from .budgets import ROUTE_BUDGETS
+
+        for rule in self.app.url_map.iter_rules():
+            if rule.endpoint.startswith(("Auth_", "Orders_")):
+                for method in rule.methods - {"HEAD", "OPTIONS"}:
+                    assert (method, rule.endpoint) in ROUTE_BUDGETS, f"no budget for {method} {rule.rule}"
+
+        from ..auth.passwords import hash_password
+
+        user = User(username="testuser", email="testuser@test.com", password_hash=hash_password("password"),
+                    is_staff=True, is_active=True)
+        db.session.add(user)
+        db.session.add_all(Order(size="SMALL", flavour="Veggie", customer=user) for _ in range(3))
+        db.session.commit()
+        user_id = user.id
+        login = {"email": "testuser@test.com", "password": "password"}
+        tokens = self.client.post("/auth/login", json=login).json
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        order = {"size": "MEDIUM", "quantity": 2, "flavour": "Pepperoni"}
+        # the event streams are closed after their first chunk
+        self.app.config["EVENTS_HEARTBEAT_SECONDS"] = 0.01
+
+        # to assert every route stays within its budget. The session is emptied before each
+        # request, as a served request starts with one, so lazy loads are not hidden
+        requests = [
+            ("POST", "/auth/signup", {"username": "other", "email": "other@test.com", "password": "password"}),
+            ("POST", "/auth/login", login),
+            ("GET", "/auth/users", None),
+            ("GET", "/auth/users/orders", None),
+            ("GET", f"/auth/user/{user_id}", None),
+            ("POST", "/orders/", order),
+            ("GET", "/orders/", None),
+            ("POST", "/orders/bulk", [order, order]),
+            ("GET", "/orders/stats", None),
+            ("GET", "/orders/export", None),
+            ("GET", "/orders/1", None),
+            ("PUT", "/orders/1", {"size": "LARGE", "quantity": 1, "flavour": "Veggie"}),
+            ("GET", "/orders/1/events", None),
+            ("GET", f"/orders/user/{user_id}/events", None),
+            ("GET", f"/orders/user/{user_id}/order/1/", None),
+            ("GET", f"/orders/user/{user_id}/orders", None),
+            ("PATCH", "/orders/1/status", {"status": "IN_TRANSIT"}),
+            ("PATCH", f"/orders/status?customer_id={user_id}", {"status": "IN_TRANSIT"}),
+            ("DELETE", "/orders/2", None),
+        ]
+        for method, path, body in requests:
+            db.session.expunge_all()
+            response = self.client.open(path, method=method, headers=headers, json=body, buffered=False)
+            response.close()
+            assert response.status_code < 400, f"{method} {path}: {response.status_code}"
+        db.session.expunge_all()
+        refresh = {"Authorization": f"Bearer {tokens['refresh_token']}"}
+        assert self.client.post("/auth/refresh", headers=refresh).status_code == 200
+        assert self.client.post("/auth/logout", headers=headers).status_code == 200
+        driven = {(profile.method, profile.endpoint) for profile in self.client.profiles}
+        assert driven >= set(ROUTE_BUDGETS), f"not driven: {set(ROUTE_BUDGETS) - driven}"
+
+        headers = get_auth_token_headers("testuser")
+        self.client.get("/orders/", headers=headers)
+        profile = self.client.profiles[-1]
+        assert (profile.method, profile.endpoint, profile.status_code) == ("GET", "Orders_create_get_orders", 200)
+        # the five orders left and their customer, once
+        assert profile.rows == 6
+        assert len(profile.statements) == 2
+
+        # to assert the guard fails a request hydrating more rows than its budget
+        self.client.budget_override = Budget(queries=None, rows=3, ms=None)
+        with self.assertRaises(AssertionError):
+            self.client.get("/orders/", headers=headers)
@@ -1,5 +1,6 @@
 from . import UnitTestCase
 from ..models.users import User
+from ..utils import db
 
 
 class UserTestCase(UnitTestCase):
@@ -26,3 +27,239 @@ class UserTestCase(UnitTestCase):
 
         response = self.client.post("/auth/login", json=data)
         assert response.status_code == 200
+
+    # testing the cached identity lookup used by the order routes
+    def test_identity_lookup_is_cached(self):
+        from flask_jwt_extended import create_access_token
+
+        user = User(username="testuser", email="testuser@test.com", password_hash="hash")
+        user.save()
+
+        headers = {"Authorization": f"Bearer {create_access_token(identity='testuser')}"}
+        data = {"size": "SMALL", "quantity": 1, "flavour": "Pepperoni"}
+
+        response = self.client.post("/orders/", headers=headers, json=data)
+        assert response.status_code == 201
+
+        # to count the user lookups made by the next request
+        response = self.client.post("/orders/", headers=headers, json=data)
+        assert response.status_code == 201
+        assert not [s for s in self.client.profiles[-1].statements if "FROM users" in s]
+
+        # to assert that changing a user drops the cached identity
+        cache = self.app.extensions["user_cache"]
+        assert cache.get("testuser").id == user.id
+        user.is_staff = True
+        user.save()
+        assert cache.get("testuser") is None
+
+    # testing the connection pool stats route
+    def test_pool_stats(self):
+        from flask_jwt_extended import create_access_token
+
+        User(username="staffuser", email="staff@test.com", password_hash="hash", is_staff=True).save()
+        User(username="testuser", email="testuser@test.com", password_hash="hash").save()
+
+        headers = {"Authorization": f"Bearer {create_access_token(identity='testuser')}"}
+        response = self.client.get("/monitoring/pool", headers=headers)
+        assert response.status_code == 403
+
+        headers = {"Authorization": f"Bearer {create_access_token(identity='staffuser')}"}
+        response = self.client.get("/monitoring/pool", headers=headers)
+        assert response.status_code == 200
+        assert response.json[0]["bind"] == "default"
+        assert response.json[0]["pool"]
+
+    # testing that login upgrades hashes made with older settings
+    def test_login_rehashes_password(self):
+        from werkzeug.security import generate_password_hash
+
+        old_hash = generate_password_hash("password", method="pbkdf2:sha256:500")
+        User(username="testuser", email="testuser@test.com", password_hash=old_hash).save()
+
+        data = {"email": "testuser@test.com", "password": "password"}
+        response = self.client.post("/auth/login", json=data)
+        assert response.status_code == 201
+        assert "access_token" in response.json
+
+        user = User.query.filter_by(email="testuser@test.com").first()
+        assert user.password_hash.startswith(self.app.config["PASSWORD_HASH_METHOD"] + "$")
+
+    # testing hashing in the process pool and on the gevent hub's threads
+    def test_password_hasher_process_pool(self):
+        from ..auth.passwords import PasswordHasher
+
+        hasher = PasswordHasher("pbkdf2:sha256:1000", salt_length=8, workers=1)
+        try:
+            pwhash = hasher.hash("password")
+            assert pwhash.startswith("pbkdf2:sha256:1000$")
+            assert hasher.verify(pwhash, "password")
+            assert not hasher.verify(pwhash, "wrong")
+            assert not hasher.needs_rehash(pwhash)
+            assert PasswordHasher("pbkdf2:sha256", salt_length=8).needs_rehash(pwhash)
+        finally:
+            hasher.shutdown()
+
+        # to assert the gevent preset hashes on the hub's threads, and other greenlets run meanwhile
+        import gevent
+
+        hasher = PasswordHasher("pbkdf2:sha256:200000", salt_length=8, workers=1, pool="gevent")
+        ticks = []
+        ticker = gevent.spawn(lambda: [ticks.append(gevent.sleep(0.001)) for _ in range(1000)])
+        pwhash = hasher.hash("password")
+        assert hasher.verify(pwhash, "password")
+        assert ticks
+        ticker.kill()
+
+    # testing login throttling
+    def test_login_rate_limit(self):
+        self.app.config["LOGIN_RATE_LIMIT"] = 3
+        data = {"email": "testuser@test.com", "password": "wrong"}
+
+        for _ in range(3):
+            response = self.client.post("/auth/login", json=data)
+            assert response.status_code != 429
+
+        # to assert the 4th attempt is rejected before any DB work
+        response = self.client.post("/auth/login", json=data)
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert self.client.profiles[-1].statements == []
+
+    # testing that clients behind the same proxy are throttled apart
+    def test_login_rate_limit_behind_proxy(self):
+        from .. import create_app
+        from ..config.config import config_dict
+
+        class ProxiedConfig(config_dict["test"]):
+            PROXY_FIX_HOPS = 1
+            LOGIN_RATE_LIMIT = 2
+
+        app = create_app(config=ProxiedConfig)
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+        data = {"email": "testuser@test.com", "password": "wrong"}
+        # both clients reach the app from the router's address
+        proxied = lambda ip: {"environ_base": {"REMOTE_ADDR": "10.1.0.1"}, "headers": {"X-Forwarded-For": ip}}
+
+        for _ in range(2):
+            assert client.post("/auth/login", json=data, **proxied("203.0.113.1")).status_code != 429
+        assert client.post("/auth/login", json=data, **proxied("203.0.113.1")).status_code == 429
+        # to assert a spoofed X-Forwarded-For entry before the router's is not trusted
+        assert client.post("/auth/login", json=data, **proxied("198.51.100.9, 203.0.113.1")).status_code == 429
+
+        data = {"email": "other@test.com", "password": "wrong"}
+        assert client.post("/auth/login", json=data, **proxied("203.0.113.2")).status_code != 429
+
+    # testing the sliding window limiter on the redis backend
+    def test_sliding_window_limiter_redis_backend(self):
+        from ..utils.ratelimit import RedisBackend, SlidingWindowLimiter
+
+        limiter = SlidingWindowLimiter(RedisBackend(FakeRedis()))
+        results = [limiter.hit("login:ip:127.0.0.1", limit=2, window=60)[0] for _ in range(3)]
+        assert results == [True, True, False]
+        assert limiter.hit("login:ip:10.0.0.1", limit=2, window=60)[0]
+
+    # testing that tokens carry claims and can be revoked
+    def test_token_claims_and_revocation(self):
+        from ..auth.passwords import hash_password
+
+        user = User(username="testuser", email="testuser@test.com", password_hash=hash_password("password"),
+                    is_active=True)
+        user.save()
+        login = {"email": "testuser@test.com", "password": "password"}
+        tokens = self.client.post("/auth/login", json=login).json
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+        # to assert an authorized request resolves the user from the claims, without a user query
+        response = self.client.post("/orders/", headers=headers, json={"size": "SMALL", "flavour": "Veggie", "quantity": 1})
+        assert response.status_code == 201
+        assert not [s for s in self.client.profiles[-1].statements if "FROM users" in s]
+
+        # to assert a refreshed token keeps the claims
+        refreshed = self.client.post(
+            "/auth/refresh", headers={"Authorization": f"Bearer {tokens['refresh_token']}"}
+        ).json["access_token"]
+        assert self.client.get("/orders/1", headers={"Authorization": f"Bearer {refreshed}"}).status_code == 200
+
+        # to assert a logout revokes the token sent only
+        assert self.client.post("/auth/logout", headers=headers).status_code == 200
+        assert self.client.get("/orders/1", headers=headers).status_code == 401
+        assert self.client.get("/orders/1", headers={"Authorization": f"Bearer {refreshed}"}).status_code == 200
+
+        # to assert the logout outlives rate limiter traffic, which has a store of its own
+        from ..utils.ratelimit import MemoryBackend
+
+        limiter = self.app.extensions["ratelimiter"]
+        limiter.backend = MemoryBackend(maxsize=2)
+        for i in range(10):
+            limiter.hit(f"login:ip:10.0.0.{i}", limit=5, window=60)
+        assert self.client.get("/orders/1", headers=headers).status_code == 401
+
+        # to assert deactivating a user revokes all their tokens
+        user.is_active = False
+        user.save()
+        assert self.client.get("/orders/1", headers={"Authorization": f"Bearer {refreshed}"}).status_code == 401
+        response = self.client.post("/auth/refresh", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+        assert response.status_code == 401
+
+        # to assert a logout everywhere revokes the other tokens too
+        tokens = self.client.post("/auth/login", json=login).json
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        assert self.client.get("/orders/1", headers=headers).status_code == 200
+        self.client.post("/auth/logout?everywhere=true", headers=headers)
+        response = self.client.post("/auth/refresh", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+        assert response.status_code == 401
+
+    # testing the per-worker denylist, and that it is refused with several workers
+    def test_memory_denylist(self):
+        import time
+        from .. import create_app
+        from ..auth.tokens import MemoryDenylist
+        from ..config.config import config_dict
+
+        denylist = MemoryDenylist()
+        now = time.time()
+        denylist.add("old", now - 10)
+        denylist.add("reused", now - 5)
+        denylist.add("reused", now + 60)
+        denylist.add("live", now + 30)
+        # to assert the next add drops the expired entries only, by expiry order
+        denylist.add("new", now + 60)
+        assert len(denylist) == 3
+        assert "old" not in denylist
+        assert "reused" in denylist and "live" in denylist and "new" in denylist
+
+        class SeveralWorkersConfig(config_dict["test"]):
+            GUNICORN_WORKERS = 2
+
+        with self.assertRaises(RuntimeError):
+            create_app(config=SeveralWorkersConfig)
+
+
+class FakeRedis:
+    """
+    A local stand-in for the Redis commands used by RedisBackend.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+
+    def pipeline(self):
+        return self
+
+    def incr(self, key):
+        self.commands.append(lambda: self.data.__setitem__(key, self.data.get(key, 0) + 1) or self.data[key])
+
+    def expire(self, key, seconds):
+        self.commands.append(lambda: True)
+
+    def execute(self):
+        results = [command() for command in self.commands]
+        self.commands = []
+        return results
+
+    def get(self, key):
+        return self.data.get(key)
@@ -0,0 +1,60 @@
+import gzip
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional, responses are only gzipped without it
+    brotli = None
+
+# content codings this app can produce, in order of preference
+CONTENT_CODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(data, coding, level):
+    if coding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level)
+
+
+def init_compression(app):
+    """
+    Compress responses with the best coding the client accepts (Accept-Encoding).
+
+    Only buffered responses of COMPRESS_MIMETYPES from COMPRESS_MIN_SIZE bytes up
+    are compressed, streams (exports, server-sent events) are sent as they are.
+    A strong ETag gets the coding appended, as the compressed bytes differ.
+    """
+    if not app.config["COMPRESS_ENABLED"]:
+        return
+
+    mimetypes = set(app.config["COMPRESS_MIMETYPES"])
+
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype not in mimetypes:
+            return response
+        response.vary.add("Accept-Encoding")
+
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+
+        coding = request.accept_encodings.best_match(CONTENT_CODINGS)
+        data = response.get_data()
+        if coding is None or len(data) < current_app.config["COMPRESS_MIN_SIZE"]:
+            return response
+
+        level = current_app.config["COMPRESS_BR_QUALITY" if coding == "br" else "COMPRESS_GZIP_LEVEL"]
+        response.set_data(compress(data, coding, level))
+        response.headers["Content-Encoding"] = coding
+
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f"{etag}-{coding}")
+
+        return response
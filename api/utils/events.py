@@ -0,0 +1,174 @@
+"""
+Publish/subscribe for server-sent events.
+
+A subscription is a bounded buffer and a condition, so an idle subscriber
+costs a few hundred bytes and a waiting thread (a greenlet with the gevent
+preset, which is how many thousands of streams fit in one worker). Slow
+readers lose their oldest buffered messages instead of growing without
+bound.
+
+MemoryBroker only reaches subscribers of the same process. RedisBroker
+publishes through Redis and fans the messages out to the local
+subscribers of every worker.
+"""
+
+import json
+import os
+import threading
+from collections import deque
+
+
+class Subscription:
+    """
+    Messages of some channels waiting to be read by one connection.
+    """
+
+    def __init__(self, broker, channels, maxsize):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.dropped = 0
+        self._messages = deque(maxlen=maxsize)
+        self._ready = threading.Condition(threading.Lock())
+
+    def put(self, message):
+        with self._ready:
+            if len(self._messages) == self._messages.maxlen:
+                self.dropped += 1
+            self._messages.append(message)
+            self._ready.notify()
+
+    def get(self, timeout):
+        """
+        Wait up to timeout seconds for messages.
+        :return: the buffered messages, oldest first, or [] on timeout
+        """
+        with self._ready:
+            if not self._messages:
+                self._ready.wait(timeout)
+            messages = list(self._messages)
+            self._messages.clear()
+        return messages
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class MemoryBroker:
+    """
+    In-process broker, for a single worker.
+    """
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels, maxsize=100):
+        subscription = Subscription(self, channels, maxsize)
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._channels.get(channel, ()))
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+
+class RedisBroker(MemoryBroker):
+    """
+    Broker sharing messages between workers and nodes through Redis pub/sub.
+
+    Messages must be JSON serializable. Each process runs one listener thread,
+    started with its first subscription.
+    """
+
+    def __init__(self, client, prefix="events"):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self._listener_pid = None
+
+    @classmethod
+    def from_url(cls, url):
+        try:
+            import redis
+        except ImportError as error:
+            raise RuntimeError("EVENTS_BROKER=redis needs the redis package") from error
+        return cls(redis.Redis.from_url(url))
+
+    def publish(self, channel, message):
+        self.client.publish(f"{self.prefix}:{channel}", json.dumps(message))
+
+    def subscribe(self, channels, maxsize=100):
+        self._start_listener()
+        return super().subscribe(channels, maxsize)
+
+    def _start_listener(self):
+        # per process, so gunicorn workers do not rely on a thread of the master
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(f"{self.prefix}:*")
+        threading.Thread(target=self._listen, args=(pubsub,), daemon=True).start()
+
+    def _listen(self, pubsub):
+        for item in pubsub.listen():
+            channel = item["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            self._deliver(channel.partition(":")[2], json.loads(item["data"]))
+
+
+def format_event(data, event=None):
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def event_stream(subscription, heartbeat, event=None, initial=()):
+    """
+    Generate a text/event-stream body from a subscription until the client disconnects.
+
+    A comment line is sent after heartbeat idle seconds, so proxies keep the
+    connection open and dead clients are noticed on the next write.
+    """
+    try:
+        for data in initial:
+            yield format_event(data, event)
+        while True:
+            messages = subscription.get(heartbeat)
+            if not messages:
+                yield ": heartbeat\n\n"
+            for data in messages:
+                yield format_event(data, event)
+    finally:
+        subscription.close()
+
+
+def init_events(app):
+    if app.config["EVENTS_BROKER"] == "redis":
+        broker = RedisBroker.from_url(app.config["EVENTS_REDIS_URL"])
+    else:
+        broker = MemoryBroker()
+    app.extensions["events"] = broker
@@ -0,0 +1,34 @@
+import hashlib
+from http import HTTPStatus
+from flask import Response, request
+from .compression import CONTENT_CODINGS
+from .serializers import request_mask
+
+# authenticated responses: browsers and proxies must revalidate and never share them
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*version):
+    """
+    Strong ETag (unquoted) of a representation, from the version of what it shows.
+
+    The field mask of the request is part of it, since it changes the body.
+    """
+    mask = request_mask()
+    return hashlib.sha1(repr(version + (mask,)).encode()).hexdigest()
+
+
+def etag_headers(etag):
+    return {"ETag": f'"{etag}"', "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(etag):
+    """
+    :return: a 304 response if the client already has this ETag (If-None-Match), else None
+    """
+    # If-None-Match compares weakly, so W/"..." from a client matches too.
+    # compressed responses carry the ETag with the coding appended (see compression.py)
+    for candidate in [etag] + [f"{etag}-{coding}" for coding in CONTENT_CODINGS]:
+        if request.if_none_match.contains_weak(candidate):
+            return Response(status=HTTPStatus.NOT_MODIFIED, headers=etag_headers(candidate))
+    return None
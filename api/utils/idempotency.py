@@ -0,0 +1,171 @@
+"""
+Idempotency-Key support, so clients can retry a POST without repeating it.
+
+The first request with a key claims it by inserting an idempotency_keys row
+(unique per scope and key) before running the handler, and stores the
+serialized response in it afterwards. A retry with the same key gets that
+response back, from the process-level cache when it is there, else from the
+table, without running the handler or marshalling again. A duplicate that
+arrives while the first request still runs gets 409 Conflict, so exactly one
+of them does the work. A claim is a lease of IDEMPOTENCY_LOCK_SECONDS: a
+worker killed mid-request never releases its key, so a retry after that
+takes the key over instead of getting 409 until the key expires.
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+import click
+from flask import Response, current_app, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_restx.utils import unpack
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import BadRequest, Conflict, UnprocessableEntity
+from werkzeug.wrappers import Response as BaseResponse
+from . import db
+from .cache import TTLCache
+from ..models.idempotency import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+MAX_KEY_LENGTH = 255
+
+
+def init_idempotency(app):
+    app.extensions["idempotency_cache"] = TTLCache(
+        maxsize=app.config["IDEMPOTENCY_CACHE_SIZE"], ttl=app.config["IDEMPOTENCY_CACHE_TTL"]
+    )
+
+    @app.cli.command("purge-idempotency-keys")
+    def purge_command():
+        """Delete idempotency keys older than IDEMPOTENCY_TTL."""
+        click.echo(f"Deleted {purge_expired_keys()} expired idempotency key(s).")
+
+
+def purge_expired_keys():
+    expired = datetime.utcnow() - timedelta(seconds=current_app.config["IDEMPOTENCY_TTL"])
+    deleted = IdempotencyKey.query.filter(IdempotencyKey.date_created < expired).delete(
+        synchronize_session=False
+    )
+    db.session.commit()
+    return deleted
+
+
+def _replay(fingerprint, stored):
+    stored_fingerprint, status_code, mimetype, body = stored
+    if stored_fingerprint != fingerprint:
+        raise UnprocessableEntity(f"This {HEADER} was already used with another request body")
+    return Response(body, status=status_code, mimetype=mimetype, headers={REPLAYED_HEADER: "true"})
+
+
+def _claim(scope, key, fingerprint):
+    """
+    Return what is stored for the key, or insert it if it is new, or take over its expired lease.
+    :return: (stored, claimed_at), stored is None if this request claimed the key,
+        else (fingerprint, status_code, mimetype, body)
+    """
+    # plain columns, nothing to hydrate
+    row = (
+        db.session.query(
+            IdempotencyKey.id, IdempotencyKey.fingerprint, IdempotencyKey.status_code, IdempotencyKey.mimetype,
+            IdempotencyKey.body, IdempotencyKey.date_created, IdempotencyKey.claimed_at,
+        )
+        .filter_by(scope=scope, key=key)
+        .first()
+    )
+    now = datetime.utcnow()
+
+    if row is not None and row.date_created < now - timedelta(seconds=current_app.config["IDEMPOTENCY_TTL"]):
+        IdempotencyKey.query.filter_by(id=row.id).delete(synchronize_session=False)
+        db.session.commit()
+        row = None
+
+    if row is None:
+        try:
+            db.session.add(IdempotencyKey(scope=scope, key=key, fingerprint=fingerprint, claimed_at=now))
+            db.session.commit()
+            return None, now
+        except IntegrityError:
+            # a concurrent duplicate claimed it first
+            db.session.rollback()
+            return _claim(scope, key, fingerprint)
+
+    if row.status_code is None:
+        if row.claimed_at >= now - timedelta(seconds=current_app.config["IDEMPOTENCY_LOCK_SECONDS"]):
+            raise Conflict(f"A request with this {HEADER} is still in progress, retry later")
+
+        # compare-and-set on claimed_at, so only one of several retries takes the lease over
+        taken = IdempotencyKey.query.filter_by(id=row.id, status_code=None, claimed_at=row.claimed_at).update(
+            {"fingerprint": fingerprint, "claimed_at": now}, synchronize_session=False
+        )
+        db.session.commit()
+        if not taken:
+            return _claim(scope, key, fingerprint)
+        return None, now
+
+    return (row.fingerprint, row.status_code, row.mimetype, row.body), row.claimed_at
+
+
+def _release(scope, key, claimed_at):
+    # only our own claim, the key may have been taken over meanwhile
+    db.session.rollback()
+    IdempotencyKey.query.filter_by(scope=scope, key=key, claimed_at=claimed_at, status_code=None).delete(
+        synchronize_session=False
+    )
+    db.session.commit()
+
+
+def idempotent(func):
+    """
+    Make a Resource method replay its response for a repeated Idempotency-Key header.
+
+    Keys are scoped to the route and the JWT identity. Place it above
+    marshal_with, so that replays skip the marshalling too. Responses with
+    status 500 and up, and exceptions, release the key for another try.
+    """
+
+    @wraps(func)
+    def wrapper(resource, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return func(resource, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            raise BadRequest(f"{HEADER} must be at most {MAX_KEY_LENGTH} characters")
+
+        verify_jwt_in_request()
+        scope = f"{request.endpoint}:{get_jwt_identity()}"
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        cache = current_app.extensions["idempotency_cache"]
+        stored = cache.get((scope, key))
+        if stored is None:
+            stored, claimed_at = _claim(scope, key, fingerprint)
+        if stored is not None:
+            cache.set((scope, key), stored)
+            return _replay(fingerprint, stored)
+
+        try:
+            resp = func(resource, *args, **kwargs)
+        except BaseException:
+            _release(scope, key, claimed_at)
+            raise
+
+        response = resp if isinstance(resp, BaseResponse) else resource.api.make_response(*unpack(resp))
+        if response.status_code >= 500:
+            _release(scope, key, claimed_at)
+            return response
+
+        stored = (fingerprint, response.status_code, response.mimetype, response.get_data())
+        # nothing is stored if our lease ran out and another request took the key over
+        saved = IdempotencyKey.query.filter_by(scope=scope, key=key, claimed_at=claimed_at, status_code=None).update(
+            {"status_code": stored[1], "mimetype": stored[2], "body": stored[3]},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        if saved:
+            cache.set((scope, key), stored)
+
+        return response
+
+    return wrapper
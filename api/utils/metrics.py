@@ -0,0 +1,189 @@
+import bisect
+import threading
+import time
+from http import HTTPStatus
+from flask import Response, abort, g, has_request_context, request
+from flask_jwt_extended import verify_jwt_in_request
+from sqlalchemy import event
+from ..auth.identity import current_identity
+from . import db
+from .pool import pool_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """
+    A Prometheus-style cumulative histogram keyed by a tuple of label values.
+    """
+
+    def __init__(self, name, description, labelnames, buckets):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # one count per bucket plus +Inf, then the sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def samples(self):
+        """
+        :return: {labels: (cumulative bucket counts, sum, count)}
+        """
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+
+        samples = {}
+        for labels, (counts, total) in series.items():
+            cumulative, running = [], 0
+            for count in counts:
+                running += count
+                cumulative.append(running)
+            samples[labels] = (cumulative, total, running)
+        return samples
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+
+        for labels, (cumulative, total, count) in sorted(self.samples().items()):
+            label_text = ",".join(f'{name}="{value}"' for name, value in zip(self.labelnames, labels))
+            prefix = label_text + "," if label_text else ""
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), cumulative):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {bucket_count}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+
+        return lines
+
+
+class Metrics:
+    """
+    Per-app request metrics, exposed in the Prometheus text format on /metrics.
+    """
+
+    def __init__(self):
+        labels = ("resource", "method")
+        self.latency = Histogram(
+            "http_request_duration_seconds", "Request latency", labels, LATENCY_BUCKETS
+        )
+        self.response_size = Histogram(
+            "http_response_size_bytes", "Response body size", labels, SIZE_BUCKETS
+        )
+        self.statements = Histogram(
+            "db_statements_per_request", "SQL statements executed per request", labels, STATEMENT_BUCKETS
+        )
+        self.statement_time = Histogram(
+            "db_statement_seconds_per_request", "Total SQL execution time per request", labels, LATENCY_BUCKETS
+        )
+
+    def histograms(self):
+        return [self.latency, self.response_size, self.statements, self.statement_time]
+
+    def render(self):
+        lines = []
+        for histogram in self.histograms():
+            lines += histogram.render()
+
+        # connection pool gauges of this worker
+        for name, key, description in (
+            ("db_pool_checked_out", "checked_out", "Connections in use"),
+            ("db_pool_overflow", "overflow", "Connections opened above pool_size"),
+        ):
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge"]
+            for bind_key, engine in db.engines.items():
+                stats = pool_stats(engine)
+                if key in stats:
+                    lines.append(f'{name}{{bind="{bind_key or "default"}"}} {stats[key]}')
+
+        return "\n".join(lines) + "\n"
+
+
+def init_metrics(app):
+    """
+    Record latency, response size and SQL statements of every request and serve /metrics
+    (staff only). Streamed responses are recorded once their body has been sent.
+    """
+    if not app.config["METRICS_ENABLED"]:
+        return
+
+    metrics = app.extensions["metrics"] = Metrics()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.before_request
+    def start_request_metrics():
+        g._metrics = {"start": time.perf_counter(), "statements": 0, "statement_time": 0.0}
+
+    @app.after_request
+    def record_request_metrics(response):
+        state = g.get("_metrics")
+        if state is None or request.endpoint in (None, "metrics"):
+            return response
+
+        labels = (_resource_name(app, request.endpoint), request.method)
+
+        def record():
+            metrics.latency.observe(labels, time.perf_counter() - state["start"])
+            metrics.statements.observe(labels, state["statements"])
+            metrics.statement_time.observe(labels, state["statement_time"])
+
+        if response.is_streamed:
+            # the body (e.g. the export) runs its statements after this hook, so record once
+            # it is sent. Streamed responses have no length up front
+            response.call_on_close(record)
+        else:
+            g.pop("_metrics")
+            record()
+            metrics.response_size.observe(labels, response.calculate_content_length() or 0)
+
+        return response
+
+    @app.route("/metrics", endpoint="metrics")
+    def metrics_view():
+        # the pool gauges are staff only, as on /monitoring/pool
+        verify_jwt_in_request()
+        user = current_identity()
+        if user is None or not user.is_staff:
+            abort(HTTPStatus.FORBIDDEN)
+
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# label requests by Resource class (e.g. CreateGetOrders) rather than by URL
+def _resource_name(app, endpoint):
+    view = app.view_functions.get(endpoint)
+    view_class = getattr(view, "view_class", None)
+    return view_class.__name__ if view_class else endpoint
+
+
+# the start time is kept on the execution context, so a failed statement (which gets no
+# after_cursor_execute) leaves nothing behind on the connection
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_start", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+
+    if has_request_context():
+        state = g.get("_metrics")
+        if state is not None:
+            state["statements"] += 1
+            state["statement_time"] += elapsed
@@ -0,0 +1,46 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+
+# encode the (date_created, id) of the last row on a page into an opaque cursor
+def encode_cursor(date_created, id):
+    payload = json.dumps([date_created.isoformat(), id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+# decode a cursor back into (date_created, id), raises ValueError if it is malformed
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date_created, id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(date_created), int(id)
+    except (TypeError, ValueError, UnicodeDecodeError) as error:
+        raise ValueError("Invalid cursor") from error
+
+
+def keyset_page(query, date_column, id_column, limit, cursor=None):
+    """
+    Return one page of a query ordered newest first on (date_column, id_column).
+
+    Rows after the cursor are found with a row-value comparison, so the
+    database walks the (date_created, id) index instead of skipping OFFSET rows.
+    :return: (rows, next_cursor) where next_cursor is None on the last page
+    """
+    if cursor:
+        date_created, id = decode_cursor(cursor)
+        query = query.filter(tuple_(date_column, id_column) < tuple_(date_created, id))
+
+    # fetch one extra row to know if there is a next page
+    rows = query.order_by(date_column.desc(), id_column.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            getattr(last, date_column.key), getattr(last, id_column.key)
+        )
+
+    return rows, next_cursor
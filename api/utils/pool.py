@@ -0,0 +1,22 @@
+def pool_stats(engine):
+    """
+    Return the connection counts of an engine's pool.
+
+    QueuePool (the default for PostgreSQL) reports its size, idle (checked in),
+    checked out and overflow connections. Other pools (e.g. SQLite's) only
+    report their class and status line.
+    """
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__, "status": pool.status()}
+
+    if hasattr(pool, "checkedout"):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            # negative until the pool has opened pool_size connections
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+        )
+
+    return stats
@@ -0,0 +1,128 @@
+import math
+import threading
+import time
+from functools import wraps
+from flask import current_app
+from werkzeug.exceptions import TooManyRequests
+from .cache import TTLCache
+
+
+class MemoryBackend:
+    """
+    In-process counters, for a single node. Memory is bounded by maxsize keys.
+    """
+
+    def __init__(self, maxsize=100000):
+        self._counters = TTLCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def incr(self, key, expire):
+        with self._lock:
+            count = self._counters.get(key, 0) + 1
+            self._counters.set(key, count, ttl=expire)
+        return count
+
+    def get(self, key):
+        return self._counters.get(key, 0)
+
+
+class RedisBackend:
+    """
+    Counters in Redis (or anything speaking its INCR/EXPIRE/GET commands), shared by a cluster.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url):
+        try:
+            import redis
+        except ImportError as error:
+            raise RuntimeError("RATELIMIT_BACKEND=redis needs the redis package") from error
+        return cls(redis.Redis.from_url(url))
+
+    def incr(self, key, expire):
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, expire)
+        return pipe.execute()[0]
+
+    def get(self, key):
+        return int(self.client.get(key) or 0)
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window counter limiter.
+
+    Keeps one counter per key and fixed window, and weights the previous
+    window's count by how much of it still overlaps the sliding window. That
+    approximates a true sliding log with two integers per key.
+    """
+
+    def __init__(self, backend, prefix="ratelimit"):
+        self.backend = backend
+        self.prefix = prefix
+
+    def hit(self, key, limit, window):
+        """
+        Count one attempt for key.
+        :return: (allowed, seconds to wait before retrying)
+        """
+        now = time.time()
+        current_window, elapsed = divmod(now, window)
+        current_window = int(current_window)
+
+        current = self.backend.incr(f"{self.prefix}:{key}:{current_window}", expire=window * 2)
+        previous = self.backend.get(f"{self.prefix}:{key}:{current_window - 1}")
+
+        weighted = previous * (window - elapsed) / window + current
+        if weighted <= limit:
+            return True, 0
+
+        # the previous window's weight has decayed enough by then (at the latest when the window ends)
+        if previous:
+            retry_after = max((weighted - limit) * window / previous, 1)
+        else:
+            retry_after = window - elapsed
+        return False, math.ceil(min(retry_after, window - elapsed))
+
+
+def init_rate_limiter(app):
+    if app.config["RATELIMIT_BACKEND"] == "redis":
+        backend = RedisBackend.from_url(app.config["RATELIMIT_REDIS_URL"])
+    else:
+        backend = MemoryBackend()
+    app.extensions["ratelimiter"] = SlidingWindowLimiter(backend)
+
+
+def rate_limit(scope, keys):
+    """
+    Reject a request with 429 when any of its keys went over the scope's limit.
+
+    The limit and window (seconds) come from the <SCOPE>_RATE_LIMIT and
+    <SCOPE>_RATE_WINDOW config values. Place the decorator so it runs before
+    the work it protects, e.g. above the handler's other decorators.
+    :param scope: name of the limit, e.g. "login"
+    :param keys: function returning the keys of the current request, e.g. ["ip:1.2.3.4"]
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if current_app.config["RATELIMIT_ENABLED"]:
+                limiter = current_app.extensions["ratelimiter"]
+                limit = current_app.config[f"{scope.upper()}_RATE_LIMIT"]
+                window = current_app.config[f"{scope.upper()}_RATE_WINDOW"]
+
+                for key in keys():
+                    allowed, retry_after = limiter.hit(f"{scope}:{key}", limit, window)
+                    if not allowed:
+                        raise TooManyRequests("Too many requests, try again later", retry_after=retry_after)
+
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,86 @@
+"""
+Read/write splitting between the primary database and a read replica.
+
+When SQLALCHEMY_BINDS has a "replica" engine, the statements of GET and
+HEAD requests go to it and everything else (writes, flushes, and every
+statement of other requests) goes to the primary. A client that has just
+written stays on the primary for REPLICA_STICKY_SECONDS, so it reads its
+own writes while the replica catches up.
+"""
+
+import math
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import PyJWTError
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+from .ratelimit import MemoryBackend, RedisBackend
+
+READ_METHODS = frozenset(["GET", "HEAD"])
+
+REPLICA_BIND_KEY = "replica"
+
+
+class RoutingSession(Session):
+    """
+    A Flask-SQLAlchemy session that sends the reads of GET/HEAD requests to the replica.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and has_request_context()
+            and g.get("_use_replica")
+            and not self._flushing
+            and not isinstance(clause, UpdateBase)
+        ):
+            return self._db.engines[REPLICA_BIND_KEY]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _client_key():
+    """
+    The user of the bearer token when it has a valid one, so the mark survives a token
+    refresh, else the address. The token is verified again (with revocation) by the view.
+    """
+    authorization = request.headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        try:
+            claims = decode_token(authorization[len("Bearer "):])
+        except (JWTExtendedException, PyJWTError):
+            pass
+        else:
+            user = claims.get("uid", claims.get(current_app.config["JWT_IDENTITY_CLAIM"]))
+            return f"replica:user:{user}"
+    return f"replica:ip:{request.remote_addr}"
+
+
+def init_replica_routing(app):
+    """
+    Route GET/HEAD requests to the "replica" bind, if one is configured.
+
+    The read-your-writes marks have their own store (REPLICA_STICKY_BACKEND),
+    with REPLICA_STICKY_BACKEND=redis every worker and node sees them.
+    """
+    if REPLICA_BIND_KEY not in app.config.get("SQLALCHEMY_BINDS", {}):
+        return
+
+    sticky_seconds = app.config["REPLICA_STICKY_SECONDS"]
+    if app.config["REPLICA_STICKY_BACKEND"] == "redis":
+        marks = RedisBackend.from_url(app.config["REPLICA_STICKY_REDIS_URL"])
+    else:
+        marks = MemoryBackend(maxsize=app.config["REPLICA_STICKY_MAX_CLIENTS"])
+    app.extensions["replica_sticky"] = marks
+
+    @app.before_request
+    def choose_database():
+        g._use_replica = request.method in READ_METHODS and not (
+            sticky_seconds and marks.get(_client_key())
+        )
+
+    @app.after_request
+    def stick_to_primary(response):
+        if sticky_seconds and request.method not in READ_METHODS and response.status_code < 400:
+            marks.incr(_client_key(), expire=math.ceil(sticky_seconds))
+        return response
@@ -0,0 +1,241 @@
+"""
+A compiled fast path for flask-restx marshalling.
+
+marshal() re-walks the field dict, resolves dotted keys and dispatches
+through field.output() for every row. compile_serializer() does that work
+once per model and keeps a flat list of (key, attribute, converter) per
+field, producing exactly the same output for the field types used here.
+Anything it does not know how to convert falls back to field.output().
+
+Field masks (the X-Fields header, or the fields= query parameter) are
+applied to the model before compiling, and masked_load_only() narrows the
+SELECT to the same columns.
+"""
+
+from datetime import datetime
+from functools import wraps
+from http import HTTPStatus
+from flask import Response, current_app, has_app_context, request
+from flask_restx import Namespace as BaseNamespace, fields, marshal
+from flask_restx.marshalling import marshal_with as base_marshal_with
+from flask_restx.mask import Mask, apply as apply_mask
+from flask_restx.utils import merge, unpack
+from sqlalchemy.orm import load_only
+from werkzeug.wrappers import Response as BaseResponse
+from .cache import TTLCache
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the Api's JSON representation
+    orjson = None
+
+_compiled = {}
+
+# serializers of masked models, masks come from clients so this one is bounded
+_compiled_masked = TTLCache(maxsize=256, ttl=3600)
+
+# marker for nested fields that marshal None into a dict of their own defaults
+_CONVERT_NONE = object()
+
+
+def compile_serializer(model):
+    """
+    Return a function obj -> dict equivalent to marshal(obj, model).
+    """
+    cached = _compiled.get(id(model))
+    if cached is not None and cached[0] is model:
+        return cached[1]
+
+    serialize = _build_serializer(model)
+    _compiled[id(model)] = (model, serialize)
+    return serialize
+
+
+def compile_masked_serializer(model, mask):
+    """
+    Return a function obj -> dict equivalent to marshal(obj, model, mask=mask).
+    """
+    key = (id(model), mask)
+    cached = _compiled_masked.get(key)
+    if cached is not None and cached[0] is model:
+        return cached[1]
+
+    serialize = _build_serializer(apply_mask(getattr(model, "resolved", model), mask, skip=True))
+    _compiled_masked.set(key, (model, serialize))
+    return serialize
+
+
+def _build_serializer(model):
+    plan = [_compile_field(key, _make(field)) for key, field in getattr(model, "resolved", model).items()]
+
+    def serialize(obj):
+        is_dict = isinstance(obj, dict)
+        out = {}
+        for key, attribute, convert, none_value, fallback in plan:
+            if fallback is not None:
+                out[key] = fallback.output(key, obj)
+                continue
+            value = obj.get(attribute) if is_dict else getattr(obj, attribute, None)
+            if value is None:
+                out[key] = convert(None) if none_value is _CONVERT_NONE else none_value
+            else:
+                out[key] = convert(value)
+        return out
+
+    return serialize
+
+
+def request_mask():
+    """
+    The field mask of the current request: the X-Fields header, else the fields=
+    query parameter, either a mask ("{id,status}") or a comma separated list ("id,status").
+    """
+    mask = request.headers.get(current_app.config["RESTX_MASK_HEADER"]) or request.args.get("fields")
+    if mask and not mask.lstrip().startswith("{"):
+        mask = "{" + mask + "}"
+    return mask or None
+
+
+def wants_field(key):
+    """
+    True if the request's mask keeps the field key (or there is no mask).
+    """
+    mask = request_mask()
+    return not mask or key in Mask(mask) or "*" in Mask(mask)
+
+
+def masked_load_only(entity, *always):
+    """
+    Query options loading only the columns of entity that the request's mask asks for.
+
+    Unmasked requests load every column. Columns in always are loaded regardless,
+    e.g. the ones a pagination cursor is built from.
+    :return: list of options to pass to query.options()
+    """
+    mask = request_mask()
+    if not mask:
+        return []
+
+    columns = entity.__mapper__.column_attrs
+    keys = [column.key for column in always] + [key for key in Mask(mask) if key in columns]
+    return [load_only(*(getattr(entity, key) for key in dict.fromkeys(keys)))]
+
+
+def _make(field):
+    return field() if isinstance(field, type) else field
+
+
+def _compile_field(key, field):
+    """
+    :return: (key, attribute, converter, value used for None, fallback field or None)
+    """
+    attribute = key if field.attribute is None else field.attribute
+    generic = (key, None, None, None, field)
+
+    # dotted/callable attributes, masks and callable defaults keep the generic path
+    if not isinstance(attribute, str) or "." in attribute or field.mask or callable(field.default):
+        return generic
+
+    field_type = type(field)
+
+    if field_type is fields.Nested:
+        if field.allow_null:
+            none_value = None
+        elif field.default is not None:
+            none_value = field.default
+        else:
+            none_value = _CONVERT_NONE
+        return key, attribute, compile_serializer(field.nested), none_value, None
+
+    if field_type is fields.List and type(field.container) is fields.Nested:
+        nested = compile_serializer(field.container.nested)
+
+        def convert_list(value):
+            if isinstance(value, dict):
+                return [nested(value)]
+            return [nested(item) for item in value]
+
+        return key, attribute, convert_list, field.default, None
+
+    # plain fields format their default when it is truthy
+    none_value = field.format(field.default) if field.default else field.default
+
+    if field_type is fields.Integer:
+        return key, attribute, int, none_value, None
+
+    if field_type is fields.String:
+        return key, attribute, str, none_value, None
+
+    if field_type is fields.Float:
+        return key, attribute, float, none_value, None
+
+    if field_type is fields.Boolean:
+        return key, attribute, lambda value: value if value is True or value is False else field.format(value), none_value, None
+
+    if field_type is fields.DateTime and field.dt_format == "iso8601":
+        return key, attribute, lambda value: value.isoformat() if type(value) is datetime else field.format(value), none_value, None
+
+    return generic
+
+
+class marshal_with(base_marshal_with):
+    """
+    flask-restx's marshal_with, using the compiled serializer when FAST_SERIALIZER is on.
+
+    Responses already built by the view (e.g. 304 Not Modified) are passed through.
+    """
+
+    def __call__(self, f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            resp = f(*args, **kwargs)
+            if isinstance(resp, BaseResponse):
+                return resp
+
+            data, code, headers = unpack(resp) if isinstance(resp, tuple) else (resp, HTTPStatus.OK, {})
+
+            mask = self.mask
+            fast = False
+            if has_app_context():
+                mask = request_mask() or mask
+                fast = current_app.config["FAST_SERIALIZER"]
+
+            if not fast or self.envelope or self.skip_none or self.ordered:
+                out = marshal(data, self.fields, self.envelope, self.skip_none, mask, self.ordered)
+                return (out, code, headers) if isinstance(resp, tuple) else out
+
+            if mask:
+                serialize = compile_masked_serializer(self.fields, mask)
+            else:
+                serialize = compile_serializer(self.fields)
+            if isinstance(data, (list, tuple)):
+                out = [serialize(item) for item in data]
+            else:
+                out = serialize(data)
+
+            if orjson is not None:
+                return Response(orjson.dumps(out), status=code, headers=headers, mimetype="application/json")
+            return out, code, headers
+
+        return wrapper
+
+
+class Namespace(BaseNamespace):
+    """
+    A flask-restx Namespace whose marshal_with uses the compiled serializer.
+    """
+
+    def marshal_with(self, fields, as_list=False, code=HTTPStatus.OK, description=None, **kwargs):
+        def wrapper(func):
+            doc = {
+                "responses": {
+                    str(code): (description, [fields], kwargs)
+                    if as_list
+                    else (description, fields, kwargs)
+                },
+                "__mask__": kwargs.get("mask", True),
+            }
+            func.__apidoc__ = merge(getattr(func, "__apidoc__", {}), doc)
+            return marshal_with(fields, ordered=self.ordered, **kwargs)(func)
+
+        return wrapper
@@ -0,0 +1,109 @@
+import json
+import logging
+import random
+import time
+from flask import has_request_context, request
+from sqlalchemy import event
+from . import db
+
+logger = logging.getLogger("api.sql")
+
+# longest repr of the bound parameters written to a slow query record
+MAX_PARAMETERS_LENGTH = 500
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format a log record and its "sql" extra as one JSON object per line.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "sql", {}))
+        return json.dumps(entry, default=str)
+
+
+class SqlLogFormatter(JsonFormatter):
+    """
+    Format each record as the SQL_LOG_FORMAT of the app that logged it (its "sql_format" extra).
+
+    The text format is one line: the message, then the "sql" fields as key=value,
+    with the statement last and its whitespace collapsed.
+    """
+
+    def format(self, record):
+        if getattr(record, "sql_format", "json") == "json":
+            return super().format(record)
+
+        entry = dict(getattr(record, "sql", {}))
+        statement = " ".join(str(entry.pop("statement", "")).split())
+        fields = " ".join(f"{key}={value}" for key, value in entry.items())
+        return f"{self.formatTime(record)} {record.levelname} {record.getMessage()} {fields} statement={statement}"
+
+
+def init_sql_log(app):
+    """
+    Log sampled and slow SQL statements instead of echoing all of them.
+
+    Every statement is timed. Statements slower than SQL_LOG_SLOW_MS are always
+    logged with their parameters and calling endpoint, others are only logged
+    for a SQL_LOG_SAMPLE_RATE fraction of executions.
+
+    The "api.sql" logger and its handler are process-global and set up once,
+    each record is formatted per the SQL_LOG_FORMAT of the app logging it.
+    """
+    if not app.config["SQL_LOG_ENABLED"]:
+        return
+
+    sample_rate = app.config["SQL_LOG_SAMPLE_RATE"]
+    slow_ms = app.config["SQL_LOG_SLOW_MS"]
+    log_format = app.config["SQL_LOG_FORMAT"]
+
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(SqlLogFormatter())
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    # timed on the execution context, failed statements get no after_cursor_execute
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._sql_log_start = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_sql_log_start", None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        slow = elapsed_ms >= slow_ms
+        if not slow and (sample_rate <= 0 or random.random() >= sample_rate):
+            return
+
+        entry = {
+            "statement": statement,
+            "duration_ms": round(elapsed_ms, 3),
+            "executemany": executemany,
+            "slow": slow,
+        }
+        if has_request_context():
+            entry["endpoint"] = request.endpoint
+            entry["method"] = request.method
+        if slow:
+            entry["parameters"] = repr(parameters)[:MAX_PARAMETERS_LENGTH]
+
+        if slow:
+            logger.warning("slow query %.1f ms", elapsed_ms, extra={"sql": entry, "sql_format": log_format})
+        else:
+            logger.info("query %.1f ms", elapsed_ms, extra={"sql": entry, "sql_format": log_format})
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", after_cursor_execute)
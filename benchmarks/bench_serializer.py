@@ -0,0 +1,61 @@
+"""
+Compare flask-restx marshalling with the compiled serializer on order rows.
+
+Run from the project root:
+$ python -m benchmarks.bench_serializer --rows 1000 --repeat 20
+"""
+
+import argparse
+import json
+import timeit
+from datetime import datetime
+from flask_restx import marshal
+from api import create_app
+from api.config.config import config_dict
+from api.models.orders import Order, OrderSizes, OrderStatus
+from api.orders.schemas import order_details_model
+from api.utils.serializers import compile_serializer, orjson
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app(config=config_dict["test"])
+
+    with app.app_context():
+        orders = [
+            Order(
+                id=i,
+                size=OrderSizes.LARGE,
+                status=OrderStatus.PENDING,
+                flavour="Pepperoni",
+                quantity=2,
+                date_created=datetime.utcnow(),
+                customer_id=1,
+            )
+            for i in range(args.rows)
+        ]
+        serialize = compile_serializer(order_details_model)
+        dumps = orjson.dumps if orjson is not None else json.dumps
+
+        def restx_marshal():
+            json.dumps(marshal(orders, order_details_model))
+
+        def compiled():
+            dumps([serialize(order) for order in orders])
+
+        results = {}
+        for name, func in [("marshal", restx_marshal), ("compiled", compiled)]:
+            best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+            results[name] = best
+            print(f"{name:>9}: {best * 1000:8.2f} ms for {args.rows} rows")
+
+        print(f"  speedup: {results['marshal'] / results['compiled']:.1f}x"
+              f" (encoder: {'orjson' if orjson is not None else 'json'})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""
+Load-test every route of the auth and orders namespaces.
+
+Seeds N users and M orders through the models, then drives each route with
+concurrent clients over real HTTP and reports p50/p95/p99 latency, throughput
+and SQL statements per request (scraped from /metrics).
+
+Every route gets an untimed warm-up round first. A response with any other status than
+the route's expected one is an error, and --compare fails on errors, on more SQL
+statements per request, and on a p95 slower than the baseline by --tolerance plus
+--floor-ms. A route that comes out slower is run again (--retries) and keeps its
+fastest run, so one noisy run does not fail the gate.
+
+Run from the project root, e.g.:
+$ python -m benchmarks.run --users 5 --orders 200 --requests 20 --concurrency 4 --compare benchmarks/baseline.json
+$ python -m benchmarks.run --users 5 --orders 200 --requests 20 --concurrency 4 \
+    --database-url postgresql://localhost/pizza_bench --compare benchmarks/baseline-postgres.json
+
+benchmarks/baseline.json (SQLite) and benchmarks/baseline-postgres.json are taken with those
+sizes and --runs 5 --output, so compare with the same sizes, and regenerate both in any
+change that moves sql/req.
+
+Use --url to drive an already running server (e.g. gunicorn) that uses the same --database-url.
+/metrics is per worker, so with several workers sql/req is taken from whichever worker answers the scrape.
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+from api import create_app
+from api.config.config import config_dict
+from api.models.orders import Order, OrderSizes
+from api.models.users import User
+from api.utils import db
+
+SIZES = list(OrderSizes)
+FLAVOURS = ["Pepperoni", "Margherita", "Chicken Suya", "Veggie", "Hawaiian"]
+
+
+def seed(app, users, orders, spare):
+    """
+    Create users (the first one is staff), orders spread over them and
+    `spare` extra orders of the first user for the routes that use an order up
+    (the status change and DELETE).
+    :return: (user ids, order ids of the first user, spare order ids)
+    """
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        password_hash = generate_password_hash("password")
+        db.session.add_all(
+            User(
+                username=f"bench{i}",
+                email=f"bench{i}@test.com",
+                password_hash=password_hash,
+                is_staff=i == 0,
+                is_active=True,
+            )
+            for i in range(users)
+        )
+        db.session.commit()
+        user_ids = [id for (id,) in db.session.query(User.id).order_by(User.id)]
+
+        db.session.add_all(
+            Order(
+                size=SIZES[i % len(SIZES)],
+                flavour=FLAVOURS[i % len(FLAVOURS)],
+                quantity=1 + i % 3,
+                customer_id=user_ids[i % len(user_ids)],
+            )
+            for i in range(orders)
+        )
+        db.session.commit()
+        own_order_ids = [
+            id for (id,) in db.session.query(Order.id).filter_by(customer_id=user_ids[0]).order_by(Order.id)
+        ]
+
+        spare_orders = [
+            Order(size=SIZES[0], flavour=FLAVOURS[0], customer_id=user_ids[0]) for _ in range(spare)
+        ]
+        db.session.add_all(spare_orders)
+        db.session.flush()
+        spare_ids = [order.id for order in spare_orders]
+        db.session.commit()
+
+    return user_ids, own_order_ids, spare_ids
+
+
+class Client:
+    """
+    A minimal JSON HTTP client for the benchmark workers.
+    """
+
+    def __init__(self, base_url, token=None):
+        self.base_url = base_url
+        self.token = token
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Content-Type": "application/json"}
+        token = token or self.token
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+def build_routes(user_ids, own_order_ids, spare_ids, refresh_token):
+    """
+    :return: list of (name, method, path factory, body factory, token override, expected status)
+    """
+    staff_id = user_ids[0]
+    counter = itertools.count()
+    order_ids = itertools.cycle(own_order_ids)
+    # a PENDING order moves to IN_TRANSIT once and DELETE consumes orders, so both
+    # take spare orders, each once
+    pending_ids = iter(spare_ids[::2])
+    deletable = iter(spare_ids[1::2])
+
+    def unique(prefix):
+        return f"{prefix}{os.getpid()}x{next(counter)}"
+
+    order = lambda: {"size": "MEDIUM", "quantity": 2, "flavour": "Pepperoni"}
+
+    # the reads come first, so every run of them sees the seeded data only
+    return [
+        ("auth.login", "POST", lambda: "/auth/login",
+         lambda: {"email": "bench1@test.com", "password": "password"}, None, 201),
+        ("auth.refresh", "POST", lambda: "/auth/refresh", lambda: None, refresh_token, 200),
+        ("auth.users", "GET", lambda: "/auth/users", lambda: None, None, 200),
+        ("auth.user", "GET", lambda: f"/auth/user/{staff_id}", lambda: None, None, 200),
+        ("auth.users_orders", "GET", lambda: "/auth/users/orders", lambda: None, None, 200),
+        ("orders.list", "GET", lambda: "/orders/", lambda: None, None, 200),
+        ("orders.export", "GET", lambda: f"/orders/export?customer_id={staff_id}", lambda: None, None, 200),
+        ("orders.get", "GET", lambda: f"/orders/{next(order_ids)}", lambda: None, None, 200),
+        ("orders.user_order", "GET", lambda: f"/orders/user/{staff_id}/order/{next(order_ids)}/",
+         lambda: None, None, 200),
+        ("orders.user_orders", "GET", lambda: f"/orders/user/{staff_id}/orders", lambda: None, None, 200),
+        ("auth.signup", "POST", lambda: "/auth/signup",
+         lambda: {"username": (name := unique("signup")), "email": f"{name}@test.com", "password": "password"},
+         None, 201),
+        ("orders.create", "POST", lambda: "/orders/", order, None, 201),
+        ("orders.bulk", "POST", lambda: "/orders/bulk", lambda: [order() for _ in range(20)], None, 201),
+        ("orders.update", "PUT", lambda: f"/orders/{next(order_ids)}",
+         lambda: {"size": "LARGE", "quantity": 1, "flavour": "Veggie"}, None, 200),
+        ("orders.status", "PATCH", lambda: f"/orders/{next(pending_ids, 0)}/status",
+         lambda: {"status": "IN_TRANSIT"}, None, 200),
+        ("orders.bulk_status", "PATCH", lambda: f"/orders/status?customer_id={staff_id}",
+         lambda: {"status": "IN_TRANSIT"}, None, 200),
+        ("orders.delete", "DELETE", lambda: f"/orders/{next(deletable, 0)}", lambda: None, None, 200),
+    ]
+
+
+def scrape_statements(client):
+    """
+    :return: (total SQL statements, requests) summed over every series in /metrics
+    """
+    status, body = client.request("GET", "/metrics")
+    if status != 200:
+        return None
+
+    text = body.decode()
+    total = sum(float(value) for value in re.findall(r"^db_statements_per_request_sum\{.*\} (\S+)$", text, re.M))
+    count = sum(float(value) for value in re.findall(r"^db_statements_per_request_count\{.*\} (\S+)$", text, re.M))
+    return total, count
+
+
+def run_route(client, route, requests, concurrency):
+    name, method, path, body, token, expected = route
+    lock = threading.Lock()
+
+    def call(_):
+        with lock:
+            # factories share iterators, so build the request under the lock
+            request_path, request_body = path(), body()
+        start = time.perf_counter()
+        status, _ = client.request(method, request_path, request_body, token)
+        return time.perf_counter() - start, status
+
+    # one untimed round first, so caches, pool connections and threads are warm
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(concurrency)))
+
+    before = scrape_statements(client)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, range(requests)))
+    elapsed = time.perf_counter() - started
+    after = scrape_statements(client)
+
+    latencies = sorted(latency for latency, _ in results)
+    # any other status (a 4xx too) is an error, not a timing of the route
+    statuses = collections.Counter(str(status) for _, status in results)
+    errors = sum(count for status, count in statuses.items() if status != str(expected))
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+
+    sql_per_request = None
+    if before is not None and after is not None:
+        # the scrape itself is not instrumented, so the delta is this route's requests only
+        sql_per_request = round((after[0] - before[0]) / max(after[1] - before[1], 1), 2)
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "statuses": dict(sorted(statuses.items())),
+        "p50_ms": round(quantiles[49] * 1000, 2),
+        "p95_ms": round(quantiles[94] * 1000, 2),
+        "p99_ms": round(quantiles[98] * 1000, 2),
+        "throughput_rps": round(requests / elapsed, 1),
+        "sql_per_request": sql_per_request,
+    }
+
+
+def slower(current, previous, tolerance, floor_ms=0):
+    """
+    :return: whether a route's p95 went over its baseline by more than the tolerance and floor
+    """
+    return current["p95_ms"] > previous["p95_ms"] * (1 + tolerance) + floor_ms
+
+
+def compare(results, baseline, tolerance, floor_ms=0):
+    """
+    :param floor_ms: p95 slowdown allowed on top of the tolerance, so the fastest routes are not
+        failed by a few ms of noise
+    :return: list of regression messages (errors, p95 latency beyond tolerance, or more SQL statements)
+    """
+    regressions = []
+    for name, current in results["routes"].items():
+        if current["errors"]:
+            regressions.append(f"{name}: {current['errors']} unexpected responses {current.get('statuses')}")
+        previous = baseline["routes"].get(name)
+        if previous is None:
+            continue
+        if slower(current, previous, tolerance, floor_ms):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+        if (current["sql_per_request"] or 0) > (previous["sql_per_request"] or 0):
+            regressions.append(
+                f"{name}: SQL statements per request {previous['sql_per_request']} -> {current['sql_per_request']}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--url", help="drive this running server instead of an in-process one")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--routes", help="comma separated route names to run (default: all)")
+    parser.add_argument("--output", help="write the results as JSON (e.g. a new baseline)")
+    parser.add_argument("--compare", help="baseline JSON to compare against, exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 slowdown (0.25 = 25%%)")
+    parser.add_argument("--floor-ms", type=float, default=10, help="p95 slowdown allowed on top of --tolerance")
+    parser.add_argument(
+        "--runs", type=int, default=1, help="runs of each route, keeping its median one by p95 (e.g. for a baseline)"
+    )
+    parser.add_argument(
+        "--retries", type=int, default=4,
+        help="runs of a route again when it is slower than the baseline, keeping its fastest run",
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+    database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+
+    class BenchmarkConfig(config_dict["test"]):
+        TESTING = False
+        SQLALCHEMY_DATABASE_URI = database_url
+        METRICS_ENABLED = True
+        # slow statements under load would flood the report
+        SQL_LOG_ENABLED = False
+        # the harness logs in and creates orders far faster than the production limits allow
+        RATELIMIT_ENABLED = False
+
+    app = create_app(config=BenchmarkConfig)
+    user_ids, own_order_ids, spare_ids = seed(
+        app, args.users, args.orders, 2 * (args.requests + args.concurrency) * (args.runs + args.retries)
+    )
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        # keep the per-request access log out of the report
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+    client = Client(base_url.rstrip("/"))
+    status, body = client.request("POST", "/auth/login", {"email": "bench0@test.com", "password": "password"})
+    if status >= 300:
+        sys.exit(f"login failed with {status}: {body[:200]!r}")
+    tokens = json.loads(body)
+    client.token = tokens["access_token"]
+
+    routes = build_routes(user_ids, own_order_ids, spare_ids, tokens["refresh_token"])
+    if args.routes:
+        selected = set(args.routes.split(","))
+        routes = [route for route in routes if route[0] in selected]
+
+    results = {
+        "meta": {
+            "date": datetime.utcnow().isoformat(),
+            "database": database_url.split(":", 1)[0],
+            "server": "external" if args.url else "werkzeug-threaded",
+            "users": args.users,
+            "orders": args.orders,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "runs": args.runs,
+        },
+        "routes": {},
+    }
+
+    print(f"{'route':<20}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'sql/req':>9}{'errors':>8}")
+    for route in routes:
+        runs = sorted(
+            (run_route(client, route, args.requests, args.concurrency) for _ in range(args.runs)),
+            key=lambda run: run["p95_ms"],
+        )
+        stats = runs[(len(runs) - 1) // 2]
+
+        # a single slow run (a noisy neighbour, a GC pause) is confirmed before it counts
+        previous = (baseline or {}).get("routes", {}).get(route[0])
+        for _ in range(args.retries):
+            if previous is None or not slower(stats, previous, args.tolerance, args.floor_ms):
+                break
+            stats = min(stats, run_route(client, route, args.requests, args.concurrency), key=lambda s: s["p95_ms"])
+
+        results["routes"][route[0]] = stats
+        print(
+            f"{route[0]:<20}{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}"
+            f"{stats['throughput_rps']:>9}{str(stats['sql_per_request']):>9}{stats['errors']:>8}"
+        )
+
+    if server is not None:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.floor_ms)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
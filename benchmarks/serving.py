@@ -0,0 +1,125 @@
+"""
+Compare gunicorn serving presets (see APP_CONFIG in api/config/config.py) on the order routes.
+
+Starts gunicorn for each preset against the same database, drives it with
+benchmarks.run --url and prints p95 latency and throughput side by side:
+
+$ python -m benchmarks.serving --database-url postgresql://localhost/pizza_bench --presets prod,prod-gthread,prod-gevent \
+    --redis-url redis://localhost:6379/0 --output benchmarks/serving-postgres.json
+
+The production presets keep revoked tokens in Redis (TOKEN_DENYLIST_BACKEND),
+so they need one to start with more than one worker.
+
+benchmarks/serving-postgres.json holds the last run, against a local Postgres
+on a 1 CPU machine that also ran the load generator. No preset came out
+ahead there: the differences are within run-to-run noise, and prod-gevent was
+slower on most routes. So prod (sync workers) stays the default, and
+prod-gthread and prod-gevent are options to measure on your own hardware and
+database, not a known improvement.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ORDER_ROUTES = [
+    "orders.create", "orders.list", "orders.get", "orders.update",
+    "orders.status", "orders.user_order", "orders.user_orders",
+]
+
+
+def wait_until_up(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url + "/metrics", timeout=1)
+            return
+        except urllib.error.HTTPError:
+            # /metrics is staff only, any HTTP answer means the server is up
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not start")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0", help="for the token denylist")
+    parser.add_argument("--presets", default="prod,prod-gevent")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers for every preset")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--output", help="write the results of every preset to this JSON file")
+    args = parser.parse_args()
+
+    database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "serving.sqlite3")
+    results = {}
+
+    for preset in args.presets.split(","):
+        print(f"running {preset}...", file=sys.stderr)
+        port = free_port()
+        env = dict(
+            os.environ,
+            APP_CONFIG=preset,
+            DATABASE_URL=database_url,
+            TOKEN_DENYLIST_REDIS_URL=args.redis_url,
+            PORT=str(port),
+            WEB_CONCURRENCY=str(args.workers),
+            RATELIMIT_ENABLED="False",
+            SQL_LOG_ENABLED="False",
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "runserver:app"],
+            env=env, stderr=subprocess.DEVNULL,
+        )
+        output = os.path.join(tempfile.mkdtemp(), f"{preset}.json")
+        try:
+            url = f"http://127.0.0.1:{port}"
+            wait_until_up(url)
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.run", "--url", url, "--database-url", database_url,
+                 "--orders", str(args.orders), "--requests", str(args.requests),
+                 "--concurrency", str(args.concurrency), "--routes", ",".join(ORDER_ROUTES),
+                 "--output", output],
+                env=env, check=True, stdout=subprocess.DEVNULL,
+            )
+        finally:
+            server.terminate()
+            server.wait()
+
+        with open(output) as file:
+            results[preset] = json.load(file)["routes"]
+
+    presets = list(results)
+    print(f"{'route':<20}" + "".join(f"{preset + ' p95':>20}{'req/s':>9}" for preset in presets))
+    for route in ORDER_ROUTES:
+        print(f"{route:<20}" + "".join(
+            f"{results[preset][route]['p95_ms']:>20}{results[preset][route]['throughput_rps']:>9}" for preset in presets
+        ))
+
+    if args.output:
+        meta = {key: getattr(args, key) for key in ("workers", "requests", "concurrency", "orders")}
+        meta["database"] = database_url.split(":", 1)[0]
+        meta["cpus"] = os.cpu_count()
+        with open(args.output, "w") as file:
+            json.dump({"meta": meta, "presets": results}, file, indent=2)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
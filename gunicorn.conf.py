@@ -0,0 +1,38 @@
+"""
+Gunicorn settings taken from the serving preset selected by APP_CONFIG.
+
+$ APP_CONFIG=prod-gevent gunicorn -c gunicorn.conf.py runserver:app
+
+The config module is loaded by path so the master process does not import
+the app (and its socket/ssl users) before gevent patches the workers.
+"""
+
+import importlib.util
+import os
+import decouple
+
+_spec = importlib.util.spec_from_file_location(
+    "_serving_config", os.path.join(os.path.dirname(os.path.abspath(__file__)), "api", "config", "config.py")
+)
+_config = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_config)
+
+preset = _config.config_dict[decouple.config("APP_CONFIG", "prod")]
+
+# (a module-level name "config" would be read as gunicorn's own setting)
+bind = f"0.0.0.0:{decouple.config('PORT', 8000)}"
+worker_class = preset.GUNICORN_WORKER_CLASS
+workers = preset.GUNICORN_WORKERS
+threads = preset.GUNICORN_THREADS
+worker_connections = preset.GUNICORN_WORKER_CONNECTIONS
+
+
+def post_worker_init(worker):
+    # make psycopg2 yield to the gevent hub while it waits on the database
+    if worker_class == "gevent":
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            worker.log.warning("psycogreen is not installed, database calls will block the gevent worker")
+        else:
+            patch_psycopg()
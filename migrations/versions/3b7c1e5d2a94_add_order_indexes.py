@@ -0,0 +1,32 @@
+"""Add order indexes
+
+Revision ID: 3b7c1e5d2a94
+Revises: 90934717cdf3
+Create Date: 2026-10-18 09:12:40.518233
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7c1e5d2a94'
+down_revision = '90934717cdf3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.create_index('ix_orders_customer_id_date_created', ['customer_id', 'date_created'], unique=False)
+        batch_op.create_index('ix_orders_status_date_created', ['status', 'date_created'], unique=False)
+        batch_op.create_index('ix_orders_date_created_id', ['date_created', 'id'], unique=False)
+        batch_op.create_index('ix_orders_open_date_created', ['date_created'], unique=False, postgresql_where=sa.text("status != 'DELIVERED'"), sqlite_where=sa.text("status != 'DELIVERED'"))
+
+
+def downgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_index('ix_orders_open_date_created')
+        batch_op.drop_index('ix_orders_date_created_id')
+        batch_op.drop_index('ix_orders_status_date_created')
+        batch_op.drop_index('ix_orders_customer_id_date_created')
@@ -0,0 +1,28 @@
+"""Add rollup dirty days
+
+Revision ID: 4f8b2d6e9a17
+Revises: e7c2a9d4b1f6
+Create Date: 2026-10-18 21:12:47.508316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f8b2d6e9a17'
+down_revision = 'e7c2a9d4b1f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rollup_dirty_days',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('rollup_dirty_days')
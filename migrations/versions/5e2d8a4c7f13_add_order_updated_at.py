@@ -0,0 +1,34 @@
+"""Add order updated_at
+
+Revision ID: 5e2d8a4c7f13
+Revises: 3b7c1e5d2a94
+Create Date: 2026-10-18 14:03:27.904112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2d8a4c7f13'
+down_revision = '3b7c1e5d2a94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    # existing orders were last changed at the latest when they were created
+    op.execute("UPDATE orders SET updated_at = COALESCE(date_created, CURRENT_TIMESTAMP)")
+
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_index('ix_orders_customer_id_updated_at', ['customer_id', 'updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_index('ix_orders_customer_id_updated_at')
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,44 @@
+"""Add order daily stats rollup
+
+Revision ID: 7a91c3e0b6d2
+Revises: 5e2d8a4c7f13
+Create Date: 2026-10-18 16:41:08.337190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a91c3e0b6d2'
+down_revision = '5e2d8a4c7f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('order_daily_stats',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('size', sa.String(length=20), nullable=False),
+    sa.Column('flavour', sa.String(), nullable=False),
+    sa.Column('orders', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'status', 'size', 'flavour')
+    )
+    op.create_table('rollup_state',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('last_updated_at', sa.DateTime(), nullable=True),
+    sa.Column('last_id', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.create_index('ix_orders_updated_at_id', ['updated_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_index('ix_orders_updated_at_id')
+
+    op.drop_table('rollup_state')
+    op.drop_table('order_daily_stats')
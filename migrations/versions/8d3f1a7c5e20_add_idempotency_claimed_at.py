@@ -0,0 +1,26 @@
+"""Add idempotency key claimed_at
+
+Revision ID: 8d3f1a7c5e20
+Revises: 4f8b2d6e9a17
+Create Date: 2026-10-18 21:40:19.662053
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3f1a7c5e20'
+down_revision = '4f8b2d6e9a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('idempotency_keys', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('claimed_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('idempotency_keys', schema=None) as batch_op:
+        batch_op.drop_column('claimed_at')
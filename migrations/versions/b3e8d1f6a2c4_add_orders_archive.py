@@ -0,0 +1,45 @@
+"""Add orders archive
+
+Revision ID: b3e8d1f6a2c4
+Revises: 9c4f2b7d1e85
+Create Date: 2026-10-18 19:05:12.417305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8d1f6a2c4'
+down_revision = '9c4f2b7d1e85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the enum types already exist for the orders table on Postgres
+    op.create_table('orders_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('size', sa.Enum('SMALL', 'MEDIUM', 'LARGE', 'EXTRA_LARGE', name='ordersizes').with_variant(
+        postgresql.ENUM(name='ordersizes', create_type=False), 'postgresql'), nullable=True),
+    sa.Column('status', sa.Enum('PENDING', 'IN_TRANSIT', 'DELIVERED', name='orderstatus').with_variant(
+        postgresql.ENUM(name='orderstatus', create_type=False), 'postgresql'), nullable=True),
+    sa.Column('flavour', sa.String(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=True),
+    sa.Column('date_created', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['customer_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('orders_archive', schema=None) as batch_op:
+        batch_op.create_index('ix_orders_archive_customer_id_date_created', ['customer_id', 'date_created'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('orders_archive', schema=None) as batch_op:
+        batch_op.drop_index('ix_orders_archive_customer_id_date_created')
+
+    op.drop_table('orders_archive')
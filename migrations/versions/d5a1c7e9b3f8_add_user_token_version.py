@@ -0,0 +1,26 @@
+"""Add user token version
+
+Revision ID: d5a1c7e9b3f8
+Revises: b3e8d1f6a2c4
+Create Date: 2026-10-18 19:48:30.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a1c7e9b3f8'
+down_revision = 'b3e8d1f6a2c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('token_version')
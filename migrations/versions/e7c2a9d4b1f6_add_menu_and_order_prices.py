@@ -0,0 +1,63 @@
+"""Add menu and order prices
+
+Revision ID: e7c2a9d4b1f6
+Revises: d5a1c7e9b3f8
+Create Date: 2026-10-18 20:31:44.215907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c2a9d4b1f6'
+down_revision = 'd5a1c7e9b3f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('flavours',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('is_available', sa.Boolean(), nullable=False),
+    sa.Column('date_created', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    # the enum type already exists for the orders table on Postgres
+    op.create_table('size_prices',
+    sa.Column('flavour_id', sa.Integer(), nullable=False),
+    sa.Column('size', sa.Enum('SMALL', 'MEDIUM', 'LARGE', 'EXTRA_LARGE', name='ordersizes').with_variant(
+        postgresql.ENUM(name='ordersizes', create_type=False), 'postgresql'), nullable=False),
+    sa.Column('price', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['flavour_id'], ['flavours.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('flavour_id', 'size')
+    )
+    op.create_table('menu_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    for table in ('orders', 'orders_archive'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('unit_price', sa.Numeric(precision=10, scale=2), nullable=True))
+            batch_op.add_column(sa.Column('total_price', sa.Numeric(precision=10, scale=2), nullable=True))
+
+    with op.batch_alter_table('order_daily_stats', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('revenue', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('order_daily_stats', schema=None) as batch_op:
+        batch_op.drop_column('revenue')
+
+    for table in ('orders_archive', 'orders'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('total_price')
+            batch_op.drop_column('unit_price')
+
+    op.drop_table('menu_version')
+    op.drop_table('size_prices')
+    op.drop_table('flavours')
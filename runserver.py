@@ -1,7 +1,9 @@
+from decouple import config
 from api import create_app
 from api.config.config import config_dict
 
-app = create_app(config=config_dict["prod"])
+# APP_CONFIG picks the preset, e.g. prod, prod-gthread or prod-gevent (see gunicorn.conf.py)
+app = create_app(config=config_dict[config("APP_CONFIG", "prod")])
 
 if __name__ == "__main__":
     app.run()